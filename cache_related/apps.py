@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+
+
+class CacheRelatedConfig(AppConfig):
+    name = 'cache_related'
+
+    def ready(self):
+        from .shared import clear_settings_tier, invalidate_shared_models
+
+        post_save.connect(invalidate_shared_models, dispatch_uid='cache_related_shared_post_save')
+        post_delete.connect(invalidate_shared_models, dispatch_uid='cache_related_shared_post_delete')
+        setting_changed.connect(clear_settings_tier, dispatch_uid='cache_related_shared_setting_changed')
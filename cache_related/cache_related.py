@@ -1,4 +1,11 @@
-from django.db.models import Model, Field
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import Model, Field, Q, QuerySet
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.module_loading import import_string
 from django.db.models.fields.related import (
     ForeignKey,
     ManyToManyField,
@@ -7,10 +14,102 @@ from django.db.models.fields.related import (
     OneToOneField,
     OneToOneRel,
 )
-from zen_queries import QueriesDisabledError
-from typing import Any, Union
+from zen_queries import queries_dangerously_enabled
+from asgiref.sync import sync_to_async
+from collections import ChainMap, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar, Token
+from functools import lru_cache
+from itertools import count, groupby, islice
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Container, Iterable, Iterator, Mapping, MutableMapping, Optional, Union
 from uuid import UUID
-from source_documents_app.export_to_excel.excel_table import set_attribute_by_accessor
+from .columnar import ColumnarIndex, ColumnarModelStore
+from .edges import EdgeIndex
+from .eviction import EvictionPolicy
+from .plan import LoadPlan
+from .shared import SharedTier, get_settings_tier
+from .snapshot import SnapshotError, get_row_values, get_snapshot_model, read_snapshot, write_snapshot
+from .stats import CacheStats, get_instance_size, get_model_size
+import asyncio
+import re
+
+
+RELATIONSHIP_FIELD_CLASSES = (
+    ForeignKey,
+    ManyToOneRel,
+    OneToOneField,
+    OneToOneRel,
+    ManyToManyField,
+    ManyToManyRel,
+)
+
+# how many instances are linked between yields to the event loop
+# by the async API:
+LINK_BATCH_SIZE = 1000
+
+# how many instances are read at a time when streaming them from an
+# iterable (the default of `QuerySet.iterator()`):
+STREAM_CHUNK_SIZE = 2000
+
+# orders in which related objects are visited when adding to the cache:
+DEPTH_FIRST = 'dfs'
+BREADTH_FIRST = 'bfs'
+
+# how cached rows are held:
+INSTANCE_STORAGE = 'instances'
+COLUMNAR_STORAGE = 'columnar'
+
+# what happens when a relationship isn't in the cache:
+FALLBACK_MISSES = 'fallback'
+BATCH_MISSES = 'batch'
+
+# stands in for the old value of a column that changed when it isn't known:
+UNKNOWN_KEY = object()
+
+# matches each step of an accessor such as `._prefetched_objects_cache[bravos]`,
+# capturing either an attribute name or a dict key:
+ACCESSOR_STEP = re.compile(r'\.(\w+)|\[([^\]]+)\]')
+
+
+def set_attribute_by_accessor(obj: Any, accessor: str, value: Any):
+    '''
+    Set `value` on `obj` at the location described by `accessor`,
+    e.g. `.alpha` or `._prefetched_objects_cache[bravos]`,
+    creating any missing intermediate dicts along the way
+    '''
+
+    steps = ACCESSOR_STEP.findall(accessor)
+
+    for attribute, key in steps[:-1]:
+        if attribute:
+            if getattr(obj, attribute, None) is None:
+                setattr(obj, attribute, {})
+            obj = getattr(obj, attribute)
+        else:
+            obj = obj.setdefault(key, {})
+
+    attribute, key = steps[-1]
+    if attribute:
+        setattr(obj, attribute, value)
+    else:
+        obj[key] = value
+
+
+def get_attribute_by_accessor(obj: Any, accessor: str, default: Any = None) -> Any:
+    '''
+    Get the value on `obj` at the location described by `accessor`,
+    or `default` if any step along the way is missing
+    '''
+
+    for attribute, key in ACCESSOR_STEP.findall(accessor):
+        try:
+            obj = getattr(obj, attribute) if attribute else obj[key]
+        except (AttributeError, KeyError, TypeError):
+            return default
+
+    return obj
 
 
 class CachedObjectDoesNotExist(Exception):
@@ -21,44 +120,174 @@ class ObjectAlreadyCached(Exception):
     pass
 
 
+def iter_instance_chunks(
+    objects: Iterable[Union[Model, Iterable[Model]]],
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[list[Model]]:
+    '''
+    The instances in `objects` (each an instance, or an iterable of them),
+    in lists of up to `chunk_size`. Querysets that haven't been evaluated
+    are read through `QuerySet.iterator()`, so their rows aren't also kept
+    in their result cache.
+    '''
+
+    def iter_instances() -> Iterator[Model]:
+        for o in objects:
+            if isinstance(o, Model):
+                yield o
+
+            elif isinstance(o, QuerySet) and o._result_cache is None:
+                yield from o.iterator(chunk_size=chunk_size)
+
+            else:
+                yield from o
+
+    instances = iter_instances()
+    while chunk := list(islice(instances, chunk_size)):
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def get_model_key(model: type[Model]) -> str:
+    '''
+    The key under which instances of `model` are cached: the label of its
+    concrete model (e.g. `'core.Alpha'`), so instances of a proxy model
+    share the cache of the model it proxies, and models of the same name
+    in different apps don't collide
+    '''
+
+    return model._meta.concrete_model._meta.label
+
+
+def resolve_model_key(model: Union[str, type[Model]]) -> str:
+    '''
+    The cache key of a model given as a class or a label (`'core.Alpha'`)
+    '''
+
+    return get_model_key(apps.get_model(model) if isinstance(model, str) else model)
+
+
+def get_key(instance: Any, attname: Union[str, tuple[str, ...]]) -> Any:
+    '''
+    The value of `attname` on `instance`, or for a composite key (a tuple
+    of attnames, such as a generic foreign key's content type and object id),
+    the tuple of their values, which is `None` if any of them is
+    '''
+
+    if isinstance(attname, tuple):
+        key = tuple(getattr(instance, a) for a in attname)
+        return None if None in key else key
+
+    return getattr(instance, attname)
+
+
 class RelationshipTracker:
+    '''
+    A compiled, immutable description of one relationship of `model`.
+
+    Everything needed to traverse and link the relationship is resolved
+    from `field` once, when the tracker is built, so that linking an
+    instance only reads attributes.
+
+    Generic relationships (see `generic.py`) are `generic`, and are
+    matched on composite keys.
+    '''
+
+    __slots__ = (
+        'field',
+        'model',
+        'model_key',
+        'related_model',
+        'related_model_key',
+        'accessor',
+        'field_to_cache_on',
+        'field_to_match',
+        'remote_field_to_match',
+        'cardinality',
+        'many',
+        'generic',
+        '_hash',
+    )
+
     def __init__(self, field: Field):
-        self.field = field
+        initialize = super().__setattr__
+
+        initialize('field', field)
+        initialize('model', field.model)
+        initialize('model_key', get_model_key(field.model))
+        initialize('related_model', field.related_model)
+        initialize('related_model_key', get_model_key(field.related_model))
+        initialize('accessor', self._resolve_accessor(field))
+        initialize('field_to_cache_on', self._resolve_field_to_cache_on(field))
+        initialize('field_to_match', self._resolve_field_to_match(field))
+        initialize('remote_field_to_match', self._resolve_remote_field_to_match(field))
+        initialize('cardinality', self._resolve_cardinality(field))
+        initialize('many', field.one_to_many or field.many_to_many)
+        initialize('generic', False)
+        initialize(
+            '_hash',
+            hash(
+                (
+                    self.model,
+                    self.field_to_cache_on,
+                    self.field_to_match,
+                    self.related_model,
+                    self.remote_field_to_match,
+                )
+            ),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    @staticmethod
+    def _resolve_accessor(field: Field) -> str:
+        '''
+        The attribute used to read the related object(s) from an instance
+        '''
+
+        if field.__class__ in (ManyToOneRel, OneToOneRel, ManyToManyRel):
+            return field.get_accessor_name()
+
+        return field.name
 
-    @property
-    def model(self) -> Model:
-        return self.field.model
+    @staticmethod
+    def _resolve_cardinality(field: Field) -> str:
+        for cardinality in ('many_to_one', 'one_to_one', 'one_to_many', 'many_to_many'):
+            if getattr(field, cardinality):
+                return cardinality
 
-    @property
-    def field_to_cache_on(self) -> str:
+    @staticmethod
+    def _resolve_field_to_cache_on(field: Field) -> str:
 
-        if self.field.__class__ == ForeignKey:
-            return f'.{self.field.name}'
+        if field.__class__ == ForeignKey:
+            return f'.{field.name}'
 
-        elif self.field.__class__ == ManyToOneRel:
-            return f'._prefetched_objects_cache[{self.field.get_accessor_name()}]'
+        elif field.__class__ == ManyToOneRel:
+            return f'._prefetched_objects_cache[{field.get_accessor_name()}]'
 
-        elif self.field.__class__ == OneToOneField:
-            return f'.{self.field.name}'
+        elif field.__class__ == OneToOneField:
+            return f'.{field.name}'
 
-        elif self.field.__class__ == OneToOneRel:
-            return f'.{self.field.name}'
+        elif field.__class__ == OneToOneRel:
+            return f'.{field.name}'
 
-        elif self.field.__class__ == ManyToManyField:
-            return f'.{self.field.name}'
+        # the keys the related managers read prefetched objects from:
+        elif field.__class__ == ManyToManyField:
+            return f'._prefetched_objects_cache[{field.name}]'
 
-        elif self.field.__class__ == ManyToManyRel:
-            return f'.{self.field.name}'
+        elif field.__class__ == ManyToManyRel:
+            return f'._prefetched_objects_cache[{field.field.related_query_name()}]'
 
-    @property
-    def field_to_match(self) -> str:
+    @staticmethod
+    def _resolve_field_to_match(field: Field) -> str:
 
-        if self.field.__class__ == ForeignKey:
-            return self.field.attname
+        if field.__class__ == ForeignKey:
+            return field.attname
 
-        elif self.field.__class__ == ManyToOneRel:
+        elif field.__class__ == ManyToOneRel:
             # doesn't work:
-            # return self.field.field_name
+            # return field.field_name
 
             # works for:
             # Proposal.phases,
@@ -80,46 +309,45 @@ class RelationshipTracker:
 
             # but not for:
             # BusinessUnit.attritionratesprocedure_set,
-            # return self.field.target_field.attname
+            # return field.target_field.attname
 
-            # works:
-            return self.field.field.remote_field.field_name
+            # works, but is the name rather than the attname of the field
+            # pointed to, which differs when it's a multi-table inheritance
+            # child's parent link (`sourcedocument_ptr`):
+            # return field.field.remote_field.field_name
 
-        elif self.field.__class__ == OneToOneField:
-            return self.field.attname
+            return field.field.target_field.attname
 
-        elif self.field.__class__ == OneToOneRel:
-            return self.field.field_name
+        elif field.__class__ == OneToOneField:
+            return field.attname
 
-        elif self.field.__class__ == ManyToManyField:
-            # since 'id' is the name of the PK in both cases,
-            # I can't deduce whether it's referring to model.id or related_model.id
-            # need to set up a scenario where the PK fields have different names in
-            # order to be certain
-            return self.field.target_field.attname
+        elif field.__class__ == OneToOneRel:
+            return field.field.target_field.attname
 
-        elif self.field.__class__ == ManyToManyRel:
-            return self.field.target_field.attname
+        # many-to-many relationships are matched through the rows of their
+        # through table (see `EdgeIndex`), on the fields its foreign keys
+        # point to:
+        elif field.__class__ == ManyToManyField:
+            return field.remote_field.through._meta.get_field(field.m2m_field_name()).target_field.attname
 
-    @property
-    def related_model(self) -> Model:
-        return self.field.related_model
+        elif field.__class__ == ManyToManyRel:
+            return field.through._meta.get_field(field.field.m2m_reverse_field_name()).target_field.attname
 
-    @property
-    def remote_field_to_match(self) -> str:
+    @staticmethod
+    def _resolve_remote_field_to_match(field: Field) -> str:
 
-        if self.field.__class__ == ForeignKey:
+        if field.__class__ == ForeignKey:
             # not right:
             # Proposal.escalation_rates_procedure_id == EscalationRatesProcedure.escalation_rates_procedure_id
-            # return self.field.attname
+            # return field.attname
 
             # should be:
             # Proposal.escalation_rates_procedure_id == EscalationRatesProcedure.sourcedocument_ptr
-            return self.field.target_field.attname
+            return field.target_field.attname
 
-        elif self.field.__class__ == ManyToOneRel:
+        elif field.__class__ == ManyToOneRel:
             # doesn't work:
-            # return self.field.field_name
+            # return field.field_name
 
             # works for:
             # Proposal.revisions,
@@ -135,73 +363,111 @@ class RelationshipTracker:
             # Phase.acquisition_groups,
             # ProposalType.proposal_set,
             # MissionClass.proposal_set,
-            return self.field.remote_field.attname
+            return field.remote_field.attname
 
-        elif self.field.__class__ == OneToOneField:
-            return self.field.remote_field.field_name
-            # return self.field.attname
+        elif field.__class__ == OneToOneField:
+            return field.target_field.attname
+            # return field.attname
 
-        elif self.field.__class__ == OneToOneRel:
-            return self.field.field_name
+        elif field.__class__ == OneToOneRel:
+            # not right, matches the pk of both models:
+            # return field.field_name
 
-        elif self.field.__class__ == ManyToManyField:
-            # since 'id' is the name of the PK in both cases,
-            # I can't deduce whether it's referring to model.id or related_model.id
-            # need to set up a scenario where the PK fields have different names in
-            # order to be certain
-            return self.field.target_field.attname
+            # should be, like ManyToOneRel:
+            # Alpha.id == Delta.alpha_id
+            return field.remote_field.attname
 
-        elif self.field.__class__ == ManyToManyRel:
-            return self.field.target_field.attname
+        elif field.__class__ == ManyToManyField:
+            return field.remote_field.through._meta.get_field(field.m2m_reverse_field_name()).target_field.attname
 
-    def cache_related_data(self, instance: Model, cache: dict[str, dict[Any, Model]]):
+        elif field.__class__ == ManyToManyRel:
+            return field.through._meta.get_field(field.field.m2m_field_name()).target_field.attname
+
+    def cache_related_data(
+        self,
+        instance: Model,
+        index: Mapping[Any, list[Model]],
+        incomplete_keys: Container = (),
+    ) -> bool:
         '''
         Given an instance of type `self.model`,
-        find related data in the cache
-        where `self.field` matches `self.remote_field_to_match`
+        find related data in `index` (the cached instances of
+        `self.related_model`, grouped by `self.remote_field_to_match`)
+        where `self.field_to_match` matches `self.remote_field_to_match`.
+        To-many data isn't cached for `incomplete_keys`, whose related
+        instances aren't all in `index`.
+
+        Returns `False` if none was found, in which case reading the
+        relationship still falls through to the database.
         '''
 
-        related_model_instances = cache\
-            .get(self.related_model.__name__, {})\
-            .values()
+        key = getattr(instance, self.field_to_match)
+        if key is None:
+            return True
 
-        value = filter(
-            lambda o: (
-                getattr(instance, self.field_to_match)
-                == getattr(o, self.remote_field_to_match)
-            ),
-            related_model_instances,
-        )
+        if self.many and key in incomplete_keys:
+            return False
+
+        related_instances = index.get(key, ())
 
-        if self.field.many_to_many:
-            value = list(value)
+        if self.many:
+            value = list(related_instances)
 
-        elif self.field.one_to_many:
-            value = list(value)
+        else:
+            value = related_instances[0] if related_instances else None
 
-        elif self.field.one_to_one:
-            value = next(value, None)
+        if not value:
+            return False
 
-        elif self.field.many_to_one:
-            value = next(value, None)
+        set_attribute_by_accessor(
+            instance,
+            self.field_to_cache_on,
+            value,
+        )
+
+        return True
+
+    def add_related_data(self, instance: Model, related_instance: Model, replace: bool = True):
+        '''
+        Given an instance of type `self.model` that has already been linked,
+        add a newly cached `related_instance` to its related data,
+        appending to (rather than rebuilding) to-many lists.
+
+        If `replace`, a copy of `related_instance` already in a to-many list
+        is replaced by it. Newly cached rows can't be in any list yet
+        (copies of cached rows are merged into them instead of being cached
+        again), so linking them just appends, without scanning the list.
+        '''
 
-        if value:
+        if not self.many:
             set_attribute_by_accessor(
                 instance,
                 self.field_to_cache_on,
-                value,
+                related_instance,
             )
+            return
 
-    def __hash__(self):
-        return hash(
-            (
-                self.model,
+        value: Optional[list] = get_attribute_by_accessor(instance, self.field_to_cache_on)
+
+        if value is None:
+            set_attribute_by_accessor(
+                instance,
                 self.field_to_cache_on,
-                self.field_to_match,
-                self.related_model,
-                self.remote_field_to_match,
+                [related_instance],
             )
-        )
+            return
+
+        # a newer copy of an object already in the list replaces it:
+        if replace:
+            for i, o in enumerate(value):
+                if o.pk == related_instance.pk:
+                    value[i] = related_instance
+                    return
+
+        value.append(related_instance)
+
+    def __hash__(self):
+        return self._hash
 
     def __eq__(self, __o):
         return hash(self) == hash(__o)
@@ -210,113 +476,3230 @@ class RelationshipTracker:
         return f'{self.model.__name__}{self.field_to_cache_on} = {self.related_model.__name__} WHERE ({self.model.__name__}.{self.field_to_match} == {self.related_model.__name__}.{self.remote_field_to_match})'
 
 
+@lru_cache(maxsize=None)
+def get_relationship_plan(model: type[Model]) -> tuple[RelationshipTracker, ...]:
+    '''
+    The compiled relationships of `model`, built once per model class.
+    Relationship fields that cannot be linked are left out.
+
+    Generic foreign keys and generic relations are included when
+    `django.contrib.contenttypes` is installed.
+    '''
+
+    trackers = [
+        RelationshipTracker(field=f)
+        for f in model._meta.get_fields()
+        if f.is_relation
+        and f.related_model is not None
+        and f.__class__ in RELATIONSHIP_FIELD_CLASSES
+    ]
+
+    if apps.is_installed('django.contrib.contenttypes'):
+        from .generic import get_generic_relationships
+        trackers.extend(get_generic_relationships(model))
+
+    return tuple(trackers)
+
+
+@lru_cache(maxsize=None)
+def get_traversed_relationships(model: type[Model]) -> tuple[RelationshipTracker, ...]:
+    '''
+    The relationships of `model` that `load_graph` follows: all of them but
+    the foreign keys to the content types of its generic foreign keys, which
+    are looked up from Django's content type cache instead (and would lead
+    on to every model with a foreign key to `ContentType`)
+    '''
+
+    plan = get_relationship_plan(model)
+    content_type_attnames = {r.field_to_match[0] for r in plan if r.generic and not r.many}
+
+    return tuple(
+        r
+        for r in plan
+        if r.generic or r.field_to_match not in content_type_attnames
+    )
+
+
+@lru_cache(maxsize=None)
+def get_key_field_names(model: type[Model]) -> tuple[str, ...]:
+    '''
+    The columns of `model` that its relationships are matched on: its pk
+    (and those of its multi-table inheritance parents), the columns of its
+    foreign keys (both columns of generic foreign keys), and the fields
+    that foreign keys of related models point to
+    '''
+
+    names = [model._meta.pk.attname]
+
+    for parent in model._meta.get_parent_list():
+        if parent._meta.pk.attname not in names:
+            names.append(parent._meta.pk.attname)
+
+    for r in get_relationship_plan(model):
+        for attname in r.field_to_match if isinstance(r.field_to_match, tuple) else (r.field_to_match,):
+            if attname not in names:
+                names.append(attname)
+
+    return tuple(names)
+
+
+@lru_cache(maxsize=None)
+def get_proxy_models(model: type[Model]) -> tuple[type[Model], ...]:
+    '''
+    The proxy models of the concrete `model`, which have descriptors of
+    their own for some relationships (e.g. generic relations)
+    '''
+
+    return tuple(
+        m
+        for m in apps.get_models()
+        if m._meta.proxy and m._meta.concrete_model is model
+    )
+
+
+@lru_cache(maxsize=None)
+def get_reverse_relationship(relationship: RelationshipTracker) -> Optional[RelationshipTracker]:
+    '''
+    The same relationship, seen from the related model
+    (e.g. `Alpha.bravos` for `Bravo.alpha`)
+
+    Generic relationships have none, since a generic foreign key can
+    point to any model: the cache keeps both sides of them in step itself.
+    '''
+
+    if relationship.generic:
+        return None
+
+    for r in get_relationship_plan(relationship.related_model):
+        if r.field is relationship.field.remote_field:
+            return r
+
+    return None
+
+
+# the cache used by the current thread or asyncio task:
+current_cache: ContextVar[Optional['RelatedObjectsCache']] = ContextVar(
+    'current_related_objects_cache',
+    default=None,
+)
+
+# the original descriptors replaced by `CachedRelationDescriptor` and
+# `CachedDeferredAttribute`, keyed by (model, attribute), with the number
+# of active caches relying on each:
+patched_descriptors: dict[tuple[type[Model], str], list] = {}
+patched_descriptors_lock = Lock()
+
+
+class CachedRelationDescriptor:
+    '''
+    Stands in for the descriptor of a relationship while a lazy
+    `RelatedObjectsCache` (or one that batches misses) is active. The first time the relationship is
+    read from an instance, the related object(s) are looked up in the
+    current cache and memoized on the instance, then the original
+    descriptor returns them as usual.
+
+    Threads and tasks without a current cache get the original behaviour.
+    '''
+
+    def __init__(self, descriptor: Any, relationship: 'RelationshipTracker'):
+        self.descriptor = descriptor
+        self.relationship = relationship
+
+    def __get__(self, instance: Optional[Model], owner: Optional[type] = None):
+        if instance is not None:
+            cache = current_cache.get()
+            if cache is not None:
+                cache._resolve(instance, self.relationship)
+
+        return self.descriptor.__get__(instance, owner)
+
+    def __set__(self, instance: Model, value: Any):
+        self.descriptor.__set__(instance, value)
+
+    def __getattr__(self, name: str):
+        return getattr(self.descriptor, name)
+
+
+class CachedDeferredAttribute:
+    '''
+    Stands in for the descriptor of a field while a `RelatedObjectsCache`
+    is active. Reading the field from a cached instance it was deferred on
+    loads it for every cached instance of the model still missing it, with
+    one batched query instead of one query per instance.
+
+    Since it only defines `__get__`, loaded values are still read straight
+    from the instance's `__dict__`, without going through it.
+    '''
+
+    def __init__(self, descriptor: DeferredAttribute, attname: str):
+        self.descriptor = descriptor
+        self.attname = attname
+
+    def __get__(self, instance: Optional[Model], owner: Optional[type] = None):
+        if instance is not None and self.attname not in instance.__dict__:
+            cache = current_cache.get()
+            if cache is not None:
+                cache._load_deferred(instance, self.attname)
+
+        return self.descriptor.__get__(instance, owner)
+
+    def __getattr__(self, name: str):
+        return getattr(self.descriptor, name)
+
+
+# every active cache is kept current, not just the innermost one
+# (see `RelatedObjectsCache.enclosing`):
+def cache_saved_instance(sender: type[Model], instance: Model, **kwargs):
+    cache = current_cache.get()
+    while cache is not None:
+        cache._on_save(instance)
+        cache = cache.enclosing
+
+
+def uncache_deleted_instance(sender: type[Model], instance: Model, **kwargs):
+    cache = current_cache.get()
+    while cache is not None:
+        cache._on_delete(instance)
+        cache = cache.enclosing
+
+
+def uncache_changed_m2m(sender: type[Model], instance: Model, action: str, pk_set: Optional[set], **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    cache = current_cache.get()
+    while cache is not None:
+        cache._on_m2m_changed(instance, sender, pk_set)
+        cache = cache.enclosing
+
+
+# the signal receivers are connected while any cache is active:
+active_caches_count = 0
+active_caches_lock = Lock()
+
+
+def connect_signal_receivers():
+    global active_caches_count
+
+    with active_caches_lock:
+        if not active_caches_count:
+            post_save.connect(cache_saved_instance, weak=False, dispatch_uid='cache_related_post_save')
+            post_delete.connect(uncache_deleted_instance, weak=False, dispatch_uid='cache_related_post_delete')
+            m2m_changed.connect(uncache_changed_m2m, weak=False, dispatch_uid='cache_related_m2m_changed')
+
+        active_caches_count += 1
+
+
+def disconnect_signal_receivers():
+    global active_caches_count
+
+    with active_caches_lock:
+        active_caches_count -= 1
+
+        if not active_caches_count:
+            post_save.disconnect(dispatch_uid='cache_related_post_save')
+            post_delete.disconnect(dispatch_uid='cache_related_post_delete')
+            m2m_changed.disconnect(dispatch_uid='cache_related_m2m_changed')
+
+
+class GraphLoad:
+    '''
+    The state of one `load_graph` / `aload_graph` call, which follows the
+    relationship plans from the root model one level at a time.
+
+    `next_lookups` collects the keys to fetch for each related model on the
+    next level, and the fetched rows are handed back through `add_fetched`,
+    so the same walk drives both the sync and the async loader.
+    '''
+
+    def __init__(
+        self,
+        cache: 'RelatedObjectsCache',
+        queryset: QuerySet,
+        depth: Optional[int] = None,
+        include: Optional[Iterable[Union[str, type[Model]]]] = None,
+        chunk_size: Optional[int] = None,
+        fields: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+    ):
+        self.cache = cache
+        self.model = queryset.model
+        self.db = queryset.db
+        self.depth = depth
+
+        self.include = None
+        if include is not None:
+            self.include = {
+                resolve_model_key(m)
+                for m in include
+            }
+
+        self.chunk_size = chunk_size
+        if chunk_size is None:
+            self.chunk_size = connections[self.db].features.max_query_params
+
+        self.plan = cache.load_plan
+
+        # the fields needed besides the key columns, for each model:
+        if fields is None and self.plan is not None:
+            fields = self.plan.fields
+
+        # while recording, every field but the key columns is deferred,
+        # so the first read of each one is seen:
+        elif fields is None and cache.recorded_plan is not None:
+            fields = {}
+
+        self.fields = None
+        if fields is not None:
+            self.fields = {
+                resolve_model_key(m): tuple(names)
+                for m, names in fields.items()
+            }
+
+        # the fields the root queryset was restricted to, if it was:
+        self.root_only: Optional[list[str]] = None
+
+        # keys already requested for each column of each model, so no row
+        # is asked for twice:
+        self.requested: dict[tuple[str, str], set] = {}
+
+        # instances of complete models already reached, keyed by `id()`:
+        self.reached: dict[int, Model] = {}
+
+        # the rows added by the last level: instances, or with columnar
+        # storage, the positions of the rows in the model's store
+        self.frontier: dict[type[Model], Union[list[Model], range]] = {}
+        self.level = 0
+
+        # the roots only need to be traversed if they have
+        # selected/prefetched related objects of their own:
+        self.traverse_roots = bool(queryset.query.select_related or queryset._prefetch_related_lookups)
+
+    def add_roots(self, roots: list[Model]) -> list[Model]:
+        '''
+        Cache (a chunk of) the instances in the queryset. Returns the
+        cached instances for them, which differ from `roots` for rows
+        that were already cached.
+        '''
+
+        # with columnar storage, the root model's store only has columns
+        # for the fields that were fetched:
+        if self.root_only is not None and self.cache.storage == COLUMNAR_STORAGE:
+            self.cache._get_model_cache(self.model, self.db, self.root_only)
+
+        if self.traverse_roots:
+            visited: dict[int, Model] = {}
+            roots = [self.cache._add_object_to_cache(root, visited) for root in roots]
+
+        else:
+            for root in roots:
+                self.cache._store_instance(root)
+
+            # (a root evicted as soon as it was stored is kept as is)
+            roots = [self.cache._get_cached_instance(root) or root for root in roots]
+
+        # (a proxy's rows are linked through its concrete model's relationships)
+        if roots:
+            self.extend_frontier(self.model._meta.concrete_model, list(roots))
+
+        return roots
+
+    def get_cached_roots(self, roots: list[Model]) -> list[Model]:
+        '''
+        The instances cached for `roots` once the walk is done: a root of a
+        multi-table inheritance parent is replaced by its child's instance
+        if the child was cached after it (see `_share_with_parents`)
+        '''
+
+        return [self.cache._get_cached_instance(root) or root for root in roots]
+
+    def restart(self):
+        '''
+        Start a new walk, from the next chunk of roots. The keys already
+        requested are kept, since their rows are still cached.
+        '''
+
+        self.frontier = {}
+        self.level = 0
+
+    def has_next_level(self) -> bool:
+        return bool(self.frontier) and (self.depth is None or self.level < self.depth)
+
+    def next_lookups(self) -> dict[type[Model], dict[str, set]]:
+        '''
+        The keys to fetch for each column of each related model on the next level.
+
+        Rows of complete models are found in the cache's indexes instead,
+        and go straight into the next level.
+        '''
+
+        cache = self.cache
+
+        # collect the keys to fetch for each column of each related model:
+        lookups: dict[type[Model], dict[str, set]] = {}
+
+        for model, rows in self.frontier.items():
+            for r in get_traversed_relationships(model):
+
+                # many-to-many relationships are matched through their
+                # through table, which isn't loaded here:
+                if r.cardinality == 'many_to_many':
+                    continue
+
+                if self.plan is not None and not self.plan.follows(r.model, r.accessor):
+                    continue
+
+                for target_model, attname, keys in self.get_keys(r, model, rows):
+                    # (a proxy's rows are fetched along with its concrete model's,
+                    # whose cache it shares)
+                    related_model = target_model._meta.concrete_model
+                    related_model_key = get_model_key(related_model)
+                    if self.include is not None and related_model_key not in self.include:
+                        continue
+
+                    keys -= self.requested.setdefault((related_model_key, attname), set())
+
+                    # every related object with these keys is fetched on this level
+                    # (or already cached), so rows without any have none (those
+                    # requested before may have been evicted since):
+                    cache.missing_keys_loaded.setdefault(r, set()).update(
+                        self.get_loaded_keys(r, target_model, keys)
+                    )
+
+                    # rows already cached don't need to be fetched by pk again
+                    # (except from complete models, which aren't fetched at all):
+                    if (
+                        attname == related_model._meta.pk.attname
+                        and related_model_key not in cache.complete_models
+                    ):
+                        keys -= cache.cache.get(related_model_key, {}).keys()
+
+                    if keys:
+                        lookups\
+                            .setdefault(related_model, {})\
+                            .setdefault(attname, set())\
+                            .update(keys)
+
+        for related_model, columns in lookups.items():
+            for attname, keys in columns.items():
+                self.requested[(get_model_key(related_model), attname)].update(keys)
+
+        self.frontier = {}
+        self.level += 1
+
+        # every row of a complete model is already cached, so the
+        # next level is found in its indexes instead:
+        for related_model in list(lookups):
+            model_key = get_model_key(related_model)
+            if model_key not in cache.complete_models:
+                continue
+
+            new_instances = []
+            for attname, keys in lookups.pop(related_model).items():
+                index = cache._get_index(model_key, attname)
+                for key in keys:
+                    for instance in index.get(key, ()):
+                        if id(instance) not in self.reached:
+                            self.reached[id(instance)] = instance
+                            new_instances.append(instance)
+
+            if new_instances:
+                self.frontier[related_model] = new_instances
+
+        # multi-table inheritance children are fetched before their parents,
+        # whose rows they hold (see `get_uncached`):
+        return dict(sorted(lookups.items(), key=lambda item: -len(item[0]._meta.get_parent_list())))
+
+    def get_uncached(self, model: type[Model], columns: dict[str, set]) -> dict[str, set]:
+        '''
+        `columns`, without the pks of rows cached since they were collected
+        by `next_lookups`: the parents' rows of the children fetched before
+        '''
+
+        model_cache = self.cache.cache.get(get_model_key(model))
+        pk_attname = model._meta.pk.attname
+        if model_cache is None or pk_attname not in columns:
+            return columns
+
+        columns = {**columns, pk_attname: columns[pk_attname] - model_cache.keys()}
+        return {attname: keys for attname, keys in columns.items() if keys}
+
+    def get_keys(
+        self,
+        r: RelationshipTracker,
+        model: type[Model],
+        rows: Union[list[Model], range],
+    ) -> Iterator[tuple[type[Model], Union[str, tuple[str, ...]], set]]:
+        '''
+        The keys to fetch for `r` from `rows`, as (related model, column,
+        keys). A generic foreign key's are grouped by content type, as the
+        pks of each model it points to, and a generic relation's are the
+        composite keys of the objects pointing to the rows.
+        '''
+
+        if isinstance(rows, range):
+            keys = self.cache.cache[get_model_key(model)].keys(r.field_to_match, rows)
+        else:
+            keys = {get_key(i, r.field_to_match) for i in rows}
+            keys.discard(None)
+
+        if not r.generic:
+            yield r.related_model, r.remote_field_to_match, keys
+
+        elif r.many:
+            yield r.related_model, r.remote_field_to_match, {r.get_object_key(model, pk, self.db) for pk in keys}
+
+        else:
+            for related_model, pks in r.group_keys(keys, self.db).items():
+                yield related_model, related_model._meta.pk.attname, pks
+
+    def get_loaded_keys(self, r: RelationshipTracker, target_model: type[Model], keys: set) -> set:
+        '''
+        The keys of `r` that fetching `keys` (see `get_keys`) loads every
+        related object of: a generic foreign key's are its composite keys
+        pointing to `target_model`, the others' are `keys` themselves
+        '''
+
+        if not r.generic or r.many:
+            return keys
+
+        content_type_id = r.get_content_type_id(target_model, self.db)
+        return {(content_type_id, r.object_id_field.to_python(pk)) for pk in keys}
+
+    def get_root_queryset(self, queryset: QuerySet) -> QuerySet:
+        '''
+        `queryset`, restricted to the fields needed from the root model,
+        unless it already defers fields or selects related objects
+        (whose fields would have to be listed too)
+        '''
+
+        only = self.get_only(self.model)
+        if only is None or queryset.query.select_related or queryset.query.deferred_loading != (frozenset(), True):
+            return queryset
+
+        self.root_only = only
+        return queryset.only(*only)
+
+    def get_only(self, model: type[Model]) -> Optional[list[str]]:
+        '''
+        The fields to fetch for `model`, if `fields` was given: its key
+        columns, and the fields listed for it. The others are deferred.
+        '''
+
+        if self.fields is None:
+            return None
+
+        names = list(get_key_field_names(model))
+        for name in self.fields.get(get_model_key(model), ()):
+            if name not in names:
+                names.append(name)
+
+        return names
+
+    def get_values(self, model: type[Model]) -> Optional[list[str]]:
+        '''
+        The fields to fetch rows of, for models kept in column stores,
+        which take the rows as values without building instances
+        '''
+
+        if self.cache.storage != COLUMNAR_STORAGE:
+            return None
+
+        return self.cache._get_model_cache(model, self.db, self.get_only(model)).field_names
+
+    def add_fetched(self, model: type[Model], fetched: list):
+        '''
+        Cache the rows fetched for `model`, keeping the ones not
+        already cached as part of the next level
+        '''
+
+        cache = self.cache
+        model_cache = cache._get_model_cache(model, self.db)
+
+        if isinstance(model_cache, ColumnarModelStore):
+            new_rows = model_cache.ingest(fetched)
+            if new_rows:
+                if get_model_key(model) not in cache.models:
+                    cache._register_model(model)
+
+                cache._share_rows_with_parents(model_cache, new_rows)
+                cache._track_rows(model_cache, new_rows)
+                self.extend_frontier(model, new_rows)
+
+            return
+
+        new_instances = []
+        for instance in fetched:
+            if instance.pk not in model_cache:
+                cache._store_instance(instance)
+                new_instances.append(instance)
+
+        if new_instances:
+            self.extend_frontier(model, new_instances)
+
+    def extend_frontier(self, model: type[Model], rows: Union[list[Model], range]):
+        '''
+        Add rows to the next level, which may be fetched in several chunks
+        '''
+
+        frontier = self.frontier.get(model)
+        if frontier is None:
+            self.frontier[model] = rows
+
+        # rows are ingested at the end of the store, so the ranges are contiguous:
+        elif isinstance(rows, range):
+            self.frontier[model] = range(frontier.start, rows.stop)
+
+        else:
+            frontier.extend(rows)
+
+
 class RelatedObjectsCache:
-    relationships: dict[str, set[RelationshipTracker]] = {}
-    cache: dict[Union[str, int, UUID], dict] = {}
 
-    def __enter__(self):
-        return self
+    def __init__(
+        self,
+        traversal: str = DEPTH_FIRST,
+        max_depth: Optional[int] = None,
+        lazy: bool = False,
+        fallback_to_parent: bool = False,
+        storage: str = INSTANCE_STORAGE,
+        shared_tier: Optional[SharedTier] = None,
+        stats_hook: Optional[Callable[[dict], None]] = None,
+        miss_policy: str = FALLBACK_MISSES,
+        eviction: Optional[EvictionPolicy] = None,
+        record: bool = False,
+        load_plan: Optional[LoadPlan] = None,
+    ):
+        '''
+        `traversal` is the order in which related objects are visited
+        when adding instances to the cache (`DEPTH_FIRST` or `BREADTH_FIRST`),
+        and `max_depth` optionally limits how many relationships away from
+        each instance passed to `cache_results` related objects are followed.
+
+        If `lazy`, cached instances aren't linked up front: instead, while
+        the context manager is active, the relationship descriptors of the
+        cached models look up the related object(s) in the cache the first
+        time they are accessed.
+
+        Each cache is bound to the current thread or asyncio task while
+        its context manager is active, and releases everything it holds
+        on exit. If `fallback_to_parent`, a cache entered while another is
+        active falls back to the other cache for related objects it doesn't
+        have itself. While active, instances of cached models that are saved
+        or deleted are updated in place, along with the relationships they
+        are part of.
+
+        `storage` is how cached rows are held: `INSTANCE_STORAGE` keeps a
+        model instance per row, while `COLUMNAR_STORAGE` keeps the rows
+        loaded by `load_graph` in per-model columns (see `ColumnarModelStore`)
+        and only builds instances for the rows that are accessed. Since
+        there are no instances to link up front, columnar storage is always lazy.
+
+        `shared_tier` shares the rows of reference models between caches
+        (see `SharedTier`), and defaults to `settings.CACHE_RELATED_SHARED_TIER`.
+        Its models are loaded in full, from the shared tier where possible,
+        when the context manager is entered.
+
+        `stats_hook` is called with `get_stats()` when the context manager
+        exits, e.g. to ship them to a metrics pipeline (`stats.log_stats` logs
+        them), and defaults to the dotted path in `settings.CACHE_RELATED_STATS_HOOK`.
+
+        `miss_policy` is what happens when a relationship read from a cached
+        instance isn't in the cache: with `FALLBACK_MISSES`, the original
+        descriptor queries for it (or raises `QueriesDisabledError`), while
+        with `BATCH_MISSES`, the first miss fetches the related objects of
+        every cached instance still missing them in one batched query,
+        turning an N+1 into a 1+1.
+
+        `eviction` optionally bounds how many instances the cache holds
+        (see `EvictionPolicy`). Evicted instances are removed from the
+        indexes, and the instances linked to them have that relationship
+        cleared, so it's looked up again when it's next read.
+
+        If `record`, the relationships and fields read from cached instances
+        are recorded in a `LoadPlan` (see `get_load_plan`). Fields are only
+        seen on instances loaded by `load_graph`, which defers every field
+        but the key columns while recording. Given a `load_plan`, `load_graph`
+        follows just its relationships and fetches just its fields, and only
+        its relationships are linked.
+        '''
 
-    def __exit__(self, *exc):
-        pass
+        if traversal not in (DEPTH_FIRST, BREADTH_FIRST):
+            raise ValueError(f'Unknown traversal {traversal!r}, expected {DEPTH_FIRST!r} or {BREADTH_FIRST!r}')
+
+        if storage not in (INSTANCE_STORAGE, COLUMNAR_STORAGE):
+            raise ValueError(f'Unknown storage {storage!r}, expected {INSTANCE_STORAGE!r} or {COLUMNAR_STORAGE!r}')
+
+        if miss_policy not in (FALLBACK_MISSES, BATCH_MISSES):
+            raise ValueError(f'Unknown miss policy {miss_policy!r}, expected {FALLBACK_MISSES!r} or {BATCH_MISSES!r}')
+
+        self.traversal = traversal
+        self.max_depth = max_depth
+        self.lazy = lazy or storage == COLUMNAR_STORAGE
+        self.fallback_to_parent = fallback_to_parent
+        self.storage = storage
+        self.shared_tier = shared_tier if shared_tier is not None else get_settings_tier()
+        self.miss_policy = miss_policy
+        self.eviction = eviction
+        self.load_plan = load_plan
+
+        # kept after the context manager exits, unlike everything else:
+        self.recorded_plan = LoadPlan() if record else None
+
+        # reads of relationships are intercepted to resolve them lazily,
+        # to batch the misses, or to record them:
+        self.patch_descriptors = self.lazy or miss_policy == BATCH_MISSES or record
+
+        self.stats_hook = stats_hook
+        if stats_hook is None and getattr(settings, 'CACHE_RELATED_STATS_HOOK', None):
+            self.stats_hook = import_string(settings.CACHE_RELATED_STATS_HOOK)
+
+        self.models: dict[str, type[Model]] = {}
+        self.relationships: dict[str, tuple[RelationshipTracker, ...]] = {}
+        self.cache: dict[str, MutableMapping[Union[str, int, UUID], Model]] = {}
+        self.indexes: dict[tuple[str, str], dict[Any, list[Model]]] = {}
+        self.new_instances: dict[str, dict[Any, Model]] = {}
+
+        # models whose every row is cached:
+        self.complete_models: set[str] = set()
+
+        # the cached pks of each model that can be evicted, least recently
+        # used first, with the tick they were last used at:
+        self.recency: dict[str, OrderedDict[Any, int]] = {}
+
+        # keys of each index that some of its instances were evicted from:
+        self.incomplete_keys: dict[tuple[str, str], set] = {}
+
+        # keys of each relationship whose related objects have all been
+        # fetched (by `load_graph`, or for misses), so instances with one of
+        # them that aren't linked to any have none:
+        self.missing_keys_loaded: dict[RelationshipTracker, set] = {}
+
+        # the values of the key columns of each cached instance when it was
+        # last stored or saved (by model and pk), to tell which of them a save
+        # changed (see `get_key_field_names`):
+        self.stored_keys: dict[str, dict[Any, tuple]] = {}
+
+        # instances of multi-table inheritance parents for rows cached as a
+        # child's instance, for generic foreign keys to the parent (by
+        # parent and pk, see `_get_parent_instance`):
+        self.parent_instances: dict[str, dict[Any, Model]] = {}
+
+        # the rows of the through table of each many-to-many field:
+        self.edges: dict[ManyToManyField, EdgeIndex] = {}
+
+        self.stats = CacheStats()
+
+        self.parent: Optional[RelatedObjectsCache] = None
+
+        # the cache that was active when this one was entered, which stays
+        # active too (unlike `parent`, set whether or not it's fallen back to):
+        self.enclosing: Optional[RelatedObjectsCache] = None
+
+        self._ticks = count()
+        self._instance_sizes: dict[str, int] = {}
+
+        # databases whose content types have all been loaded, for the async API:
+        self._content_types_loaded: set[str] = set()
+        self._model_limits: dict[str, int] = {}
+        self._default_model_limit: Optional[int] = None
+        self._pinned: set[str] = set()
+
+        if eviction is not None:
+            limits = eviction.max_instances_per_model
+            if isinstance(limits, Mapping):
+                self._model_limits = {
+                    resolve_model_key(m): limit
+                    for m, limit in limits.items()
+                }
+            else:
+                self._default_model_limit = limits
 
-    def _add_object_to_cache(self, instance: Model):
+            self._pinned = {
+                resolve_model_key(m)
+                for m in eviction.pinned
+            }
 
-        model_key = instance.__class__.__name__
+            # reference models are shared, and never evicted:
+            if self.shared_tier is not None:
+                self._pinned.update(get_model_key(m) for m in self.shared_tier.models)
 
-        # get the model's cache by the instance's model name
-        # if not already set, create an empty dict:
-        self.cache.setdefault(model_key, {})
-        model_cache: dict = self.cache[model_key]
+        self._active = False
+        self._token: Optional[Token] = None
+        self._patched_models: set[type[Model]] = set()
+        self._descriptors: set[tuple[type[Model], str]] = set()
 
-        # if this exact instance has already been cached, skip adding
-        # it again to prevent infinite recursion
-        # note the use of `is not` vs `!=` to check if it is the same
-        # object stored in memory - if multiple objects exist for the
-        # same model/pk, we want to scan all in case they have
-        # different selected/prefetched related objects
-        if model_cache.get(instance.pk) is not instance:
+    @classmethod
+    def current(cls) -> Optional['RelatedObjectsCache']:
+        '''
+        The cache active in the current thread or asyncio task, if any
+        '''
 
-            # assign it to the cache:
-            model_cache[instance.pk] = instance
+        return current_cache.get()
 
-            # then recursively cache each related object if it exists:
-            model_fields = instance.__class__._meta.get_fields()
-            relationship_fields = [f for f in model_fields if f.is_relation]
-            for f in relationship_fields:
-                relationship_tracker = RelationshipTracker(field=f)
+    def get_stats(self) -> dict:
+        '''
+        What the cache holds and how it has been used since it was entered:
+        for each model, the objects cached, copies of them merged into
+        ones already cached, the objects evicted, the batched queries
+        issued for deferred fields, and the approximate bytes they hold; for each
+        relationship (as `Model.accessor`), the seconds spent linking it,
+        how often the cache did / didn't have its related objects, and the
+        batched queries issued for the misses; and the seconds spent
+        adding instances to the cache.
+        '''
 
-                self.relationships[model_key] = {
-                    *self.relationships.get(model_key, []),
-                    relationship_tracker,
+        relationships = {}
+        for counts, stat in (
+            (self.stats.link_time, 'link_time'),
+            (self.stats.hits, 'hits'),
+            (self.stats.misses, 'misses'),
+            (self.stats.fallbacks, 'fallbacks'),
+        ):
+            for r, value in counts.items():
+                relationships\
+                    .setdefault(f'{r.model_key}.{r.accessor}', {'link_time': 0.0, 'hits': 0, 'misses': 0, 'fallbacks': 0})\
+                    [stat] = value
+
+        return {
+            'models': {
+                model_key: {
+                    'objects': len(model_cache),
+                    'duplicates': self.stats.duplicates.get(model_key, 0),
+                    'evictions': self.stats.evictions.get(model_key, 0),
+                    'deferred_loads': self.stats.deferred_loads.get(model_key, 0),
+                    'bytes': get_model_size(model_cache),
                 }
+                for model_key, model_cache in self.cache.items()
+            },
+            'relationships': relationships,
+            'ingest_time': self.stats.ingest_time,
+        }
 
-                if f.many_to_one or f.one_to_one:
-                    try:
-                        related_instance = getattr(instance, f.name, None)
-                        if related_instance:
-                            self._add_object_to_cache(related_instance)
+    def get_load_plan(self) -> Optional[LoadPlan]:
+        '''
+        The relationships and fields read so far (if `record`), which can be
+        passed to later caches as their `load_plan`
+        '''
 
-                    except QueriesDisabledError:
+        return self.recorded_plan
 
-                        # skip for now, it will be cached later after the
-                        # initial objects have been cached
-                        continue
+    def __enter__(self):
+        self._activate()
 
-                else:
+        if self.shared_tier is not None:
+            self._load_shared_tier()
 
-                    if f.__class__ == ManyToOneRel:
-                        related_manager = getattr(
-                            instance,
-                            f.get_accessor_name()
-                        )
+        return self
 
-                    elif f.__class__ == ManyToManyField:
-                        related_manager = getattr(
-                            instance,
-                            f.attname
-                        )
+    async def __aenter__(self):
+        self._activate()
 
-                    elif f.__class__ == ManyToManyRel:
-                        related_manager = getattr(
-                            instance,
-                            f.get_accessor_name()
-                        )
+        if self.shared_tier is not None:
+            await sync_to_async(self._load_shared_tier)()
 
-                    try:
-                        related_instances = list(related_manager.all())
-                    except QueriesDisabledError:
-                        continue
-                    except:
-                        continue
+        return self
+
+    async def __aexit__(self, *exc):
+        self.__exit__(*exc)
 
-                    for related_instance in related_instances:
-                        self._add_object_to_cache(related_instance)
+    def _activate(self):
+        '''
+        Bind the cache to the current thread or asyncio task
+        '''
 
-        return instance
+        self.enclosing = current_cache.get()
+        self.parent = self.enclosing if self.fallback_to_parent else None
+        self._token = current_cache.set(self)
+        self._active = True
+        connect_signal_receivers()
 
-    def cache_results(self, *instances):
+        for model in self.models.values():
+            self._install_descriptors(model)
 
-        # first, add all the new instances to the cache:
-        for instance in instances:
-            self._add_object_to_cache(instance)
+    def __exit__(self, *exc):
+        self._active = False
+        self._uninstall_descriptors()
+        disconnect_signal_receivers()
+
+        if self._token is not None:
+            current_cache.reset(self._token)
+            self._token = None
+
+        if self.stats_hook is not None:
+            self.stats_hook(self.get_stats())
+
+        # drop every reference, so the cached instances can be freed:
+        self.parent = None
+        self.enclosing = None
+        self.models.clear()
+        self.relationships.clear()
+        self.cache.clear()
+        self.indexes.clear()
+        self.new_instances.clear()
+        self.stored_keys.clear()
+        self.parent_instances.clear()
+        self.complete_models.clear()
+        self.missing_keys_loaded.clear()
+        self.edges.clear()
+        self.recency.clear()
+        self.incomplete_keys.clear()
+        self._instance_sizes.clear()
+        self._content_types_loaded.clear()
+        self.stats.clear()
+
+    def _load_shared_tier(self):
+        '''
+        Cache every row of the shared tier's models, then link them
+        '''
 
-        # then, add all related objects to each other:
+        for model in self.shared_tier.models:
+            db = model._base_manager.db
 
-        relationships_with_cached_data = sorted(
-            [
-                r
-                for relationships in self.relationships.values()
-                for r in relationships
-                if r.model.__name__ in self.cache
-                and r.related_model.__name__ in self.cache
-            ],
-            key=lambda x: (x.model.__name__, x.related_model.__name__)
-        )
+            with queries_dangerously_enabled():
+                rows = self.shared_tier.get_rows(model, db)
+
+            model_key = get_model_key(model)
+            model_cache = self._get_model_cache(model, db)
+
+            if isinstance(model_cache, ColumnarModelStore):
+                new_rows = model_cache.ingest(rows)
+                if model_key not in self.models:
+                    self._register_model(model)
+
+                self._share_rows_with_parents(model_cache, new_rows)
+
+            else:
+                field_names = self.shared_tier.get_field_names(model)
+                for row in rows:
+                    instance = model.from_db(db, field_names, row)
+                    if instance.pk not in model_cache:
+                        self._store_instance(instance)
+
+            self.complete_models.add(model_key)
+
+        self._link_new_instances()
+
+    def dump(self, path: str):
+        '''
+        Write the cached rows of every model to a snapshot file at `path`,
+        which `load` can read back into another cache instead of querying
+        the database again
+        '''
+
+        # (stores are set up for models before any of their rows are fetched,
+        # and those that never get any are left out)
+        write_snapshot(
+            path,
+            (
+                get_snapshot_model(self.models[model_key], model_cache)
+                for model_key, model_cache in self.cache.items()
+                if model_key in self.models
+            ),
+        )
+
+    def load(self, path: str) -> dict:
+        '''
+        Cache the rows in the snapshot file at `path`, then link them.
+        With columnar storage, key columns are memory-mapped from the file
+        instead of being read into memory. Returns the snapshot's header
+        (with the labels, schema fingerprints and row counts of its models,
+        and the time it was written).
+
+        Raises `SnapshotError` if the schema of any of its models has changed
+        since it was written.
+        '''
+
+        header, models = read_snapshot(path)
+
+        for m in models:
+            model_key = get_model_key(m.model)
+            model_cache = self._get_model_cache(m.model, m.db, m.field_names)
+
+            if isinstance(model_cache, ColumnarModelStore):
+                if m.field_names != model_cache.field_names:
+                    raise SnapshotError(f'{path} doesn\'t have every column of {m.model._meta.label}')
+
+                if len(model_cache):
+                    rows = model_cache.ingest(
+                        get_row_values(m.columns, m.field_names, row)
+                        for row in range(m.row_count)
+                    )
+                else:
+                    rows = model_cache.attach(m.columns, m.row_count)
+
+                if model_key not in self.models:
+                    self._register_model(m.model)
+
+                self._share_rows_with_parents(model_cache, rows)
+                self._track_rows(model_cache, rows)
+
+            else:
+                for row in range(m.row_count):
+                    instance = m.model.from_db(m.db, m.field_names, get_row_values(m.columns, m.field_names, row))
+                    if instance.pk not in model_cache:
+                        self._store_instance(instance)
+
+        self._link_new_instances()
+
+        return header
+
+    def _install_descriptors(self, model: type[Model]):
+        '''
+        Replace the descriptors of `model`'s fields with ones that load
+        deferred fields in batches, and (if relationships are resolved
+        lazily or their misses are batched) the descriptors of its
+        relationships (and its proxies') with ones that resolve the related
+        object(s) from the current cache on first access
+        '''
+
+        if model in self._patched_models:
+            return
+
+        self._patched_models.add(model)
+
+        with patched_descriptors_lock:
+            if self.patch_descriptors:
+                for r in get_relationship_plan(model):
+                    # (a proxy's instances are resolved through its concrete model's relationships)
+                    for m in (model, *get_proxy_models(model)):
+                        self._patch_descriptor(m, r.accessor, CachedRelationDescriptor, r)
+
+            for f in model._meta.concrete_fields:
+                descriptor = getattr(model, f.attname)
+
+                # fields with descriptors of their own that handle assignment
+                # (foreign keys, files) are left alone:
+                if isinstance(descriptor, DeferredAttribute) and not hasattr(descriptor, '__set__'):
+                    self._patch_descriptor(model, f.attname, CachedDeferredAttribute, f.attname)
+
+    def _patch_descriptor(self, model: type[Model], name: str, descriptor_class: type, *args: Any):
+        key = (model, name)
+        if key in patched_descriptors:
+            patched_descriptors[key][1] += 1
+            self._descriptors.add(key)
+            return
+
+        descriptor = getattr(model, name)
+
+        # already replaced on a parent class:
+        if isinstance(descriptor, (CachedRelationDescriptor, CachedDeferredAttribute)):
+            return
+
+        patched_descriptors[key] = [model.__dict__.get(name), 1]
+        self._descriptors.add(key)
+        setattr(model, name, descriptor_class(descriptor, *args))
+
+    def _uninstall_descriptors(self):
+        '''
+        Restore the original descriptors, once no other
+        active cache relies on them
+        '''
+
+        with patched_descriptors_lock:
+            for key in self._descriptors:
+                patched = patched_descriptors[key]
+                patched[1] -= 1
+                if patched[1]:
+                    continue
+
+                del patched_descriptors[key]
+                model, name = key
+                descriptor = patched[0]
+
+                if descriptor is None:
+                    # the original was inherited from a parent class:
+                    delattr(model, name)
+                else:
+                    setattr(model, name, descriptor)
+
+        self._descriptors.clear()
+        self._patched_models.clear()
+
+    def _has_model(self, model_key: str) -> bool:
+        '''
+        Whether instances of `model_key` are cached here, or in a parent
+        this cache falls back to
+        '''
+
+        return model_key in self.cache or (
+            self.parent is not None and self.parent._has_model(model_key)
+        )
+
+    def _lookup_index(self, model_key: str, attname: str) -> Mapping[Any, list[Model]]:
+        '''
+        The index of `model_key` by `attname`, falling back to the parent's
+        index for keys this cache doesn't have
+        '''
+
+        index = self._get_index(model_key, attname)
+
+        if self.parent is not None and self.parent._has_model(model_key):
+            return ChainMap(index, self.parent._lookup_index(model_key, attname))
+
+        return index
+
+    def _resolve(self, instance: Model, r: RelationshipTracker):
+        '''
+        Look up the related object(s) of `instance` for `r` in the cache,
+        unless they have already been resolved
+        '''
+
+        if self.recorded_plan is not None:
+            self.recorded_plan.record_relationship(r.model, r.accessor)
+
+        # (an inherited relationship is of the parent model, but it's the
+        # child's instance that was used)
+        self._touch(get_model_key(instance.__class__), instance.pk)
+
+        if self._is_resolved(instance, r):
+            return
+
+        if r.generic:
+            found = self._link_generic(instance, r)
+        elif r.cardinality == 'many_to_many':
+            found = self._has_model(r.related_model_key) and self._resolve_edges(instance, r)
+        else:
+            found = self._has_model(r.related_model_key) and r.cache_related_data(
+                instance,
+                self._lookup_index(r.related_model_key, r.remote_field_to_match),
+                self._get_incomplete_keys(r),
+            )
+
+        self.stats.record_lookup(r, found)
+
+        if found:
+            return
+
+        if self._has_no_related_data(instance, r):
+            self._set_no_related_data(instance, r)
+        elif self.miss_policy != BATCH_MISSES:
+            return
+        elif r.generic:
+            self._load_missing_generic(instance, r)
+        else:
+            self._load_missing(instance, r)
+
+    def _has_no_related_data(self, instance: Model, r: RelationshipTracker) -> bool:
+        '''
+        Whether `instance` is known to have no related objects for `r`, which
+        wasn't linked: every related object with its key has been fetched, or
+        every row of the related model is cached
+        '''
+
+        if r.cardinality == 'many_to_many':
+            return False
+
+        key = r.get_key(instance) if r.generic and r.many else get_key(instance, r.field_to_match)
+        if key is None or (r.many and key in self._get_incomplete_keys(r)):
+            return False
+
+        return r.related_model_key in self.complete_models or key in self.missing_keys_loaded.get(r, ())
+
+    def _resolve_edges(self, instance: Model, r: RelationshipTracker) -> bool:
+        '''
+        Link the many-to-many relationship `r` of `instance` from its edge
+        index, first loading the edges of every cached instance of its
+        model that doesn't have them yet, with one query
+        '''
+
+        edges, end = self._get_edges(r)
+
+        if getattr(instance, r.field_to_match) not in edges.loaded[end]:
+            keys: tuple[set, set] = (set(), set())
+            keys[end].update(self._get_source_keys(r, [instance, *self._get_materialized_instances(r.model_key)]) - edges.loaded[end])
+            self._load_edges({edges: (instance._state.db or DEFAULT_DB_ALIAS, keys)})
+
+        return self._link_edges(instance, r)
+
+    @staticmethod
+    def _is_resolved(instance: Model, r: RelationshipTracker) -> bool:
+        if r.many:
+            return get_attribute_by_accessor(instance, r.field_to_cache_on) is not None
+
+        return r.field.is_cached(instance)
+
+    def _load_missing(self, instance: Model, r: RelationshipTracker):
+        '''
+        Fetch the related object(s) of `instance` for `r`, along with those
+        of every other cached instance that hasn't resolved `r` yet, with
+        one `IN` query (chunked by the database's parameter limit), and
+        cache them. Instances left without any are marked as having none,
+        so reading the relationship won't query again.
+
+        With columnar storage, the keys of every stored row are fetched,
+        including rows that haven't been accessed yet.
+        '''
+
+        pending = [instance] + [
+            o
+            for o in self._get_materialized_instances(r.model_key)
+            if o is not instance and not self._is_resolved(o, r)
+        ]
+
+        keys = self._get_source_keys(r, pending)
+
+        # the related objects of many-to-many relationships are fetched by
+        # the keys at the other end of their edges:
+        if r.cardinality == 'many_to_many':
+            edges, end = self._get_edges(r)
+            keys = {related_key for key in keys for related_key in edges.get(end, key)}
+
+        loaded_keys = self.missing_keys_loaded.setdefault(r, set())
+        keys -= loaded_keys
+        keys.discard(None)
+        loaded_keys |= keys
+
+        db = instance._state.db or DEFAULT_DB_ALIAS
+        with queries_dangerously_enabled():
+            fetched = self._fetch(
+                r.related_model,
+                {r.remote_field_to_match: keys},
+                db,
+                connections[db].features.max_query_params,
+            )
+
+        self.stats.record_fallback(r)
+
+        # the fetched instances are grouped here rather than looked up in the
+        # index, where some of them may have already been evicted again:
+        model_cache = self.cache.get(r.related_model_key, {})
+        related_instances: dict[Any, list[Model]] = {}
+        for related_instance in fetched:
+            cached_instance = model_cache.get(related_instance.pk)
+            if cached_instance is None:
+                self._store_instance(related_instance)
+                cached_instance = related_instance
+
+            related_instances\
+                .setdefault(getattr(cached_instance, r.remote_field_to_match), [])\
+                .append(cached_instance)
+
+        self._link_new_instances()
+
+        if r.cardinality == 'many_to_many':
+            for o in pending:
+                if not self._is_resolved(o, r):
+                    self._link_edges(o, r)
+
+            return
+
+        for o in pending:
+            key = getattr(o, r.field_to_match)
+            if key not in keys or self._is_resolved(o, r):
+                continue
+
+            if key in related_instances:
+                value = related_instances[key] if r.many else related_instances[key][0]
+                set_attribute_by_accessor(o, r.field_to_cache_on, value)
+            else:
+                self._set_no_related_data(o, r)
+
+    def _link_generic(self, instance: Model, r: RelationshipTracker) -> bool:
+        '''
+        Link the generic relationship `r` of `instance`: a generic foreign
+        key to the cached instance of the model of its content type, or a
+        generic relation to the cached instances pointing to `instance`.
+        Returns `False` if they aren't cached.
+        '''
+
+        if r.many:
+            return self._has_model(r.related_model_key) and r.cache_related_data(
+                instance,
+                self._lookup_index(r.related_model_key, r.remote_field_to_match),
+                self._get_incomplete_keys(r),
+            )
+
+        # (like a foreign key, a null one never queries)
+        if get_key(instance, r.field_to_match) is None:
+            r.field.set_cached_value(instance, None)
+            return True
+
+        related_instance = self._get_generic_target(instance, r)
+        if related_instance is None:
+            return False
+
+        r.field.set_cached_value(instance, related_instance)
+        return True
+
+    def _get_generic_target(self, instance: Model, r: RelationshipTracker, key: Any = UNKNOWN_KEY) -> Optional[Model]:
+        '''
+        The cached instance the generic foreign key `r` of `instance` points
+        to (or, given its `key`, pointed to)
+        '''
+
+        if key is UNKNOWN_KEY:
+            key = get_key(instance, r.field_to_match)
+        target = key and r.get_target(key, instance._state.db or DEFAULT_DB_ALIAS)
+        if not target:
+            return None
+
+        model, pk = target
+        model_key = get_model_key(model)
+        if not self._has_model(model_key):
+            return None
+
+        matches = self._lookup_index(model_key, model._meta.pk.attname).get(pk)
+        if not matches:
+            return None
+
+        # (Django only takes an instance of the content type's model, not
+        # of a child sharing its row)
+        if matches[0]._meta.concrete_model is not model._meta.concrete_model:
+            return self._get_parent_instance(matches[0], model)
+
+        return matches[0]
+
+    def _get_parent_instance(self, instance: Model, parent: type[Model]) -> Model:
+        '''
+        An instance of `parent` for the row it shares with `instance`, an
+        instance of one of its multi-table inheritance children, built
+        from the fields `instance` loaded (once per row)
+        '''
+
+        pk = getattr(instance, parent._meta.pk.attname)
+        parent_instances = self.parent_instances.setdefault(get_model_key(parent), {})
+
+        if pk not in parent_instances:
+            field_names = [f.attname for f in parent._meta.concrete_fields if f.attname in instance.__dict__]
+            parent_instances[pk] = parent.from_db(
+                instance._state.db,
+                field_names,
+                [instance.__dict__[attname] for attname in field_names],
+            )
+
+        return parent_instances[pk]
+
+    def _get_generic_relations(self, r: RelationshipTracker, model_key: Optional[str] = None) -> Iterator[RelationshipTracker]:
+        '''
+        The generic relations of cached models (or just of `model_key`)
+        that are the other side of the generic foreign key `r`
+        '''
+
+        for relationships in self.relationships.values():
+            for generic_relation in relationships:
+                if (
+                    (model_key is None or generic_relation.model_key == model_key)
+                    and generic_relation.generic
+                    and generic_relation.many
+                    and generic_relation.related_model_key == r.model_key
+                    and generic_relation.remote_field_to_match == r.field_to_match
+                ):
+                    yield generic_relation
+
+    def _get_generic_referrers(self, instance: Model) -> Iterator[tuple[Model, RelationshipTracker]]:
+        '''
+        The cached instances whose generic foreign key points to
+        `instance`, with the generic foreign key
+        '''
+
+        model = instance.__class__
+        db = instance._state.db or DEFAULT_DB_ALIAS
+
+        for relationships in list(self.relationships.values()):
+            for r in relationships:
+                if not r.generic or r.many or r.model_key not in self.cache:
+                    continue
+
+                key = r.get_object_key(model, instance.pk, db)
+                for referrer in self._get_index(r.model_key, r.field_to_match).get(key, ()):
+                    yield referrer, r
+
+    def _load_missing_generic(self, instance: Model, r: RelationshipTracker):
+        '''
+        Like `_load_missing`, for a generic relationship: the objects a
+        generic foreign key points to are fetched with one `pk__in` query
+        per model (grouped by content type), and those of a generic relation
+        by their content type and object ids
+        '''
+
+        pending = [instance] + [
+            o
+            for o in self._get_materialized_instances(r.model_key)
+            if o is not instance and not self._is_resolved(o, r)
+        ]
+
+        db = instance._state.db or DEFAULT_DB_ALIAS
+
+        keys = self._get_source_keys(r, pending)
+        if r.many:
+            keys = {r.get_object_key(r.model, pk, db) for pk in keys}
+
+        loaded_keys = self.missing_keys_loaded.setdefault(r, set())
+        keys -= loaded_keys
+        loaded_keys |= keys
+
+        if r.many:
+            lookups = {r.related_model: {r.remote_field_to_match: keys}}
+        else:
+            lookups = {
+                model: {model._meta.pk.attname: pks}
+                for model, pks in r.group_keys(keys, db).items()
+            }
+
+        for model, columns in lookups.items():
+            with queries_dangerously_enabled():
+                fetched = self._fetch(model, columns, db, connections[db].features.max_query_params)
+
+            model_cache = self.cache.get(get_model_key(model), {})
+            for related_instance in fetched:
+                if related_instance.pk not in model_cache:
+                    self._store_instance(related_instance)
+
+        self.stats.record_fallback(r)
+
+        self._link_new_instances()
+
+        # instances left without any have none:
+        for o in pending:
+            key = r.get_key(o) if r.many else get_key(o, r.field_to_match)
+            if key in loaded_keys and not self._is_resolved(o, r) and not self._link_generic(o, r):
+                self._set_no_related_data(o, r)
+
+    def _get_source_keys(self, r: RelationshipTracker, instances: Iterable[Model]) -> set:
+        '''
+        The keys of `instances` for `r`, along with (with columnar storage)
+        those of every stored row of the model
+        '''
+
+        keys = {get_key(o, r.field_to_match) for o in instances}
+
+        model_cache = self.cache.get(r.model_key)
+        if isinstance(model_cache, ColumnarModelStore):
+            keys |= model_cache.keys(r.field_to_match, model_cache.pk_index.values())
+
+        keys.discard(None)
+        return keys
+
+    def _get_edges(self, r: RelationshipTracker) -> tuple[EdgeIndex, int]:
+        '''
+        The edge index of the many-to-many relationship `r`, shared by both
+        of its sides, and the end of its edges `r`'s model is at
+        '''
+
+        field = r.field if r.field.__class__ == ManyToManyField else r.field.field
+
+        edges = self.edges.get(field)
+        if edges is None:
+            edges = self.edges[field] = EdgeIndex(field)
+
+        return edges, 0 if field is r.field else 1
+
+    def _get_missing_edges(self) -> dict[EdgeIndex, tuple[str, tuple[set, set]]]:
+        '''
+        The keys of each end whose edges need to be loaded (with the database
+        to load them from) before the instances added since the last pass
+        are linked: for each many-to-many relationship with both ends cached,
+        those of the new instances, or the first time, of every cached instance
+        '''
+
+        missing: dict[EdgeIndex, tuple[str, tuple[set, set]]] = {}
+
+        for relationships in self.relationships.values():
+            for r in relationships:
+                if r.cardinality != 'many_to_many' or r.model_key not in self.cache or not self._has_model(r.related_model_key):
+                    continue
+
+                # (both sides of a relationship share its edges)
+                edges, end = self._get_edges(r)
+                if edges in missing:
+                    continue
+
+                keys: tuple[set, set] = (set(), set())
+                db = DEFAULT_DB_ALIAS
+
+                for e, model_key, attname in (
+                    (end, r.model_key, r.field_to_match),
+                    (1 - end, r.related_model_key, r.remote_field_to_match),
+                ):
+                    new_instances = self.new_instances.get(model_key, {})
+                    if new_instances:
+                        db = next(iter(new_instances.values()))._state.db or db
+
+                    keys[e].update(getattr(o, attname) for o in new_instances.values())
+                    if not edges.complete:
+                        keys[e].update(self._get_index(model_key, attname))
+
+                    keys[e].difference_update(edges.loaded[e])
+                    keys[e].discard(None)
+
+                if keys[0] or keys[1]:
+                    missing[edges] = (db, keys)
+
+        return missing
+
+    def _load_edges(self, missing: dict[EdgeIndex, tuple[str, tuple[set, set]]]):
+        '''
+        Load the edges of the keys of each end of each edge index, with one
+        `IN` query per edge index (chunked by the database's parameter limit)
+        '''
+
+        for edges, (db, keys) in missing.items():
+            with queries_dangerously_enabled():
+                pairs = self._fetch(
+                    edges.through,
+                    {attname: k for attname, k in zip(edges.attnames, keys) if k},
+                    db,
+                    connections[db].features.max_query_params,
+                    list(edges.attnames),
+                )
+
+            edges.add(keys, pairs)
+
+    async def _aload_edges(self, missing: dict[EdgeIndex, tuple[str, tuple[set, set]]]):
+        for edges, (db, keys) in missing.items():
+            pairs = await self._afetch(
+                edges.through,
+                {attname: k for attname, k in zip(edges.attnames, keys) if k},
+                db,
+                connections[db].features.max_query_params,
+                list(edges.attnames),
+            )
+
+            edges.add(keys, pairs)
+
+    def _link_edges(self, instance: Model, r: RelationshipTracker) -> bool:
+        '''
+        Link the many-to-many relationship `r` of `instance` to the cached
+        instances at the other end of its edges. Returns `False` (leaving it
+        to fall through to the database) unless its edges have been loaded
+        and every instance they lead to is cached.
+        '''
+
+        edges, end = self._get_edges(r)
+
+        key = getattr(instance, r.field_to_match)
+        if key not in edges.loaded[end]:
+            return False
+
+        related_index = self._lookup_index(r.related_model_key, r.remote_field_to_match)
+
+        related_instances = []
+        for related_key in edges.get(end, key):
+            matches = related_index.get(related_key)
+            if not matches:
+                return False
+
+            related_instances.append(matches[0])
+
+        set_attribute_by_accessor(instance, r.field_to_cache_on, related_instances)
+        return True
+
+    def _get_edge_related_instances(self, r: RelationshipTracker, key: Any) -> list[Model]:
+        '''
+        The cached instances at the other end of the loaded edges of `key`
+        '''
+
+        edges, end = self._get_edges(r)
+        related_index = self._lookup_index(r.related_model_key, r.remote_field_to_match)
+
+        return [
+            related_instance
+            for related_key in edges.get(end, key)
+            for related_instance in related_index.get(related_key, ())
+        ]
+
+    def _get_incomplete_keys(self, r: RelationshipTracker) -> Container:
+        return self.incomplete_keys.get((r.related_model_key, r.remote_field_to_match), ())
+
+    @staticmethod
+    def _set_no_related_data(instance: Model, r: RelationshipTracker):
+        if r.many:
+            set_attribute_by_accessor(instance, r.field_to_cache_on, [])
+        else:
+            r.field.set_cached_value(instance, None)
+
+    def _load_deferred(self, instance: Model, attname: str):
+        '''
+        Load the deferred field `attname` of `instance`, along with that of
+        every other cached instance of its model still missing it, with one
+        `IN` query (chunked by the database's parameter limit). Instances
+        that aren't cached are left to Django, which loads it for them alone.
+
+        With columnar storage, the field is loaded for every stored row,
+        and kept as a new column of the store.
+        '''
+
+        model = instance.__class__
+        model_key = get_model_key(model)
+
+        if self.recorded_plan is not None:
+            self.recorded_plan.record_field(model, attname)
+
+        model_cache = self.cache.get(model_key)
+        if model_cache is None or instance.pk not in model_cache or model_cache[instance.pk] is not instance:
+            return
+
+        if isinstance(model_cache, ColumnarModelStore):
+            pks = set(model_cache.keys())
+        else:
+            pending = {
+                o.pk: o
+                for o in self._get_materialized_instances(model_key)
+                if attname not in o.__dict__
+            }
+            pks = set(pending)
+
+        pk_attname = model._meta.pk.attname
+        db = instance._state.db or DEFAULT_DB_ALIAS
+        with queries_dangerously_enabled():
+            rows = self._fetch(
+                model,
+                {pk_attname: pks},
+                db,
+                connections[db].features.max_query_params,
+                [pk_attname, attname],
+            )
+
+        if isinstance(model_cache, ColumnarModelStore):
+            model_cache.add_column(attname, dict(rows))
+        else:
+            for pk, value in rows:
+                pending[pk].__dict__[attname] = value
+
+        self.stats.record_deferred_load(model_key)
+
+    def _add_object_to_cache(self, instance: Model, visited: Optional[dict[int, Model]] = None):
+        '''
+        Add `instance`, and every related object that has been
+        selected/prefetched from it, to the cache.
+
+        Related objects are kept on an explicit worklist rather than
+        visited recursively, so the size of the graph is not limited
+        by the interpreter's recursion limit. `visited` holds every
+        instance already scanned (keyed by `id()`), and can be shared
+        between calls so that each instance is only scanned once per pass.
+
+        The cache is an identity map: the first instance cached for each pk
+        is kept, and copies of it reached later are merged into it (see
+        `_merge_instance`) and dropped, with the related objects pointing to
+        them pointed to the cached instance instead. Returns the cached
+        instance for `instance`.
+        '''
+
+        if visited is None:
+            visited = {}
+
+        started = perf_counter()
+
+        # each related object is queued with where it was found, as
+        # (instance, relationship, position in a to-many list):
+        worklist: deque[tuple[Model, int, Optional[tuple]]] = deque([(instance, 0, None)])
+        next_item = worklist.pop if self.traversal == DEPTH_FIRST else worklist.popleft
+
+        while worklist:
+            current, depth, found_on = next_item()
+
+            cached_instance = self._get_cached_instance(current)
+            if cached_instance is not None and cached_instance is not current and found_on is not None:
+                self._replace_related_instance(found_on, cached_instance)
+
+            if id(current) in visited:
+                continue
+
+            # keep a reference to each visited instance, so its id can't be
+            # reused by another object during the pass:
+            visited[id(current)] = current
+
+            # this exact instance has already been cached (and scanned):
+            if cached_instance is current:
+                continue
+
+            if cached_instance is None:
+                self._store_instance(current)
+            else:
+                self._merge_instance(cached_instance, current)
+
+            if self.max_depth is not None and depth >= self.max_depth:
+                continue
+
+            # then queue each related object, if it exists
+            # (only related objects that were selected/prefetched are read,
+            # the rest will be cached later after the initial objects have
+            # been cached, so the traversal never queries the database).
+            # The related objects of a merged copy are still scanned, since
+            # they may have related objects of their own the cached ones don't:
+            for r in get_relationship_plan(current.__class__):
+
+                if not r.many:
+                    if not r.field.is_cached(current):
+                        continue
+
+                    related_instance = r.field.get_cached_value(current)
+                    if related_instance:
+                        # (the cached instance took the copy's related object
+                        # if it didn't have one):
+                        owner = current
+                        if cached_instance is not None and r.field.get_cached_value(cached_instance, None) is related_instance:
+                            owner = cached_instance
+
+                        worklist.append((related_instance, depth + 1, (owner, r, None)))
+
+                else:
+                    related_instances = get_attribute_by_accessor(current, r.field_to_cache_on)
+                    if related_instances:
+                        worklist.extend(
+                            (related_instance, depth + 1, (related_instances, r, i))
+                            for i, related_instance in enumerate(related_instances)
+                        )
+
+        self.stats.ingest_time += perf_counter() - started
+
+        return self._get_cached_instance(instance) or instance
+
+    def _get_cached_instance(self, instance: Model) -> Optional[Model]:
+        '''
+        The instance cached for `instance`'s model and pk, if any
+        '''
+
+        model_cache = self.cache.get(get_model_key(instance.__class__))
+        if model_cache is None:
+            return None
+
+        return model_cache.get(instance.pk)
+
+    def _merge_instance(self, cached_instance: Model, instance: Model):
+        '''
+        Merge a copy of a cached instance into it: the fields, the
+        selected related objects (`fields_cache`) and the prefetched
+        related objects loaded on the copy but not on the cached instance
+        are moved over, so nothing found through either is lost
+        '''
+
+        model_key = get_model_key(instance.__class__)
+        self.stats.record_duplicate(model_key)
+        self._touch(model_key, instance.pk)
+
+        data = cached_instance.__dict__
+        for f in instance._meta.concrete_fields:
+            if f.attname not in data and f.attname in instance.__dict__:
+                data[f.attname] = instance.__dict__[f.attname]
+
+        fields_cache = cached_instance._state.fields_cache
+        for name, value in instance._state.fields_cache.items():
+            fields_cache.setdefault(name, value)
+
+        prefetched = getattr(instance, '_prefetched_objects_cache', None)
+        if prefetched:
+            if not hasattr(cached_instance, '_prefetched_objects_cache'):
+                cached_instance._prefetched_objects_cache = {}
+
+            for name, value in prefetched.items():
+                cached_instance._prefetched_objects_cache.setdefault(name, value)
+
+    @staticmethod
+    def _replace_related_instance(found_on: tuple, cached_instance: Model):
+        '''
+        Point where a copy of `cached_instance` was found (a to-one
+        relationship of an instance, or a position in a to-many list)
+        to `cached_instance` instead
+        '''
+
+        owner, r, i = found_on
+
+        if i is None:
+            r.field.set_cached_value(owner, cached_instance)
+            return
+
+        # prefetched lists are kept in a queryset's result cache:
+        if isinstance(owner, QuerySet):
+            owner = owner._result_cache
+
+        owner[i] = cached_instance
+
+    def _store_instance(self, instance: Model) -> bool:
+        '''
+        Assign `instance` to the cache and queue it to be linked. A copy of
+        an instance already cached is merged into it instead.
+
+        Returns `False` if an instance was already cached for its pk.
+        '''
+
+        model_key = get_model_key(instance.__class__)
+        model_cache = self._get_model_cache(instance.__class__, instance._state.db)
+
+        cached_instance = model_cache.get(instance.pk)
+        if cached_instance is not None:
+            if cached_instance is not instance:
+                self._merge_instance(cached_instance, instance)
+
+            return False
+
+        # assign it to the cache, and queue it to be linked:
+        model_cache[instance.pk] = instance
+        self.new_instances.setdefault(model_key, {})[instance.pk] = instance
+
+        if model_key not in self.models:
+            self._register_model(instance.__class__)
+
+        if not isinstance(model_cache, ColumnarModelStore):
+            self._record_keys(model_key, instance)
+
+        self._share_with_parents(instance)
+
+        if self.eviction is not None and model_key not in self._pinned:
+            if model_key not in self._instance_sizes:
+                self._instance_sizes[model_key] = get_instance_size(instance)
+
+            self._touch(model_key, instance.pk, new=True)
+            self._evict_over_limits(model_key)
+
+        return True
+
+    def _share_with_parents(self, instance: Model):
+        '''
+        Cache an instance of a multi-table inheritance child under each of
+        its parents as well, as the same object, so relationships to the
+        parents find it there instead of their rows being fetched and held
+        again. An instance of the parent already cached for the same row is
+        merged into it, and replaced by it.
+
+        The parents' rows aren't tracked for eviction on their own: they
+        leave the cache along with the child's (see `_uncache_from_parents`).
+        '''
+
+        model = instance._meta.concrete_model
+        if not model._meta.parents:
+            return
+
+        for parent in model._meta.get_parent_list():
+            pk = getattr(instance, parent._meta.pk.attname)
+            if pk is None:
+                continue
+
+            parent_key = get_model_key(parent)
+            model_cache = self._get_model_cache(
+                parent,
+                instance._state.db,
+                [f.attname for f in parent._meta.concrete_fields if f.attname in instance.__dict__],
+            )
+
+            # a column store can't take a row missing any of its columns:
+            if isinstance(model_cache, ColumnarModelStore) and not all(
+                attname in instance.__dict__ for attname in model_cache.field_names
+            ):
+                continue
+
+            cached_instance = model_cache.get(pk)
+            if cached_instance is instance:
+                continue
+
+            if cached_instance is not None:
+                # (a row can be a parent of instances of several children,
+                # and is kept as whichever was cached first)
+                if not isinstance(instance, cached_instance.__class__):
+                    continue
+
+                self._merge_instance(instance, cached_instance)
+
+                # (the replaced instance still finds its child)
+                link = model._meta.get_ancestor_link(parent)
+                if link is not None and link.remote_field.model is parent:
+                    link.remote_field.set_cached_value(cached_instance, instance)
+
+                if not isinstance(model_cache, ColumnarModelStore):
+                    for (index_model_key, attname), index in self.indexes.items():
+                        if index_model_key == parent_key:
+                            self._remove_from_index(index, cached_instance, attname)
+
+                self.recency.get(parent_key, {}).pop(pk, None)
+
+            model_cache[pk] = instance
+            self.new_instances.setdefault(parent_key, {})[pk] = instance
+
+            if parent_key not in self.models:
+                self._register_model(parent)
+
+            if not isinstance(model_cache, ColumnarModelStore):
+                self._record_keys(parent_key, instance)
+
+    def _share_rows_with_parents(self, store: ColumnarModelStore, rows: range):
+        '''
+        The columnar counterpart of `_share_with_parents`: the parents'
+        columns of rows added to a multi-table inheritance child's store are
+        added to the parents' stores too, where the row of a child's instance
+        is then that instance
+        '''
+
+        for parent in store.model._meta.get_parent_list():
+            pk_attname = parent._meta.pk.attname
+            if pk_attname not in store.columns:
+                continue
+
+            parent_key = get_model_key(parent)
+            model_cache = self._get_model_cache(
+                parent,
+                store.db,
+                [f.attname for f in parent._meta.concrete_fields if f.attname in store.columns],
+            )
+
+            if not isinstance(model_cache, ColumnarModelStore) or not all(
+                attname in store.columns for attname in model_cache.field_names
+            ):
+                continue
+
+            model_cache.ingest(
+                [store.value(row, attname) for attname in model_cache.field_names]
+                for row in rows
+            )
+
+            if (store, pk_attname) not in model_cache.children:
+                model_cache.children.append((store, pk_attname))
+
+            if parent_key not in self.models:
+                self._register_model(parent)
+
+    def _uncache_from_parents(self, model: type[Model], values: Mapping[str, Any]) -> list[str]:
+        '''
+        Remove the rows of a multi-table inheritance child's parents that
+        were cached with it (see `_share_with_parents`), given its values,
+        when it's evicted or deleted. Returns the keys of the parents.
+        '''
+
+        parent_keys = []
+        for parent in model._meta.get_parent_list():
+            parent_key = get_model_key(parent)
+            pk = values.get(parent._meta.pk.attname)
+            model_cache = self.cache.get(parent_key)
+
+            # (rows tracked on their own were cached for the parent itself)
+            if model_cache is None or pk not in model_cache or pk in self.recency.get(parent_key, ()):
+                continue
+
+            if not isinstance(model_cache, ColumnarModelStore):
+                for (index_model_key, attname), index in self.indexes.items():
+                    if index_model_key == parent_key:
+                        self._remove_from_index(index, model_cache[pk], attname)
+
+            del model_cache[pk]
+            self.new_instances.get(parent_key, {}).pop(pk, None)
+            self.stored_keys.get(parent_key, {}).pop(pk, None)
+            self.parent_instances.get(parent_key, {}).pop(pk, None)
+            parent_keys.append(parent_key)
+
+        return parent_keys
+
+    def _register_model(self, model: type[Model]):
+        '''
+        Start tracking the relationships of a newly cached model
+        (of its concrete model, for a proxy)
+        '''
+
+        model = model._meta.concrete_model
+        model_key = get_model_key(model)
+        self.models[model_key] = model
+
+        # the model's relationships are compiled once per model class:
+        self.relationships[model_key] = get_relationship_plan(model)
+
+        if self._active:
+            self._install_descriptors(model)
+
+    def _touch(self, model_key: str, pk: Any, new: bool = False):
+        '''
+        Mark a cached instance (or with `new`, a newly cached one)
+        as the most recently used of its model
+        '''
+
+        if self.eviction is None or model_key in self._pinned:
+            return
+
+        recency = self.recency.setdefault(model_key, OrderedDict())
+        if new or pk in recency:
+            recency[pk] = next(self._ticks)
+            recency.move_to_end(pk)
+
+    def _track_rows(self, store: ColumnarModelStore, rows: range):
+        '''
+        Start tracking the use of rows ingested into a column store
+        '''
+
+        model_key = get_model_key(store.model)
+        if self.eviction is None or model_key in self._pinned:
+            return
+
+        if model_key not in self._instance_sizes:
+            self._instance_sizes[model_key] = max(1, get_model_size(store) // len(store))
+
+        for row in rows:
+            self._touch(model_key, store.value(row, store.pk_attname), new=True)
+
+        self._evict_over_limits(model_key)
+
+    def _evict_over_limits(self, model_key: str):
+        '''
+        Evict the least recently used instances, of `model_key` while it's
+        over its own cap, then of any model while all of them are over the
+        global caps
+        '''
+
+        limit = self._model_limits.get(model_key, self._default_model_limit)
+        recency = self.recency.get(model_key, {})
+        while limit is not None and len(recency) > limit:
+            self._evict(model_key, next(iter(recency)))
+
+        max_instances = self.eviction.max_instances
+        max_bytes = self.eviction.max_bytes
+        if max_instances is None and max_bytes is None:
+            return
+
+        while True:
+            instances = sum(len(pks) for pks in self.recency.values())
+            size = sum(len(pks) * self._instance_sizes.get(k, 0) for k, pks in self.recency.items())
+
+            if not (
+                (max_instances is not None and instances > max_instances)
+                or (max_bytes is not None and size > max_bytes)
+            ):
+                return
+
+            # the model whose least recently used instance is the oldest:
+            oldest = min(
+                (k for k, pks in self.recency.items() if pks),
+                key=lambda k: next(iter(self.recency[k].values())),
+            )
+            self._evict(oldest, next(iter(self.recency[oldest])))
+
+    def _evict(self, model_key: str, pk: Any):
+        '''
+        Remove a cached instance from the cache and the indexes, and clear
+        the relationships linking it to other cached instances
+        '''
+
+        self.recency[model_key].pop(pk)
+        model_cache = self.cache[model_key]
+
+        if isinstance(model_cache, ColumnarModelStore):
+            row = model_cache.pk_index[pk]
+            instance = model_cache.instances.get(row)
+            values = {attname: model_cache.value(row, attname) for attname in model_cache.field_names}
+        else:
+            instance = model_cache[pk]
+            values = instance.__dict__
+
+        for r in self.relationships[model_key]:
+            if instance is not None:
+                self._clear_related_data(instance, r)
+
+            # the object a generic foreign key points to loses it from its
+            # generic relations, which can no longer be linked as a whole:
+            if r.generic:
+                key = None if r.many else tuple(values.get(attname) for attname in r.field_to_match)
+                if key is None or None in key:
+                    continue
+
+                self.incomplete_keys.setdefault((r.model_key, r.field_to_match), set()).add(key)
+
+                related_instance = self._get_generic_target(instance, r) if instance is not None else None
+                if related_instance is None:
+                    continue
+
+                for generic_relation in self._get_generic_relations(r, get_model_key(related_instance.__class__)):
+                    self._clear_related_data(related_instance, generic_relation)
+
+                continue
+
+            reverse = get_reverse_relationship(r)
+            key = values.get(r.field_to_match)
+            if reverse is None or key is None:
+                continue
+
+            # instances with an edge to it are linked again once it's cached again:
+            if r.cardinality == 'many_to_many':
+                if instance is not None:
+                    for related_instance in self._get_edge_related_instances(r, key):
+                        self._clear_related_data(related_instance, reverse)
+
+                continue
+
+            # the instance's siblings can no longer be linked as a whole
+            # (an inherited relationship's are indexed by the parent model):
+            if reverse.many:
+                self.incomplete_keys.setdefault((r.model_key, r.field_to_match), set()).add(key)
+
+            # (unmaterialized rows aren't linked to anything)
+            if instance is None or not self._has_model(r.related_model_key):
+                continue
+
+            for related_instance in self._lookup_index(r.related_model_key, r.remote_field_to_match).get(key, ()):
+                self._clear_related_data(related_instance, reverse)
+
+        # as are the instances whose generic foreign key points to it:
+        if instance is not None:
+            for referrer, r in self._get_generic_referrers(instance):
+                self._clear_related_data(referrer, r)
+
+        if not isinstance(model_cache, ColumnarModelStore):
+            for (index_model_key, attname), index in self.indexes.items():
+                if index_model_key == model_key:
+                    self._remove_from_index(index, instance, attname)
+
+        del model_cache[pk]
+        self.new_instances.get(model_key, {}).pop(pk, None)
+        self.stored_keys.get(model_key, {}).pop(pk, None)
+
+        # along with the rows of its parents cached with it:
+        model_keys = {model_key, *self._uncache_from_parents(self.models[model_key], values)}
+        self.complete_models.difference_update(model_keys)
+
+        # the related objects fetched for misses may have been evicted
+        # (those of generic foreign keys can be of any model):
+        for r in list(self.missing_keys_loaded):
+            if r.related_model_key is None or r.related_model_key in model_keys:
+                del self.missing_keys_loaded[r]
+
+        self.stats.record_eviction(model_key)
+
+    def _get_model_cache(
+        self,
+        model: type[Model],
+        db: Optional[str],
+        field_names: Optional[Iterable[str]] = None,
+    ) -> MutableMapping:
+        '''
+        The cache of `model`'s instances, by pk. If not already set, creates
+        an empty dict (or, with columnar storage, an empty column store,
+        with columns for just `field_names` if given)
+        '''
+
+        model_key = get_model_key(model)
+
+        if model_key not in self.cache:
+            if self.storage == COLUMNAR_STORAGE:
+                self.cache[model_key] = ColumnarModelStore(model._meta.concrete_model, db or DEFAULT_DB_ALIAS, field_names)
+            else:
+                self.cache[model_key] = {}
+
+        return self.cache[model_key]
+
+    def cache_results(self, *instances: Union[Model, Iterable[Model]], chunk_size: int = STREAM_CHUNK_SIZE):
+        '''
+        Add instances, and the related objects selected/prefetched from
+        them, to the cache and link them.
+
+        Copies of instances already cached are merged into them (see
+        `_add_object_to_cache`), and it's the cached instances that are linked.
+
+        Each argument can be an instance, or an iterable of them, such as a
+        generator or a queryset (read through `QuerySet.iterator()`). They
+        are consumed `chunk_size` instances at a time, each chunk being
+        added and linked before the next one is read, so no more than one
+        chunk is held outside the cache at once.
+        '''
+
+        for chunk in iter_instance_chunks(instances, chunk_size):
+
+            # first, add the new instances to the cache:
+            visited: dict[int, Model] = {}
+            for instance in chunk:
+                self._add_object_to_cache(instance, visited)
+
+            # then, link the new instances to each other and to the instances
+            # cached by earlier chunks and passes:
+            self._link_new_instances()
+
+    async def acache_results(self, *instances: Union[Model, Iterable[Model]], chunk_size: int = STREAM_CHUNK_SIZE):
+        '''
+        The async counterpart of `cache_results`, which periodically
+        yields to the event loop while adding and linking instances.
+        Querysets are read through `QuerySet.aiterator()`.
+        '''
+
+        for o in instances:
+            if isinstance(o, QuerySet) and o._result_cache is None:
+                chunk = []
+                async for instance in o.aiterator(chunk_size=chunk_size):
+                    chunk.append(instance)
+                    if len(chunk) == chunk_size:
+                        await self._acache_chunk(chunk)
+                        chunk = []
+
+                await self._acache_chunk(chunk)
+
+            else:
+                for chunk in iter_instance_chunks([o], chunk_size):
+                    await self._acache_chunk(chunk)
+
+    async def _acache_chunk(self, chunk: list[Model]):
+        visited: dict[int, Model] = {}
+        for i, instance in enumerate(chunk, 1):
+            self._add_object_to_cache(instance, visited)
+            if not i % LINK_BATCH_SIZE:
+                await asyncio.sleep(0)
+
+        await self._alink_new_instances()
+
+    def load_graph(
+        self,
+        queryset: QuerySet,
+        depth: Optional[int] = None,
+        include: Optional[Iterable[Union[str, type[Model]]]] = None,
+        chunk_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        fetch_size: Optional[int] = None,
+        fields: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+    ) -> list[Model]:
+        '''
+        Fetch the instances in `queryset`, and the related objects reachable
+        from them, then cache and link them all. Returns the instances
+        in `queryset`.
+
+        Related objects are fetched one level at a time, following the
+        relationship plans from the root model: each level issues one
+        query per related model, filtered by the keys collected from the
+        level before (`pk__in`, `fk__in`), so only the reachable subgraph
+        is loaded instead of whole tables. `IN` lists are split into chunks
+        of at most `chunk_size` parameters, which defaults to the database's
+        limit (e.g. 999 for SQLite).
+
+        `depth` optionally limits how many relationships away from the
+        root model are followed, and `include` optionally limits which
+        related models (as model classes or labels) are loaded.
+
+        With `workers`, the queries of each level (one per related model and
+        chunk) run at the same time on a pool of that many threads, each with
+        its own database connection, which is closed once the pool shuts down.
+        The rows are still cached on the calling thread. Worker connections
+        can't see uncommitted changes, so inside `transaction.atomic()`
+        the queries run one at a time on the calling thread instead.
+
+        With `fetch_size`, rows are read from the database `fetch_size` at a
+        time (through `QuerySet.iterator()`) and cached chunk by chunk,
+        instead of each query's rows being held in full before they're
+        cached. (The queries of `workers` still return their rows whole.)
+
+        With the cache's `load_plan`, only its relationships are followed,
+        and `fields` defaults to its fields.
+
+        With `fields`, each model is fetched with only its key columns (the
+        pk and the columns its relationships are matched on), plus the fields
+        listed for it in `fields` (by model class or label), e.g.
+        `fields={Alpha: ['number']}`. The other fields are deferred, and
+        reading one from a cached instance loads it for every cached instance
+        of that model at once. The root queryset is left as is if it already
+        defers fields or selects related objects.
+        '''
+
+        load = GraphLoad(self, queryset, depth, include, chunk_size, fields)
+        queryset = load.get_root_queryset(queryset)
+
+        roots: list[Model] = []
+        with queries_dangerously_enabled():
+            chunks = [list(queryset)] if fetch_size is None else iter_instance_chunks([queryset], fetch_size)
+            for chunk in chunks:
+                roots.extend(load.add_roots(chunk))
+
+        self._load_levels(load, workers, fetch_size)
+
+        return load.get_cached_roots(roots)
+
+    def iter_graph(
+        self,
+        queryset: QuerySet,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        depth: Optional[int] = None,
+        include: Optional[Iterable[Union[str, type[Model]]]] = None,
+        fields: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+        workers: Optional[int] = None,
+    ) -> Iterator[list[Model]]:
+        '''
+        Like `load_graph`, but reads the instances in `queryset` `chunk_size`
+        at a time (through `QuerySet.iterator()`), yielding each chunk once
+        the related objects reachable from it are cached and linked.
+        Related objects cached for earlier chunks aren't fetched again.
+        '''
+
+        load = GraphLoad(self, queryset, depth, include, None, fields)
+        rows = load.get_root_queryset(queryset).iterator(chunk_size=chunk_size)
+
+        while True:
+            with queries_dangerously_enabled():
+                chunk = list(islice(rows, chunk_size))
+
+            if not chunk:
+                return
+
+            load.restart()
+            roots = load.add_roots(chunk)
+            self._load_levels(load, workers)
+
+            yield load.get_cached_roots(roots)
+
+    def _load_levels(self, load: GraphLoad, workers: Optional[int] = None, fetch_size: Optional[int] = None):
+        '''
+        Fetch and cache each level of `load` in turn, then link
+        everything that was cached
+        '''
+
+        executor = None
+        if workers is not None and workers > 1 and not connections[load.db].in_atomic_block:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache_related')
+
+        # the connections the workers opened, closed once they're done:
+        worker_connections: set[BaseDatabaseWrapper] = set()
+
+        try:
+            while load.has_next_level():
+                lookups = load.next_lookups()
+
+                if executor is not None:
+                    self._fetch_in_parallel(executor, lookups, load, worker_connections)
+                    continue
+
+                for model, columns in lookups.items():
+                    with queries_dangerously_enabled():
+                        for fetched in self._iter_fetch(
+                            model,
+                            load.get_uncached(model, columns),
+                            load.db,
+                            load.chunk_size,
+                            load.get_values(model),
+                            load.get_only(model),
+                            fetch_size,
+                        ):
+                            load.add_fetched(model, fetched)
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+            for connection in worker_connections:
+                connection.inc_thread_sharing()
+                try:
+                    connection.close()
+                finally:
+                    connection.dec_thread_sharing()
+
+        self._link_new_instances()
+
+    async def aload_graph(
+        self,
+        queryset: QuerySet,
+        depth: Optional[int] = None,
+        include: Optional[Iterable[Union[str, type[Model]]]] = None,
+        chunk_size: Optional[int] = None,
+        fields: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+    ) -> list[Model]:
+        '''
+        The async counterpart of `load_graph`, using Django's async ORM.
+
+        The event loop is free while each query runs, and linking periodically
+        yields to it. The queries themselves still run one at a time: Django
+        runs them through thread-sensitive `sync_to_async`, on one thread and
+        connection, so those of a level aren't any faster for being awaited
+        together (`load_graph` with `workers` spreads them across connections).
+        '''
+
+        load = GraphLoad(self, queryset, depth, include, chunk_size, fields)
+
+        roots = [root async for root in load.get_root_queryset(queryset)]
+        roots = load.add_roots(roots)
+
+        while load.has_next_level():
+            await self._aload_content_types([load.db])
+            lookups = load.next_lookups()
+
+            for model, columns in lookups.items():
+                rows = await self._afetch(
+                    model,
+                    load.get_uncached(model, columns),
+                    load.db,
+                    load.chunk_size,
+                    load.get_values(model),
+                    load.get_only(model),
+                )
+                load.add_fetched(model, rows)
+
+            await asyncio.sleep(0)
+
+        await self._alink_new_instances()
+
+        return load.get_cached_roots(roots)
+
+    @staticmethod
+    def _fetch(
+        model: type[Model],
+        columns: dict[str, set],
+        db: str,
+        chunk_size: Optional[int],
+        values: Optional[list[str]] = None,
+        only: Optional[list[str]] = None,
+    ) -> list:
+        '''
+        Fetch the instances of `model` where any of `columns` matches one of
+        its keys, with as few queries as the parameter limit allows.
+
+        If `values` is given, rows of those fields are fetched instead of
+        instances; if `only` is, instances with just those fields loaded.
+        '''
+
+        instances = []
+        for condition in RelatedObjectsCache._get_fetch_conditions(columns, chunk_size):
+            instances.extend(RelatedObjectsCache._get_fetch_queryset(model, condition, db, values, only))
+
+        return instances
+
+    @staticmethod
+    def _iter_fetch(
+        model: type[Model],
+        columns: dict[str, set],
+        db: str,
+        chunk_size: Optional[int],
+        values: Optional[list[str]] = None,
+        only: Optional[list[str]] = None,
+        fetch_size: Optional[int] = None,
+    ) -> Iterator[list]:
+        '''
+        Like `_fetch`, but yields the rows of each query as they're read,
+        `fetch_size` at a time (or all at once, without a `fetch_size`)
+        '''
+
+        for condition in RelatedObjectsCache._get_fetch_conditions(columns, chunk_size):
+            queryset = RelatedObjectsCache._get_fetch_queryset(model, condition, db, values, only)
+
+            if fetch_size is None:
+                yield list(queryset)
+                continue
+
+            rows = queryset.iterator(chunk_size=fetch_size)
+            while chunk := list(islice(rows, fetch_size)):
+                yield chunk
+
+    @staticmethod
+    def _fetch_in_parallel(
+        executor: ThreadPoolExecutor,
+        lookups: dict[type[Model], dict[str, set]],
+        load: GraphLoad,
+        worker_connections: set[BaseDatabaseWrapper],
+    ):
+        '''
+        Run every query of a level on `executor`, and add the rows fetched
+        for each model to `load` (in the same order as `_fetch` would).
+
+        Multi-table inheritance children are fetched (and added) before
+        their parents, whose rows they hold, as they are one by one
+        (see `GraphLoad.get_uncached`); models without any are fetched all at once.
+        '''
+
+        for _, group in groupby(lookups.items(), key=lambda item: len(item[0]._meta.get_parent_list())):
+            futures: dict[type[Model], list[Future]] = {
+                model: [
+                    executor.submit(
+                        RelatedObjectsCache._fetch_in_thread,
+                        model,
+                        condition,
+                        load.db,
+                        load.get_values(model),
+                        load.get_only(model),
+                        worker_connections,
+                    )
+                    for condition in RelatedObjectsCache._get_fetch_conditions(
+                        load.get_uncached(model, columns),
+                        load.chunk_size,
+                    )
+                ]
+                for model, columns in group
+            }
+
+            for model, model_futures in futures.items():
+                fetched = []
+                for future in model_futures:
+                    fetched.extend(future.result())
+
+                load.add_fetched(model, fetched)
+
+    @staticmethod
+    def _fetch_in_thread(
+        model: type[Model],
+        condition: Q,
+        db: str,
+        values: Optional[list[str]],
+        only: Optional[list[str]],
+        worker_connections: set[BaseDatabaseWrapper],
+    ) -> list:
+        # (each worker thread has a connection of its own, kept open for its next queries)
+        worker_connections.add(connections[db])
+        return list(RelatedObjectsCache._get_fetch_queryset(model, condition, db, values, only))
+
+    @staticmethod
+    async def _afetch(
+        model: type[Model],
+        columns: dict[str, set],
+        db: str,
+        chunk_size: Optional[int],
+        values: Optional[list[str]] = None,
+        only: Optional[list[str]] = None,
+    ) -> list:
+        '''
+        The async counterpart of `_fetch`
+        '''
+
+        instances = []
+        for condition in RelatedObjectsCache._get_fetch_conditions(columns, chunk_size):
+            queryset = RelatedObjectsCache._get_fetch_queryset(model, condition, db, values, only)
+            instances.extend([instance async for instance in queryset])
+
+        return instances
+
+    @staticmethod
+    def _get_fetch_queryset(
+        model: type[Model],
+        condition: Q,
+        db: str,
+        values: Optional[list[str]],
+        only: Optional[list[str]] = None,
+    ) -> QuerySet:
+        queryset = model._base_manager.using(db).filter(condition)
+        if values is not None:
+            queryset = queryset.values_list(*values)
+        elif only is not None:
+            queryset = queryset.only(*only)
+
+        return queryset
+
+    @staticmethod
+    def _get_fetch_conditions(columns: dict[str, set], chunk_size: Optional[int]) -> list[Q]:
+        '''
+        One condition per query needed to match any of the keys of `columns`,
+        each with at most `chunk_size` parameters. A composite column (a pair
+        of attnames) matches pairs of keys, grouped by their first key.
+        '''
+
+        # split the keys of every column into pieces no bigger than a chunk:
+        pieces: list[tuple[str, list]] = []
+        for attname, keys in columns.items():
+            keys = list(keys)
+            step = chunk_size or len(keys)
+            pieces.extend(
+                (attname, keys[i:i + step])
+                for i in range(0, len(keys), step)
+            )
+
+        # then pack as many pieces as fit into each query:
+        chunks: list[list[tuple[str, list]]] = []
+        size = 0
+        for attname, keys in pieces:
+            if not chunks or (chunk_size and size + len(keys) > chunk_size):
+                chunks.append([])
+                size = 0
+            chunks[-1].append((attname, keys))
+            size += len(keys)
+
+        conditions = []
+        for chunk in chunks:
+            condition = Q()
+            for attname, keys in chunk:
+                if not isinstance(attname, tuple):
+                    condition |= Q(**{f'{attname}__in': keys})
+                    continue
+
+                groups: dict[Any, list] = {}
+                for first, second in keys:
+                    groups.setdefault(first, []).append(second)
+
+                for first, seconds in groups.items():
+                    condition |= Q(**{attname[0]: first, f'{attname[1]}__in': seconds})
+
+            conditions.append(condition)
+
+        return conditions
+
+    def _link_new_instances(self):
+        missing_edges = {}
+        if not self.lazy:
+            missing_edges = self._get_missing_edges()
+            self._load_edges(missing_edges)
+
+        for _ in self._iter_link_new_instances(missing_edges):
+            pass
+
+        self._compact_stores()
+
+    async def _alink_new_instances(self):
+        await self._aload_content_types(
+            next(iter(model_instances.values()))._state.db or DEFAULT_DB_ALIAS
+            for model_instances in self.new_instances.values()
+            if model_instances
+        )
+
+        missing_edges = {}
+        if not self.lazy:
+            missing_edges = self._get_missing_edges()
+            await self._aload_edges(missing_edges)
+
+        for _ in self._iter_link_new_instances(missing_edges):
+            await asyncio.sleep(0)
+
+        self._compact_stores()
+
+    def _compact_stores(self):
+        '''
+        Reclaim the rows evicted from column stores (see `ColumnarModelStore.compact`),
+        once everything loaded has been linked, and no positions of rows are held
+        '''
+
+        for model_cache in self.cache.values():
+            if isinstance(model_cache, ColumnarModelStore):
+                model_cache.compact()
+
+    async def _aload_content_types(self, dbs: Iterable[str]):
+        '''
+        Load every content type of `dbs` (once each) if generic relationships
+        are cached, since they're looked up while linking and loading them,
+        which can't query from the event loop
+        '''
+
+        if not any(r.generic for relationships in self.relationships.values() for r in relationships):
+            return
+
+        from .generic import load_content_types
+
+        for db in set(dbs) - self._content_types_loaded:
+            await sync_to_async(load_content_types)(db)
+            self._content_types_loaded.add(db)
+
+    def _iter_link_new_instances(self, loaded_edges: Mapping[EdgeIndex, tuple[str, tuple[set, set]]] = {}) -> Iterator[None]:
+        '''
+        Link the instances added since the last pass (or, in lazy mode,
+        just index them), yielding after every `LINK_BATCH_SIZE` instances
+        so the async API can give control back to the event loop.
+
+        Only pairs involving at least one new instance are linked:
+        new instances are matched against everything cached, and
+        instances cached by earlier passes are matched only against
+        the new instances, so the cost of a pass scales with the number
+        of new instances rather than the size of the cache.
+        '''
+
+        new_instances = {
+            model_key: list(model_instances.values())
+            for model_key, model_instances in self.new_instances.items()
+        }
+        self.new_instances.clear()
+
+        # keep the existing indexes up to date with the new instances:
+        for (model_key, attname), index in self.indexes.items():
+            for instance in new_instances.get(model_key, ()):
+                self._add_to_index(index, instance, attname)
+
+        # in lazy mode, instances are linked when their relationships are read:
+        if self.lazy:
+            return
+
+        for edges in loaded_edges:
+            edges.complete = True
+
+        # (a multi-table inheritance child's plan includes the relationships
+        # inherited from its parents, so each is only linked once)
+        relationships_with_new_data = sorted(
+            {
+                r
+                for relationships in self.relationships.values()
+                for r in relationships
+                if r.model_key in self.cache
+                and (
+                    # (a generic foreign key can point to new instances of any model)
+                    (r.related_model is None and new_instances)
+                    or (
+                        self._has_model(r.related_model_key)
+                        and (
+                            r.model_key in new_instances
+                            or r.related_model_key in new_instances
+                            or (r.cardinality == 'many_to_many' and self._get_edges(r)[0] in loaded_edges)
+                        )
+                    )
+                )
+                and (self.load_plan is None or self.load_plan.follows(r.model, r.accessor))
+            },
+            key=lambda x: (x.model_key, x.related_model_key or '', x.accessor)
+        )
+
+        for r in relationships_with_new_data:
+
+            # time spent away at the event loop isn't counted:
+            link_time = 0.0
+            started = perf_counter()
+            if r.generic:
+                link = self._iter_link_generic(r, new_instances)
+            elif r.cardinality == 'many_to_many':
+                link = self._iter_link_edges(r, new_instances, loaded_edges)
+            else:
+                link = self._iter_link_relationship(r, new_instances)
+
+            for _ in link:
+                link_time += perf_counter() - started
+                yield
+                started = perf_counter()
+
+            link_time += perf_counter() - started
+            self.stats.record_link_time(r, link_time)
+
+    def _iter_link_relationship(self, r: RelationshipTracker, new_instances: dict[str, list[Model]]) -> Iterator[None]:
+        new_model_instances = new_instances.get(r.model_key, ())
+        new_related_instances = new_instances.get(r.related_model_key, ())
+
+        # new instances get all of their related data:
+        related_index = self._lookup_index(r.related_model_key, r.remote_field_to_match)
+        incomplete_keys = self._get_incomplete_keys(r)
+        for i, model_instance in enumerate(new_model_instances, 1):
+            found = r.cache_related_data(model_instance, related_index, incomplete_keys)
+            self.stats.record_lookup(r, found)
+
+            # (so reading it doesn't fall through to the database)
+            if not found and not self._is_resolved(model_instance, r) and self._has_no_related_data(model_instance, r):
+                self._set_no_related_data(model_instance, r)
+
+            if not i % LINK_BATCH_SIZE:
+                yield
+
+        if not new_related_instances:
+            return
+
+        # existing instances get just the new related data
+        # (instances in a parent cache are left as they are):
+        new_ids = {id(o) for o in new_model_instances}
+        index = self._get_index(r.model_key, r.field_to_match)
+        for i, related_instance in enumerate(new_related_instances, 1):
+            if not i % LINK_BATCH_SIZE:
+                yield
+
+            key = getattr(related_instance, r.remote_field_to_match)
+            if key is None or (r.many and key in incomplete_keys):
+                continue
+
+            for model_instance in index.get(key, ()):
+                if id(model_instance) not in new_ids:
+                    r.add_related_data(model_instance, related_instance, replace=False)
+
+    def _iter_link_edges(
+        self,
+        r: RelationshipTracker,
+        new_instances: dict[str, list[Model]],
+        loaded_edges: Mapping[EdgeIndex, tuple[str, tuple[set, set]]],
+    ) -> Iterator[None]:
+        '''
+        Link a many-to-many relationship from its edge index: the new
+        instances, the instances whose edges were just loaded, and the
+        instances with edges to new related instances
+        '''
+
+        edges, end = self._get_edges(r)
+
+        keys = {getattr(o, r.field_to_match) for o in new_instances.get(r.model_key, ())}
+        if edges in loaded_edges:
+            keys.update(loaded_edges[edges][1][end])
+
+        for related_instance in new_instances.get(r.related_model_key, ()):
+            keys.update(edges.get(1 - end, getattr(related_instance, r.remote_field_to_match)))
+
+        keys.discard(None)
+
+        index = self._get_index(r.model_key, r.field_to_match)
+        for i, key in enumerate(keys, 1):
+            for instance in index.get(key, ()):
+                self.stats.record_lookup(r, self._link_edges(instance, r))
+
+            if not i % LINK_BATCH_SIZE:
+                yield
+
+    def _iter_link_generic(self, r: RelationshipTracker, new_instances: dict[str, list[Model]]) -> Iterator[None]:
+        '''
+        Link a generic relationship: the new instances, and the instances
+        matching new instances on the other side by composite key
+        '''
+
+        new_model_instances = new_instances.get(r.model_key, ())
+        for i, model_instance in enumerate(new_model_instances, 1):
+            found = self._link_generic(model_instance, r)
+            self.stats.record_lookup(r, found)
+
+            # (so reading it doesn't fall through to the database)
+            if not found and not self._is_resolved(model_instance, r) and self._has_no_related_data(model_instance, r):
+                self._set_no_related_data(model_instance, r)
+
+            if not i % LINK_BATCH_SIZE:
+                yield
+
+        new_ids = {id(o) for o in new_model_instances}
+
+        # a generic foreign key points existing instances to new instances
+        # of any model, by their content type and pk:
+        if not r.many:
+            index = self._get_index(r.model_key, r.field_to_match)
+            for model_key, related_instances in new_instances.items():
+                for i, related_instance in enumerate(related_instances, 1):
+                    if not i % LINK_BATCH_SIZE:
+                        yield
+
+                    key = r.get_object_key(related_instance.__class__, related_instance.pk, related_instance._state.db or DEFAULT_DB_ALIAS)
+                    for model_instance in index.get(key, ()):
+                        if id(model_instance) not in new_ids:
+                            r.field.set_cached_value(model_instance, related_instance)
+
+            return
+
+        # a generic relation adds the new instances pointing to existing
+        # instances of its model:
+        content_type_ids: dict[str, Any] = {}
+        incomplete_keys = self._get_incomplete_keys(r)
+        index = self._get_index(r.model_key, r.field_to_match)
+        for i, related_instance in enumerate(new_instances.get(r.related_model_key, ()), 1):
+            if not i % LINK_BATCH_SIZE:
+                yield
+
+            key = get_key(related_instance, r.remote_field_to_match)
+            if key is None or key in incomplete_keys:
+                continue
+
+            db = related_instance._state.db or DEFAULT_DB_ALIAS
+            if db not in content_type_ids:
+                content_type_ids[db] = r.get_content_type_id(r.model, db)
+
+            if key[0] != content_type_ids[db]:
+                continue
+
+            for model_instance in index.get(r.model._meta.pk.to_python(key[1]), ()):
+                if id(model_instance) not in new_ids:
+                    r.add_related_data(model_instance, related_instance, replace=False)
+
+    def _get_index(self, model_key: str, attname: Union[str, tuple[str, ...]]) -> Mapping[Any, list[Model]]:
+        '''
+        The cached instances of `model_key` grouped by their value of `attname`
+        (or composite key),
+        so each instance can be matched with a single dict lookup
+        instead of a scan over every cached instance.
+
+        Each index is built the first time it is needed, and is shared by
+        every relationship that matches on the same column of the same model.
+        '''
+
+        model_cache = self.cache.get(model_key)
+        if isinstance(model_cache, ColumnarModelStore):
+            return ColumnarIndex(model_cache, attname)
+
+        index_key = (model_key, attname)
+        if index_key not in self.indexes:
+
+            # (instances that haven't been linked yet are added when they are)
+            new_instances = self.new_instances.get(model_key, {})
+
+            index: dict[Any, list[Model]] = {}
+            for pk, instance in self.cache.get(model_key, {}).items():
+                if new_instances.get(pk) is not instance:
+                    self._add_to_index(index, instance, attname)
+
+            self.indexes[index_key] = index
+
+        return self.indexes[index_key]
+
+    @staticmethod
+    def _add_to_index(index: dict[Any, list[Model]], instance: Model, attname: Union[str, tuple[str, ...]]):
+        key = get_key(instance, attname)
+        if key is not None:
+            index.setdefault(key, []).append(instance)
+
+    @staticmethod
+    def _remove_from_index(
+        index: dict[Any, list[Model]],
+        instance: Model,
+        attname: Union[str, tuple[str, ...]],
+        key: Any = UNKNOWN_KEY,
+    ):
+        if key is UNKNOWN_KEY:
+            key = get_key(instance, attname)
+
+        instances = index.get(key, [])
+        for i, o in enumerate(instances):
+            if o is instance:
+                del instances[i]
+                break
+
+        if key in index and not instances:
+            del index[key]
+
+    def _on_save(self, instance: Model):
+        '''
+        Write a saved instance through to the cache: store it (or copy its
+        values to the cached copy of the same object), move it in the
+        indexes, and re-link just the relationships it is part of
+        '''
+
+        model = instance.__class__
+        model_key = get_model_key(model)
+
+        if model_key not in self.models:
+            return
+
+        model_cache = self.cache[model_key]
+        cached_instance = model_cache.get(instance.pk)
+
+        # a new instance isn't in any index yet, nor linked to anything:
+        new = cached_instance is None
+
+        if new:
+            self._store_instance(instance)
+            self.new_instances[model_key].pop(instance.pk, None)
+            changed = self._reindex(model_key, instance, new=True)
+
+        else:
+            if cached_instance is not instance:
+                # the cached copy is the one other instances point to:
+                for f in model._meta.concrete_fields:
+                    if f.attname in instance.__dict__:
+                        cached_instance.__dict__[f.attname] = instance.__dict__[f.attname]
+
+                instance = cached_instance
+
+            changed = self._reindex(model_key, instance)
+
+        # a multi-table inheritance child is also indexed as its parents:
+        for parent in self.models[model_key]._meta.get_parent_list():
+            parent_key = get_model_key(parent)
+            pk = getattr(instance, parent._meta.pk.attname)
+
+            # (the next generic foreign key to the parent gets the new values)
+            self.parent_instances.get(parent_key, {}).pop(pk, None)
+
+            if self.cache.get(parent_key, {}).get(pk) is instance:
+                self.new_instances.get(parent_key, {}).pop(pk, None)
+                changed.update(self._reindex(parent_key, instance, new))
+
+        for r in self.relationships[model_key]:
+            key_changed = r.field_to_match in changed or (
+                isinstance(r.field_to_match, tuple) and not changed.keys().isdisjoint(r.field_to_match)
+            )
+            self._relink(instance, r, key_changed, self._get_old_key(instance, r.field_to_match, changed))
+
+    def _on_delete(self, instance: Model):
+        '''
+        Remove a deleted instance from the cache, the indexes, and the
+        related data of the instances it was linked to
+        '''
+
+        model = instance.__class__
+        model_key = get_model_key(model)
+
+        if model_key not in self.models:
+            return
+
+        model_cache = self.cache[model_key]
+        instance = model_cache.get(instance.pk) or instance
+
+        for r in self.relationships[model_key]:
+
+            # it's taken out of the generic relations of the object
+            # its generic foreign key points to:
+            if r.generic:
+                related_instance = None if r.many else self._get_generic_target(instance, r)
+                if related_instance is not None:
+                    for generic_relation in self._get_generic_relations(r, get_model_key(related_instance.__class__)):
+                        self._remove_related_data(related_instance, generic_relation, instance)
+
+                continue
+
+            reverse = get_reverse_relationship(r)
+            key = getattr(instance, r.field_to_match)
+
+            if reverse is None or key is None or not self._has_model(r.related_model_key):
+                continue
+
+            if r.cardinality == 'many_to_many':
+                related_instances = self._get_edge_related_instances(r, key)
+
+                # its through table rows were deleted along with it:
+                self.edges.pop(self._get_edges(r)[0].field, None)
+            else:
+                related_instances = self._lookup_index(r.related_model_key, r.remote_field_to_match).get(key, ())
+
+            for related_instance in related_instances:
+                self._remove_related_data(related_instance, reverse, instance)
+
+        for referrer, r in self._get_generic_referrers(instance):
+            self._remove_related_data(referrer, r, instance)
+
+        for (index_model_key, attname), index in self.indexes.items():
+            if index_model_key == model_key:
+                self._remove_from_index(index, instance, attname)
+
+        model_cache.pop(instance.pk, None)
+        self.new_instances.get(model_key, {}).pop(instance.pk, None)
+        self.stored_keys.get(model_key, {}).pop(instance.pk, None)
+        self.recency.get(model_key, {}).pop(instance.pk, None)
+
+        # its parents' rows were deleted along with it:
+        self._uncache_from_parents(self.models[model_key], instance.__dict__)
+
+    def _on_m2m_changed(self, instance: Model, through: type[Model], pk_set: Optional[set]):
+        '''
+        Drop the cached many-to-many data changed through `through`,
+        on `instance` and on the cached instances on the other side, along
+        with the edges loaded from it
+        '''
+
+        model_key = get_model_key(instance.__class__)
+
+        # the instance the signal was sent with may be a copy of the cached one:
+        instances = [instance]
+        cached_instance = self.cache.get(model_key, {}).get(instance.pk)
+        if cached_instance is not None and cached_instance is not instance:
+            instances.append(cached_instance)
+
+        for r in self.relationships.get(model_key, ()):
+            if r.cardinality != 'many_to_many':
+                continue
+
+            edges = self._get_edges(r)[0]
+            if edges.through is not through:
+                continue
+
+            self.edges.pop(edges.field, None)
+            for i in instances:
+                self._clear_related_data(i, r)
+
+            reverse = get_reverse_relationship(r)
+            if reverse is None or r.related_model_key not in self.cache:
+                continue
+
+            model_cache = self.cache[r.related_model_key]
+            if pk_set is None:
+                related_instances = self._get_materialized_instances(r.related_model_key)
+            else:
+                related_instances = [model_cache[pk] for pk in pk_set if pk in model_cache]
+
+            for related_instance in related_instances:
+                self._clear_related_data(related_instance, reverse)
+
+    def _get_stored_keys(self, model_key: str) -> dict[Any, tuple]:
+        return self.stored_keys.setdefault(model_key, {})
+
+    def _record_keys(self, model_key: str, instance: Model):
+        '''
+        Record the values of the key columns of `instance` as cached under
+        `model_key` (those that aren't loaded as `UNKNOWN_KEY`)
+        '''
+
+        model = self.models[model_key]
+        self._get_stored_keys(model_key)[getattr(instance, model._meta.pk.attname)] = tuple(
+            instance.__dict__.get(attname, UNKNOWN_KEY)
+            for attname in get_key_field_names(model)
+        )
+
+    def _reindex(self, model_key: str, instance: Model, new: bool = False) -> dict[Any, Any]:
+        '''
+        Move `instance` to the entries for its current values in the indexes
+        of its model (or, if it's `new`, just add it to them). Returns the
+        old values of the key columns that changed since it was stored
+        (see `_record_keys`), or `UNKNOWN_KEY` for those that may have
+        changed because their old values weren't recorded.
+        '''
+
+        model_cache = self.cache[model_key]
+
+        # column stores keep their own indexes, and know the old values:
+        if isinstance(model_cache, ColumnarModelStore):
+            pk = getattr(instance, model_cache.pk_attname)
+            row = model_cache.pk_index[pk]
+            changed = {
+                attname: model_cache.value(row, attname)
+                for attname in model_cache.field_names
+                if model_cache.value(row, attname) != getattr(instance, attname)
+            }
+            model_cache[pk] = instance
+            return changed
+
+        model = self.models[model_key]
+        pk = getattr(instance, model._meta.pk.attname)
+        old_values = self._get_stored_keys(model_key).get(pk)
+        self._record_keys(model_key, instance)
+
+        if new:
+            for (index_model_key, attname), index in self.indexes.items():
+                if index_model_key == model_key:
+                    self._add_to_index(index, instance, attname)
+
+            return {}
+
+        # (an instance whose key columns weren't recorded may have changed any of them)
+        names = get_key_field_names(model)
+        changed = {
+            attname: old_value
+            for attname, old_value in zip(names, old_values or (UNKNOWN_KEY,) * len(names))
+            if old_value is UNKNOWN_KEY or old_value != instance.__dict__.get(attname, UNKNOWN_KEY)
+        }
+
+        for (index_model_key, attname), index in self.indexes.items():
+            if index_model_key != model_key:
+                continue
+
+            if isinstance(attname, tuple):
+                if changed.keys().isdisjoint(attname):
+                    continue
+
+            elif attname not in changed:
+                continue
+
+            old_key = self._get_old_key(instance, attname, changed)
+            if old_key is not UNKNOWN_KEY:
+                self._remove_from_index(index, instance, attname, old_key)
+
+            # the old value isn't known, so look for the instance everywhere:
+            else:
+                for key, instances in list(index.items()):
+                    remaining = [o for o in instances if o is not instance]
+                    if len(remaining) == len(instances):
+                        continue
+
+                    if remaining:
+                        index[key] = remaining
+                    else:
+                        del index[key]
+
+            self._add_to_index(index, instance, attname)
+
+        return changed
+
+    @staticmethod
+    def _get_old_key(instance: Model, attname: Union[str, tuple[str, ...]], changed: Mapping[Any, Any]) -> Any:
+        '''
+        The old value of the column `attname` of `instance`, from the old
+        values of its columns that changed (see `_reindex`)
+        '''
+
+        if attname in changed or not isinstance(attname, tuple):
+            return changed.get(attname, UNKNOWN_KEY)
+
+        # (a composite column that isn't indexed is made of the old values
+        # of the columns it's made of)
+        old_key = tuple(changed.get(a, getattr(instance, a)) for a in attname)
+        if any(k is UNKNOWN_KEY for k in old_key):
+            return UNKNOWN_KEY
+
+        return None if None in old_key else old_key
+
+    def _relink(self, instance: Model, r: RelationshipTracker, key_changed: bool, old_key: Any = UNKNOWN_KEY):
+        '''
+        Re-link one relationship of a saved instance, on both sides.
+        If its key changed, it's taken out of the related data of the
+        instances matching `old_key` (or, if that isn't known, of every
+        instance of the related model).
+        '''
+
+        # the instance's own related data is looked up again
+        # (or, in lazy mode, when it is next accessed):
+        self._clear_related_data(instance, r)
+
+        if r.generic:
+            self._relink_generic(instance, r, key_changed, old_key)
+            return
+
+        if not self._has_model(r.related_model_key):
+            return
+
+        if not self.lazy:
+            if r.cardinality == 'many_to_many':
+                self._link_edges(instance, r)
+            else:
+                r.cache_related_data(
+                    instance,
+                    self._lookup_index(r.related_model_key, r.remote_field_to_match),
+                    self._get_incomplete_keys(r),
+                )
+
+        reverse = get_reverse_relationship(r)
+        if reverse is None or reverse.cardinality == 'many_to_many':
+            return
+
+        # if it was moved to other related instances, it is taken out of the
+        # related data of the ones it was linked to before:
+        if key_changed:
+            if old_key is UNKNOWN_KEY:
+                related_instances = self._get_materialized_instances(r.related_model_key)
+            else:
+                related_instances = self._lookup_index(r.related_model_key, r.remote_field_to_match).get(old_key, ())
+
+            for related_instance in list(related_instances):
+                self._remove_related_data(related_instance, reverse, instance)
+
+        key = getattr(instance, r.field_to_match)
+        if key is None:
+            return
+
+        for related_instance in self._lookup_index(r.related_model_key, r.remote_field_to_match).get(key, ()):
+
+            # in lazy mode, only related data that was already resolved
+            # needs to be kept up to date:
+            if self.lazy:
+                if reverse.many:
+                    if get_attribute_by_accessor(related_instance, reverse.field_to_cache_on) is None:
+                        continue
+
+                elif not reverse.field.is_cached(related_instance):
+                    continue
+
+            reverse.add_related_data(related_instance, instance)
+
+    def _relink_generic(self, instance: Model, r: RelationshipTracker, key_changed: bool, old_key: Any = UNKNOWN_KEY):
+        '''
+        Like `_relink`, for a generic relationship. Generic relations are
+        kept up to date from the side of their generic foreign key.
+        '''
+
+        if not self.lazy:
+            self._link_generic(instance, r)
+
+        if r.many:
+            return
+
+        if key_changed and old_key is UNKNOWN_KEY:
+            for generic_relation in list(self._get_generic_relations(r)):
+                for related_instance in self._get_materialized_instances(generic_relation.model_key):
+                    self._remove_related_data(related_instance, generic_relation, instance)
+
+        elif key_changed and old_key is not None:
+            related_instance = self._get_generic_target(instance, r, old_key)
+            if related_instance is not None:
+                for generic_relation in list(self._get_generic_relations(r, get_model_key(related_instance.__class__))):
+                    self._remove_related_data(related_instance, generic_relation, instance)
+
+        related_instance = self._get_generic_target(instance, r)
+        if related_instance is None:
+            return
+
+        for generic_relation in self._get_generic_relations(r, get_model_key(related_instance.__class__)):
+
+            # (in lazy mode, only if it was already resolved)
+            if self.lazy and get_attribute_by_accessor(related_instance, generic_relation.field_to_cache_on) is None:
+                continue
+
+            generic_relation.add_related_data(related_instance, instance)
+
+    @staticmethod
+    def _clear_related_data(instance: Model, r: RelationshipTracker):
+        if r.many:
+            attribute, key = ACCESSOR_STEP.findall(r.field_to_cache_on)[-1]
+            if key:
+                getattr(instance, '_prefetched_objects_cache', {}).pop(key, None)
+
+        elif r.field.is_cached(instance):
+            r.field.delete_cached_value(instance)
+
+    @staticmethod
+    def _remove_related_data(instance: Model, r: RelationshipTracker, related_instance: Model):
+        if r.many:
+            value = get_attribute_by_accessor(instance, r.field_to_cache_on)
+            if value:
+                value[:] = [o for o in value if o.pk != related_instance.pk]
+
+        elif r.field.is_cached(instance) and r.field.get_cached_value(instance) is related_instance:
+            r.field.delete_cached_value(instance)
+
+    def _get_materialized_instances(self, model_key: str) -> Iterable[Model]:
+        '''
+        The cached instances of `model_key` that exist as objects (with
+        columnar storage, just the rows that have been accessed)
+        '''
 
-        for r in relationships_with_cached_data:
-            # get all model instances first:
-            model_instances = self.cache[r.model.__name__].values()
+        model_cache = self.cache.get(model_key, {})
+        if isinstance(model_cache, ColumnarModelStore):
+            return list(model_cache.instances.values())
 
-            for model_instance in model_instances:
-                r.cache_related_data(model_instance, self.cache)
+        return list(model_cache.values())
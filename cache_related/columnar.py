@@ -0,0 +1,371 @@
+from array import array
+from django.db.models import Model, Field
+from typing import Any, Iterable, Iterator, Mapping, MutableMapping, Optional, Sequence, Union
+
+
+# stands in for NULL in typed key columns, which can't hold `None`:
+NULL_KEY = -(2 ** 63)
+
+INTEGER_KEY_TYPES = (
+    'AutoField',
+    'BigAutoField',
+    'SmallAutoField',
+    'IntegerField',
+    'BigIntegerField',
+    'SmallIntegerField',
+    'PositiveIntegerField',
+    'PositiveBigIntegerField',
+    'PositiveSmallIntegerField',
+)
+
+
+def is_key_field(field: Field) -> bool:
+    '''
+    Whether `field` is one that relationships are matched on:
+    the primary key, or the column of a foreign key / one-to-one field
+    '''
+
+    return field.primary_key or (field.is_relation and field.concrete)
+
+
+def is_integer_key_field(field: Field) -> bool:
+    target_field = field.target_field if field.is_relation else field
+    return target_field.get_internal_type() in INTEGER_KEY_TYPES
+
+
+class ColumnarIndex(Mapping):
+    '''
+    A read-only view of a `ColumnarModelStore`'s index on one key column
+    (or composite key), mapping each key to the (materialized) instances
+    that have it
+    '''
+
+    def __init__(self, store: 'ColumnarModelStore', attname: Union[str, tuple[str, ...]]):
+        self.store = store
+        self.rows = store.index(attname)
+
+    def __getitem__(self, key: Any) -> list[Model]:
+        return [self.store.instance(row) for row in self.rows[key]]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class ColumnarModelStore(MutableMapping):
+    '''
+    Cached rows of `model`, stored column by column instead of as model
+    instances: key columns (the pk and foreign key columns) in typed
+    arrays where they hold integers, and every other field in a list.
+
+    Behaves like the `{pk: instance}` dict used for other models, but an
+    instance is only built (through `Model.from_db`) when a row is
+    accessed, and is then kept so the same row is always the same object.
+
+    With `field_names`, only those fields (and the pk) are stored, and the
+    others are deferred on the instances built.
+    '''
+
+    def __init__(self, model: type[Model], db: str, field_names: Optional[Iterable[str]] = None):
+        self.model = model
+        self.db = db
+
+        self.fields = list(model._meta.concrete_fields)
+        if field_names is not None:
+            field_names = set(field_names)
+            self.fields = [
+                f
+                for f in self.fields
+                if f.primary_key or f.attname in field_names or f.name in field_names
+            ]
+
+        self.field_names = [f.attname for f in self.fields]
+        self.pk_attname = model._meta.pk.attname
+
+        self.columns: dict[str, Sequence] = {
+            f.attname: array('q') if is_key_field(f) and is_integer_key_field(f) else []
+            for f in self.fields
+        }
+
+        self.instances: dict[int, Model] = {}
+        self.indexes: dict[str, dict[Any, list[int]]] = {}
+        self.pk_index: dict[Any, int] = {}
+
+        # the stores of multi-table inheritance children whose rows were
+        # also stored here, with the column of each that holds this model's pk:
+        self.children: list[tuple['ColumnarModelStore', str]] = []
+
+        # whether any columns are read-only views (see `attach`):
+        self.mapped = False
+
+    def __len__(self) -> int:
+        return len(self.pk_index)
+
+    def __iter__(self) -> Iterator:
+        return iter(self.pk_index)
+
+    def __contains__(self, pk: Any) -> bool:
+        return pk in self.pk_index
+
+    def __getitem__(self, pk: Any) -> Model:
+        return self.instance(self.pk_index[pk])
+
+    def __setitem__(self, pk: Any, instance: Model):
+        values = tuple(getattr(instance, attname) for attname in self.field_names)
+
+        row = self.pk_index.get(pk)
+        if row is None:
+            row = self._append(values)
+        else:
+            self._replace(row, values)
+
+        self.instances[row] = instance
+
+    def __delitem__(self, pk: Any):
+        row = self.pk_index.pop(pk)
+        self.instances.pop(row, None)
+
+        # the row's values stay in the columns until the store is compacted,
+        # but it can no longer be found:
+        for attname, index in self.indexes.items():
+            self._unindex(index, self.key(row, attname), row)
+
+    def compact(self) -> bool:
+        '''
+        Drop the rows that were removed from the columns, once they are at
+        least half of them, and renumber the rest. Returns whether it did.
+
+        Positions of rows taken before (such as the ranges returned by
+        `ingest`) no longer hold afterwards, so this is only done between loads.
+        '''
+
+        removed = self.row_count - len(self.pk_index)
+        if not removed or removed < len(self.pk_index):
+            return False
+
+        rows = sorted(self.pk_index.values())
+        positions = {row: position for position, row in enumerate(rows)}
+
+        self.columns = {
+            attname: array('q', (column[row] for row in rows)) if isinstance(column, (array, memoryview)) else [column[row] for row in rows]
+            for attname, column in self.columns.items()
+        }
+        self.mapped = False
+
+        for pk, row in self.pk_index.items():
+            self.pk_index[pk] = positions[row]
+
+        # (the indexes are renumbered in place, since views of them are kept)
+        for index in self.indexes.values():
+            for index_rows in index.values():
+                index_rows[:] = [positions[row] for row in index_rows]
+
+        instances = {positions[row]: instance for row, instance in self.instances.items()}
+        self.instances.clear()
+        self.instances.update(instances)
+
+        return True
+
+    def ingest(self, rows: Iterable[Sequence]) -> range:
+        '''
+        Add `rows` of values (in the order of `field_names`, as returned by
+        `values_list()`), skipping any whose pk is already stored.
+        Returns the positions of the rows added.
+        '''
+
+        start = self.row_count
+        pk_position = self.field_names.index(self.pk_attname)
+
+        for values in rows:
+            if values[pk_position] not in self.pk_index:
+                self._append(values)
+
+        return range(start, self.row_count)
+
+    def attach(self, columns: dict[str, Sequence], row_count: int) -> range:
+        '''
+        Use `columns` as the columns of this (empty) store without copying
+        them, e.g. key columns memory-mapped from a snapshot file as
+        `memoryview`s of 64-bit integers. They are copied into arrays the
+        first time a row is added or changed. Returns the positions of the rows.
+        '''
+
+        if self.row_count:
+            raise ValueError('Columns can only be attached to an empty store')
+
+        self.columns = {attname: columns[attname] for attname in self.field_names}
+        self.mapped = any(isinstance(column, memoryview) for column in self.columns.values())
+
+        for row in range(row_count):
+            self.pk_index[self.value(row, self.pk_attname)] = row
+
+        return range(row_count)
+
+    def add_column(self, attname: str, values: Mapping[Any, Any]):
+        '''
+        Store a field that was deferred, from `values` of it by pk (rows
+        missing from them get `None`), and set it on the instances built
+        '''
+
+        field = self.model._meta.get_field(attname)
+        column: Sequence
+        if is_key_field(field) and is_integer_key_field(field):
+            column = array('q', [NULL_KEY]) * self.row_count
+        else:
+            column = [None] * self.row_count
+
+        for pk, row in self.pk_index.items():
+            value = values.get(pk)
+            if value is not None:
+                column[row] = value
+
+        self.columns[attname] = column
+
+        # `Model.from_db` expects the fields in the model's order:
+        field_names = set(self.field_names) | {attname}
+        self.fields = [f for f in self.model._meta.concrete_fields if f.attname in field_names]
+        self.field_names = [f.attname for f in self.fields]
+
+        for row, instance in self.instances.items():
+            instance.__dict__[attname] = self.value(row, attname)
+
+    @property
+    def row_count(self) -> int:
+        return len(self.columns[self.pk_attname])
+
+    def value(self, row: int, attname: str) -> Any:
+        value = self.columns[attname][row]
+        return None if value == NULL_KEY else value
+
+    def key(self, row: int, attname: Union[str, tuple[str, ...]]) -> Any:
+        '''
+        The value of `attname` in `row`, or for a composite key (a tuple of
+        attnames), the tuple of their values, which is `None` if any of them is
+        '''
+
+        if isinstance(attname, tuple):
+            key = tuple(self.value(row, a) for a in attname)
+            return None if None in key else key
+
+        return self.value(row, attname)
+
+    def keys(self, attname: Optional[Union[str, tuple[str, ...]]] = None, rows: Optional[Iterable[int]] = None):
+        '''
+        With no arguments, the stored pks (like `dict.keys()`); otherwise
+        the distinct, non-null values of `attname` (or composite key) in `rows`
+        '''
+
+        if attname is None:
+            return self.pk_index.keys()
+
+        if isinstance(attname, tuple):
+            keys = {self.key(row, attname) for row in rows}
+            keys.discard(None)
+            return keys
+
+        column = self.columns[attname]
+        keys = {column[row] for row in rows}
+        keys.discard(None)
+        keys.discard(NULL_KEY)
+        return keys
+
+    def instance(self, row: int) -> Model:
+        '''
+        The model instance for `row`, built the first time it is needed.
+        The row of a child's instance is that instance.
+        '''
+
+        instance = self.instances.get(row)
+        if instance is None:
+            instance = self._get_child_instance(row) or self.model.from_db(
+                self.db,
+                self.field_names,
+                [self.value(row, attname) for attname in self.field_names],
+            )
+            self.instances[row] = instance
+
+        return instance
+
+    def _get_child_instance(self, row: int) -> Optional[Model]:
+        pk = self.value(row, self.pk_attname)
+
+        for child, attname in self.children:
+            rows = child.index(attname).get(pk)
+            if rows:
+                return child.instance(rows[0])
+
+        return None
+
+    def index(self, attname: Union[str, tuple[str, ...]]) -> dict[Any, list[int]]:
+        '''
+        The positions of the rows grouped by their value of `attname` (or
+        composite key), built the first time it is needed and kept up to
+        date after that
+        '''
+
+        if attname not in self.indexes:
+            index: dict[Any, list[int]] = {}
+            for row in self.pk_index.values():
+                key = self.key(row, attname)
+                if key is not None:
+                    index.setdefault(key, []).append(row)
+
+            self.indexes[attname] = index
+
+        return self.indexes[attname]
+
+    def _make_writable(self):
+        for attname, column in self.columns.items():
+            if isinstance(column, memoryview):
+                self.columns[attname] = array('q', column)
+
+        self.mapped = False
+
+    def _append(self, values: Sequence) -> int:
+        if self.mapped:
+            self._make_writable()
+
+        row = self.row_count
+
+        for attname, value in zip(self.field_names, values):
+            column = self.columns[attname]
+            column.append(NULL_KEY if value is None and isinstance(column, array) else value)
+
+        self.pk_index[self.value(row, self.pk_attname)] = row
+
+        for attname, index in self.indexes.items():
+            key = self.key(row, attname)
+            if key is not None:
+                index.setdefault(key, []).append(row)
+
+        return row
+
+    def _replace(self, row: int, values: Sequence):
+        if self.mapped:
+            self._make_writable()
+
+        for attname, index in self.indexes.items():
+            self._unindex(index, self.key(row, attname), row)
+
+        for attname, value in zip(self.field_names, values):
+            column = self.columns[attname]
+            column[row] = NULL_KEY if value is None and isinstance(column, array) else value
+
+        for attname, index in self.indexes.items():
+            key = self.key(row, attname)
+            if key is not None:
+                index.setdefault(key, []).append(row)
+
+    @staticmethod
+    def _unindex(index: dict[Any, list[int]], key: Any, row: int):
+        rows = index.get(key)
+        if rows is None:
+            return
+
+        if row in rows:
+            rows.remove(row)
+
+        if not rows:
+            del index[key]
@@ -0,0 +1,87 @@
+from array import array
+from django.db.models import ManyToManyField
+from typing import Any, Iterable, Optional, Sequence
+from .columnar import is_integer_key_field
+
+
+class EdgeIndex:
+    '''
+    The rows of a many-to-many field's `through` table, as a compact edge
+    list: the keys of both ends of each row (the source model's end first),
+    in two parallel columns, held in typed arrays where they're integers.
+
+    Edges are loaded by the keys of either end, which are remembered so
+    each key's edges are only fetched once, and are looked up through
+    adjacency lists built the first time each end is needed.
+    '''
+
+    def __init__(self, field: ManyToManyField):
+        self.field = field
+        self.through = field.remote_field.through
+
+        ends = (
+            self.through._meta.get_field(field.m2m_field_name()),
+            self.through._meta.get_field(field.m2m_reverse_field_name()),
+        )
+
+        self.attnames = tuple(f.attname for f in ends)
+        self.columns: tuple[Sequence, Sequence] = tuple(
+            array('q') if is_integer_key_field(f) else []
+            for f in ends
+        )
+
+        # the keys of each end whose edges have all been loaded:
+        self.loaded: tuple[set, set] = (set(), set())
+
+        # whether the edges of every cached instance at both ends have been
+        # loaded, after which only those of new instances need to be:
+        self.complete = False
+
+        self.adjacency: list[Optional[dict[Any, list]]] = [None, None]
+
+    def __len__(self) -> int:
+        return len(self.columns[0])
+
+    def add(self, keys: tuple[Iterable, Iterable], pairs: Iterable[Sequence]):
+        '''
+        Add the edges loaded for `keys` of each end, as pairs of keys in the
+        order of `attnames`. Edges already loaded before are skipped, as are
+        repeats of the same edge, which matches the keys of both ends (and so
+        can be fetched once for each, by queries split by the parameter limit).
+        '''
+
+        seen = set()
+        for pair in pairs:
+            if pair[0] in self.loaded[0] or pair[1] in self.loaded[1]:
+                continue
+
+            pair = (pair[0], pair[1])
+            if pair in seen:
+                continue
+
+            seen.add(pair)
+
+            self.columns[0].append(pair[0])
+            self.columns[1].append(pair[1])
+
+            for e, adjacency in enumerate(self.adjacency):
+                if adjacency is not None:
+                    adjacency.setdefault(pair[e], []).append(pair[1 - e])
+
+        self.loaded[0].update(keys[0])
+        self.loaded[1].update(keys[1])
+
+    def get(self, end: int, key: Any) -> list:
+        '''
+        The keys at the other end of the edges of `key` at `end`
+        '''
+
+        adjacency = self.adjacency[end]
+        if adjacency is None:
+            adjacency = {}
+            for a, b in zip(self.columns[end], self.columns[1 - end]):
+                adjacency.setdefault(a, []).append(b)
+
+            self.adjacency[end] = adjacency
+
+        return adjacency.get(key, [])
@@ -0,0 +1,35 @@
+from django.db.models import Model
+from typing import Iterable, Mapping, Optional, Union
+
+
+class EvictionPolicy:
+    '''
+    Bounds how many instances a `RelatedObjectsCache` holds, for caches
+    that live long enough to grow without bound (long-running workers,
+    streaming exports).
+
+    `max_instances_per_model` caps each model, either as one number for
+    every model or as a dict of each model's cap (models as classes or
+    labels); `max_instances` caps all models together, and `max_bytes`
+    is an approximate budget for all of them, estimated from the size of
+    the first instance of each model.
+
+    When a cap is exceeded, the least recently used instances are evicted:
+    ones whose relationships were read least recently (in lazy mode, or
+    when misses are batched), or otherwise the least recently linked.
+
+    Instances of `pinned` models (and of the shared tier's models) are
+    never evicted, and don't count towards the caps.
+    '''
+
+    def __init__(
+        self,
+        max_instances: Optional[int] = None,
+        max_instances_per_model: Optional[Union[int, Mapping[Union[str, type[Model]], int]]] = None,
+        max_bytes: Optional[int] = None,
+        pinned: Iterable[Union[str, type[Model]]] = (),
+    ):
+        self.max_instances = max_instances
+        self.max_instances_per_model = max_instances_per_model
+        self.max_bytes = max_bytes
+        self.pinned = list(pinned)
@@ -0,0 +1,207 @@
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Model
+from functools import partial
+from typing import Any, Container, Iterable, Mapping, Optional
+from zen_queries import queries_dangerously_enabled
+from .cache_related import RelationshipTracker, get_model_key, set_attribute_by_accessor
+
+
+def get_content_type_id(model: type[Model], db: str, for_concrete_model: bool = True) -> int:
+    '''
+    The id of `model`'s content type, from the content types cached by
+    Django, which are only queried the first time
+    '''
+
+    with queries_dangerously_enabled():
+        return ContentType.objects.db_manager(db).get_for_model(model, for_concrete_model=for_concrete_model).pk
+
+
+def get_content_type_model(content_type_id: int, db: str) -> Optional[type[Model]]:
+    '''
+    The model of a content type, or `None` if it no longer exists
+    '''
+
+    try:
+        with queries_dangerously_enabled():
+            return ContentType.objects.db_manager(db).get_for_id(content_type_id).model_class()
+    except ContentType.DoesNotExist:
+        return None
+
+
+def load_content_types(db: str):
+    '''
+    Cache every content type of `db` with one query, so none of them
+    have to be queried while linking (e.g. from the async API, which
+    can't query there)
+    '''
+
+    manager = ContentType.objects.db_manager(db)
+    for content_type in ContentType.objects.using(db):
+        manager._add_to_cache(db, content_type)
+
+
+class GenericRelationshipTracker(RelationshipTracker):
+    '''
+    A relationship through a `GenericForeignKey`'s content type and
+    object id columns, which are matched together as a composite key:
+    `(content type id, object id)`
+    '''
+
+    __slots__ = (
+        'object_id_field',
+        'for_concrete_model',
+    )
+
+    def get_content_type_id(self, model: type[Model], db: str) -> int:
+        return get_content_type_id(model, db, self.for_concrete_model)
+
+    def get_object_key(self, model: type[Model], pk: Any, db: str) -> tuple:
+        '''
+        The composite key of the instances pointing to the instance of
+        `model` with `pk`
+        '''
+
+        return self.get_content_type_id(model, db), self.object_id_field.to_python(pk)
+
+    def __repr__(self) -> str:
+        return f'{self.model.__name__}{self.field_to_cache_on} = GENERIC WHERE ({self.model.__name__}.{self.field_to_match})'
+
+
+class GenericForeignKeyTracker(GenericRelationshipTracker):
+    '''
+    A `GenericForeignKey`, which can point to an instance of any model.
+    It has no `related_model`: the model of each instance's related object
+    is looked up from its content type, and the object by its pk.
+    '''
+
+    def __init__(self, field: GenericForeignKey):
+        initialize = partial(object.__setattr__, self)
+        content_type_field = field.model._meta.get_field(field.ct_field)
+        object_id_field = field.model._meta.get_field(field.fk_field)
+
+        initialize('field', field)
+        initialize('model', field.model)
+        initialize('model_key', get_model_key(field.model))
+        initialize('related_model', None)
+        initialize('related_model_key', None)
+        initialize('accessor', field.name)
+        initialize('field_to_cache_on', f'.{field.name}')
+        initialize('field_to_match', (content_type_field.attname, object_id_field.attname))
+        initialize('remote_field_to_match', None)
+        initialize('cardinality', 'many_to_one')
+        initialize('many', False)
+        initialize('generic', True)
+        initialize('object_id_field', object_id_field)
+        initialize('for_concrete_model', field.for_concrete_model)
+        initialize('_hash', hash((self.model, self.field_to_cache_on, self.field_to_match)))
+
+    def get_target(self, key: tuple, db: str) -> Optional[tuple[type[Model], Any]]:
+        '''
+        The model and pk of the object a composite key points to,
+        or `None` if its content type no longer exists
+        '''
+
+        content_type_id, object_id = key
+
+        model = get_content_type_model(content_type_id, db)
+        if model is None:
+            return None
+
+        try:
+            return model, model._meta.pk.to_python(object_id)
+        except ValidationError:
+            return None
+
+    def group_keys(self, keys: Iterable[tuple], db: str) -> dict[type[Model], set]:
+        '''
+        The pks of the objects `keys` point to, grouped by model
+        '''
+
+        pks: dict[type[Model], set] = {}
+        for key in keys:
+            target = self.get_target(key, db)
+            if target is not None:
+                pks.setdefault(target[0], set()).add(target[1])
+
+        return pks
+
+
+class GenericRelationTracker(GenericRelationshipTracker):
+    '''
+    A `GenericRelation`: the instances of `related_model` whose generic
+    foreign key points to an instance of `model`, found in the index of
+    `related_model` by their composite key (`remote_field_to_match`)
+    '''
+
+    def __init__(self, field: GenericRelation):
+        initialize = partial(object.__setattr__, self)
+        related_model = field.related_model
+        content_type_field = related_model._meta.get_field(field.content_type_field_name)
+        object_id_field = related_model._meta.get_field(field.object_id_field_name)
+
+        initialize('field', field)
+        initialize('model', field.model)
+        initialize('model_key', get_model_key(field.model))
+        initialize('related_model', related_model)
+        initialize('related_model_key', get_model_key(related_model))
+        initialize('accessor', field.name)
+        initialize('field_to_cache_on', f'._prefetched_objects_cache[{field.attname}]')
+        initialize('field_to_match', field.model._meta.pk.attname)
+        initialize('remote_field_to_match', (content_type_field.attname, object_id_field.attname))
+        initialize('cardinality', 'one_to_many')
+        initialize('many', True)
+        initialize('generic', True)
+        initialize('object_id_field', object_id_field)
+        initialize('for_concrete_model', field.for_concrete_model)
+        initialize(
+            '_hash',
+            hash((self.model, self.field_to_cache_on, self.field_to_match, self.related_model, self.remote_field_to_match)),
+        )
+
+    def get_key(self, instance: Model) -> tuple:
+        '''
+        The composite key of the instances pointing to `instance`
+        '''
+
+        return self.get_object_key(self.model, instance.pk, instance._state.db or DEFAULT_DB_ALIAS)
+
+    def cache_related_data(
+        self,
+        instance: Model,
+        index: Mapping[Any, list[Model]],
+        incomplete_keys: Container = (),
+    ) -> bool:
+        '''
+        Like `RelationshipTracker.cache_related_data`, matching the instances
+        of `related_model` that point to `instance` by their composite key
+        '''
+
+        key = self.get_key(instance)
+        if key in incomplete_keys:
+            return False
+
+        related_instances = index.get(key)
+        if not related_instances:
+            return False
+
+        set_attribute_by_accessor(instance, self.field_to_cache_on, list(related_instances))
+        return True
+
+
+def get_generic_relationships(model: type[Model]) -> list[RelationshipTracker]:
+    '''
+    The generic foreign keys and generic relations of `model`
+    '''
+
+    trackers: list[RelationshipTracker] = []
+    for f in model._meta.private_fields:
+        if isinstance(f, GenericForeignKey):
+            trackers.append(GenericForeignKeyTracker(f))
+
+        elif isinstance(f, GenericRelation):
+            trackers.append(GenericRelationTracker(f))
+
+    return trackers
@@ -0,0 +1,85 @@
+from django.apps import apps
+from django.db.models import Model
+from typing import Iterable, Mapping, Optional, Union
+import json
+
+
+class LoadPlan:
+    '''
+    The relationships (by accessor) and fields (by attname) of each model
+    that were read during a run, as recorded by a `RelatedObjectsCache`
+    with `record=True`.
+
+    Given to a cache as its `load_plan`, `load_graph` follows just those
+    relationships and fetches just those fields (besides the key columns),
+    and only those relationships are linked.
+
+    Models can be given as classes or labels (`'core.Alpha'`), and are
+    serialized by label, so a plan can be kept alongside the code it was
+    recorded from.
+    '''
+
+    def __init__(
+        self,
+        relationships: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+        fields: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+    ):
+        self.relationships: dict[type[Model], set[str]] = {
+            apps.get_model(m) if isinstance(m, str) else m: set(accessors)
+            for m, accessors in (relationships or {}).items()
+        }
+
+        self.fields: dict[type[Model], set[str]] = {
+            apps.get_model(m) if isinstance(m, str) else m: set(attnames)
+            for m, attnames in (fields or {}).items()
+        }
+
+    @property
+    def models(self) -> set[type[Model]]:
+        '''
+        The models whose relationships or fields were read
+        '''
+
+        return set(self.relationships) | set(self.fields)
+
+    def follows(self, model: type[Model], accessor: str) -> bool:
+        return accessor in self.relationships.get(model, ())
+
+    def record_relationship(self, model: type[Model], accessor: str):
+        self.relationships.setdefault(model, set()).add(accessor)
+
+    def record_field(self, model: type[Model], attname: str):
+        self.fields.setdefault(model, set()).add(attname)
+
+    def update(self, other: 'LoadPlan'):
+        '''
+        Add everything `other` follows, e.g. to combine the plans
+        recorded from several runs
+        '''
+
+        for model, accessors in other.relationships.items():
+            self.relationships.setdefault(model, set()).update(accessors)
+
+        for model, attnames in other.fields.items():
+            self.fields.setdefault(model, set()).update(attnames)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                'relationships': {
+                    model._meta.label: sorted(accessors)
+                    for model, accessors in self.relationships.items()
+                },
+                'fields': {
+                    model._meta.label: sorted(attnames)
+                    for model, attnames in self.fields.items()
+                },
+            },
+            indent=2,
+            sort_keys=True,
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> 'LoadPlan':
+        plan = json.loads(data)
+        return cls(plan['relationships'], plan['fields'])
@@ -0,0 +1,148 @@
+from django.db.models import Manager, Model, QuerySet
+from django.db.models.query import ModelIterable
+from asgiref.sync import sync_to_async
+from itertools import islice
+from typing import Any, AsyncIterator, Iterable, Iterator, Mapping, Optional, Union
+from zen_queries import queries_dangerously_enabled
+from .cache_related import STREAM_CHUNK_SIZE, GraphLoad, RelatedObjectsCache
+
+
+class CacheRelatedQuerySet(QuerySet):
+    '''
+    A queryset whose `cache_related()` loads the related objects reachable
+    from its results with `RelatedObjectsCache.load_graph`, e.g.
+    `Alpha.objects.filter(number__gt=1).cache_related(depth=3)`.
+
+    It can be used as a model's manager (`CacheRelatedManager`), or
+    subclassed by a model's own queryset.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # the options of `load_graph`, if `cache_related()` was called:
+        self._cache_related: Optional[dict[str, Any]] = None
+
+    def cache_related(
+        self,
+        depth: Optional[int] = None,
+        include: Optional[Iterable[Union[str, type[Model]]]] = None,
+        fields: Optional[Mapping[Union[str, type[Model]], Iterable[str]]] = None,
+        workers: Optional[int] = None,
+    ) -> 'CacheRelatedQuerySet':
+        '''
+        Return a new queryset that, when evaluated, also fetches the related
+        objects reachable from its results, then caches and links them all
+        (see `RelatedObjectsCache.load_graph` for the options).
+
+        The rows are loaded into the cache active in the current thread or
+        asyncio task, if there is one. Otherwise they are loaded into a new
+        cache, which exits once they are linked: the instances keep their
+        related objects, as with `prefetch_related`, but deferred fields
+        and relationships that weren't loaded are queried as usual.
+
+        `iterator()` loads the related objects of each chunk of results
+        before yielding it, each into its own cache if none is active.
+        '''
+
+        if self._fields is not None:
+            raise TypeError('Cannot call cache_related() after .values() or .values_list()')
+
+        clone = self._chain()
+        clone._cache_related = {
+            'depth': depth,
+            'include': include,
+            'fields': fields,
+            'workers': workers,
+        }
+
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_related = self._cache_related
+        return clone
+
+    def _without_cache_related(self) -> QuerySet:
+        clone = self._chain()
+        clone._cache_related = None
+        return clone
+
+    def _is_cache_related(self) -> bool:
+        return self._cache_related is not None and issubclass(self._iterable_class, ModelIterable)
+
+    def _fetch_all(self):
+        if self._result_cache is not None or not self._is_cache_related():
+            return super()._fetch_all()
+
+        cache = RelatedObjectsCache.current()
+        if cache is not None:
+            self._result_cache = cache.load_graph(self._without_cache_related(), **self._cache_related)
+
+        else:
+            with RelatedObjectsCache() as cache:
+                self._result_cache = cache.load_graph(self._without_cache_related(), **self._cache_related)
+
+        # (related objects were prefetched along with the results)
+        self._prefetch_done = True
+
+    def iterator(self, chunk_size: Optional[int] = None) -> Iterator[Model]:
+        if not self._is_cache_related():
+            return super().iterator(chunk_size)
+
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError('Chunk size must be strictly positive.')
+
+        return (
+            instance
+            for chunk in self._iter_cache_related(chunk_size or STREAM_CHUNK_SIZE)
+            for instance in chunk
+        )
+
+    async def aiterator(self, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Model]:
+        if not self._is_cache_related():
+            async for instance in super().aiterator(chunk_size):
+                yield instance
+
+            return
+
+        chunks = self._iter_cache_related(chunk_size)
+        while chunk := await sync_to_async(next)(chunks, None):
+            for instance in chunk:
+                yield instance
+
+    def _iter_cache_related(self, chunk_size: int) -> Iterator[list[Model]]:
+        '''
+        The results, in chunks of up to `chunk_size`, each yielded once its
+        related objects are cached and linked
+        '''
+
+        queryset = self._without_cache_related()
+
+        cache = RelatedObjectsCache.current()
+        if cache is not None:
+            yield from cache.iter_graph(queryset, chunk_size, **self._cache_related)
+            return
+
+        # without an active cache, each chunk gets a cache of its own,
+        # so only one chunk's related objects are held at a time:
+        options = dict(self._cache_related)
+        workers = options.pop('workers')
+        rows = queryset.iterator(chunk_size=chunk_size)
+
+        while True:
+            with queries_dangerously_enabled():
+                chunk = list(islice(rows, chunk_size))
+
+            if not chunk:
+                return
+
+            with RelatedObjectsCache() as cache:
+                load = GraphLoad(cache, queryset, **options)
+                roots = load.add_roots(chunk)
+                cache._load_levels(load, workers)
+
+            yield roots
+
+
+CacheRelatedManager = Manager.from_queryset(CacheRelatedQuerySet)
@@ -0,0 +1,182 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import Model
+from functools import lru_cache
+from hashlib import md5
+from typing import Any, Iterable, Mapping, Optional, Union
+from weakref import WeakSet
+
+
+def get_model_fingerprint(model: type[Model]) -> str:
+    '''
+    A short hash of `model`'s concrete columns and their types, which
+    changes whenever rows stored for one version of the schema can no
+    longer be read by another
+    '''
+
+    columns = ','.join(
+        f'{f.attname}:{f.get_internal_type()}'
+        for f in model._meta.concrete_fields
+    )
+
+    return md5(f'{model._meta.label}({columns})'.encode()).hexdigest()[:12]
+
+
+class SharedTier:
+    '''
+    Shares the rows of slowly-changing reference models between every
+    `RelatedObjectsCache`, through one of the backends in `CACHES`,
+    so each new cache doesn't have to query them again.
+
+    `models` opts models in, as model classes or labels (`'core.Alpha'`),
+    either as a list using `timeout` for all of them, or as a dict of
+    each model's timeout in seconds.
+
+    Each model's rows are stored under its label, a version stamp that
+    `invalidate` bumps, and a fingerprint of its columns. Every tier
+    is invalidated whenever one of its models is saved or deleted, inside
+    a cache or not (see `invalidate_shared_models`).
+    '''
+
+    def __init__(
+        self,
+        models: Union[Iterable[Union[str, type[Model]]], Mapping[Union[str, type[Model]], Optional[int]]],
+        cache_alias: str = DEFAULT_CACHE_ALIAS,
+        timeout: Any = DEFAULT_TIMEOUT,
+        key_prefix: str = 'cache_related',
+    ):
+        if not isinstance(models, Mapping):
+            models = {m: timeout for m in models}
+
+        self.timeouts: dict[type[Model], Any] = {
+            apps.get_model(m) if isinstance(m, str) else m: t
+            for m, t in models.items()
+        }
+
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+
+        shared_tiers.add(self)
+
+    @classmethod
+    def from_settings(cls) -> Optional['SharedTier']:
+        '''
+        The shared tier configured in `settings.CACHE_RELATED_SHARED_TIER`, if any, e.g.:
+
+            CACHE_RELATED_SHARED_TIER = {
+                'CACHE': 'default',
+                'MODELS': {'core.Alpha': 3600, 'core.Delta': 600},
+            }
+        '''
+
+        config = getattr(settings, 'CACHE_RELATED_SHARED_TIER', None)
+        if not config:
+            return None
+
+        return cls(
+            models=config['MODELS'],
+            cache_alias=config.get('CACHE', DEFAULT_CACHE_ALIAS),
+            timeout=config.get('TIMEOUT', DEFAULT_TIMEOUT),
+            key_prefix=config.get('KEY_PREFIX', 'cache_related'),
+        )
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def models(self) -> list[type[Model]]:
+        return list(self.timeouts)
+
+    def __contains__(self, model: type[Model]) -> bool:
+        return model in self.timeouts
+
+    def get_field_names(self, model: type[Model]) -> list[str]:
+        '''
+        The columns stored for each row, in order
+        '''
+
+        return [f.attname for f in model._meta.concrete_fields]
+
+    def get_version(self, model: type[Model]) -> int:
+        key = f'{self.key_prefix}:{model._meta.label}:version'
+        self.cache.add(key, 1, None)
+        return self.cache.get(key, 1)
+
+    def get_key(self, model: type[Model]) -> str:
+        return f'{self.key_prefix}:{model._meta.label}:{self.get_version(model)}:{get_model_fingerprint(model)}'
+
+    def get_rows(self, model: type[Model], db: Optional[str] = None) -> list[tuple]:
+        '''
+        Every row of `model` (as tuples of `get_field_names`), from the shared
+        cache if it has them, otherwise from the database, storing them
+        in the shared cache for next time
+        '''
+
+        key = self.get_key(model)
+
+        rows = self.cache.get(key)
+        if rows is None:
+            rows = list(
+                model._base_manager
+                .using(db)
+                .values_list(*self.get_field_names(model))
+            )
+            self.cache.set(key, rows, self.timeouts[model])
+
+        return rows
+
+    def invalidate(self, model: type[Model]):
+        '''
+        Make every cache fetch `model`'s rows from the database again,
+        by bumping its version stamp
+        '''
+
+        key = f'{self.key_prefix}:{model._meta.label}:version'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 2, None)
+
+
+# every shared tier in use, kept current by `invalidate_shared_models`:
+shared_tiers: 'WeakSet[SharedTier]' = WeakSet()
+
+
+@lru_cache(maxsize=None)
+def get_settings_tier() -> Optional[SharedTier]:
+    '''
+    The shared tier configured in settings (see `SharedTier.from_settings`),
+    made once and used by every cache
+    '''
+
+    return SharedTier.from_settings()
+
+
+def clear_settings_tier(setting: str, **kwargs):
+    if setting == 'CACHE_RELATED_SHARED_TIER':
+        get_settings_tier.cache_clear()
+
+
+def invalidate_shared_models(sender: type[Model], **kwargs):
+    '''
+    Invalidate the saved or deleted model (and the multi-table inheritance
+    parents whose rows it wrote) in every shared tier holding it. Connected
+    for good when the app is ready, as the rows shared between caches go
+    stale whether or not one is active.
+    '''
+
+    get_settings_tier()
+
+    models = [sender._meta.concrete_model, *sender._meta.get_parent_list()]
+    invalidated = set()
+
+    for tier in list(shared_tiers):
+        for model in models:
+            # (tiers sharing a backend and prefix share their version stamps)
+            key = (tier.cache_alias, tier.key_prefix, model)
+            if model in tier and key not in invalidated:
+                tier.invalidate(model)
+                invalidated.add(key)
@@ -0,0 +1,242 @@
+from array import array
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Model
+from django.utils.duration import duration_string
+from typing import Any, Iterable, Mapping, NamedTuple, Sequence
+from .columnar import NULL_KEY, ColumnarModelStore, is_integer_key_field, is_key_field
+from .shared import get_model_fingerprint
+import base64
+import datetime
+import decimal
+import json
+import mmap
+import struct
+import sys
+import time
+import uuid
+
+
+MAGIC = b'CACHE_RELATED_SNAPSHOT\n'
+FORMAT_VERSION = 2
+
+# the offset and length of the header, at the very end of the file:
+TRAILER = struct.Struct('<QQ')
+
+# key columns are stored as native 64-bit integers, aligned so they can be
+# read straight from a memory map:
+ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotModel(NamedTuple):
+    '''
+    The rows of one model in a snapshot, column by column: key columns
+    as integer arrays (with `NULL_KEY` for NULL), others as lists
+    '''
+
+    model: type[Model]
+    db: str
+    field_names: list[str]
+    columns: dict[str, Sequence]
+    row_count: int
+
+
+def get_snapshot_model(model: type[Model], model_cache: Mapping[Any, Model]) -> SnapshotModel:
+    '''
+    The rows of `model` held by `model_cache`, either a column store or a
+    dict of instances (of which only the fields loaded on every instance
+    are kept)
+    '''
+
+    if isinstance(model_cache, ColumnarModelStore):
+        rows = list(model_cache.pk_index.values())
+
+        # rows that were removed are left out:
+        if len(rows) == model_cache.row_count:
+            columns = dict(model_cache.columns)
+        else:
+            columns = {
+                attname: array('q', (column[row] for row in rows)) if isinstance(column, (array, memoryview)) else [column[row] for row in rows]
+                for attname, column in model_cache.columns.items()
+            }
+
+        return SnapshotModel(model, model_cache.db, model_cache.field_names, columns, len(rows))
+
+    instances = list(model_cache.values())
+
+    fields = [
+        f
+        for f in model._meta.concrete_fields
+        if all(f.attname in instance.__dict__ for instance in instances)
+    ]
+
+    columns = {}
+    for f in fields:
+        values = [instance.__dict__[f.attname] for instance in instances]
+
+        if is_key_field(f) and is_integer_key_field(f):
+            columns[f.attname] = array('q', (NULL_KEY if value is None else value for value in values))
+        else:
+            columns[f.attname] = values
+
+    db = instances[0]._state.db if instances else DEFAULT_DB_ALIAS
+    return SnapshotModel(model, db or DEFAULT_DB_ALIAS, [f.attname for f in fields], columns, len(instances))
+
+
+def encode_value(value: Any) -> str:
+    '''
+    A value JSON can't hold as a string its field's `to_python` reads back
+    '''
+
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+
+    if isinstance(value, datetime.timedelta):
+        return duration_string(value)
+
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+
+    raise TypeError(f'{type(value).__name__} values can\'t be written to a snapshot')
+
+
+def encode_column(column: Sequence) -> tuple[bytes, bool]:
+    '''
+    `column` as JSON, and whether any of its values had to be encoded
+    (see `encode_value`)
+    '''
+
+    encoded = False
+
+    def default(value: Any) -> str:
+        nonlocal encoded
+        encoded = True
+        return encode_value(value)
+
+    return json.dumps(list(column), default=default).encode(), encoded
+
+
+def write_snapshot(path: str, models: Iterable[SnapshotModel]):
+    '''
+    Write `models` to a snapshot file at `path`: each column's data in
+    turn, then a JSON header describing where each column is, along with
+    each model's label and schema fingerprint and the time it was written.
+
+    Columns other than integer keys are written as JSON, rather than
+    pickled, so reading a snapshot can't run code. Values JSON can't
+    hold are encoded as strings, which must be read back by the `to_python`
+    of their field; those of any other type raise `SnapshotError`.
+    '''
+
+    header: dict[str, Any] = {
+        'format': FORMAT_VERSION,
+        'created': time.time(),
+        'byteorder': sys.byteorder,
+        'models': [],
+    }
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+
+        for m in models:
+            columns = {}
+
+            for attname, column in m.columns.items():
+                f.write(b'\0' * (-f.tell() % ALIGNMENT))
+                offset = f.tell()
+
+                if isinstance(column, (array, memoryview)):
+                    f.write(column)
+                    columns[attname] = {'kind': 'array', 'offset': offset, 'length': f.tell() - offset}
+
+                else:
+                    try:
+                        data, encoded = encode_column(column)
+                    except TypeError as e:
+                        raise SnapshotError(f'Cannot write {m.model._meta.label}.{attname}: {e}')
+
+                    f.write(data)
+                    columns[attname] = {'kind': 'json', 'encoded': encoded, 'offset': offset, 'length': len(data)}
+
+            header['models'].append({
+                'label': m.model._meta.label,
+                'fingerprint': get_model_fingerprint(m.model),
+                'db': m.db,
+                'field_names': m.field_names,
+                'rows': m.row_count,
+                'columns': columns,
+            })
+
+        header_offset = f.tell()
+        f.write(json.dumps(header).encode())
+        f.write(TRAILER.pack(header_offset, f.tell() - header_offset))
+
+
+def read_snapshot(path: str) -> tuple[dict[str, Any], list[SnapshotModel]]:
+    '''
+    Read the header and models of a snapshot file. Key columns are
+    memory-mapped rather than read into memory.
+
+    Raises `SnapshotError` if the file isn't a snapshot this version
+    can read, or if the schema of any of its models has changed.
+    '''
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError(f'{path} is not a cache snapshot')
+
+        # the map stays open for as long as the key columns read from it are used:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header_offset, header_length = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+    header = json.loads(data[header_offset:header_offset + header_length])
+
+    if header['format'] != FORMAT_VERSION or header['byteorder'] != sys.byteorder:
+        raise SnapshotError(f'{path} was written in an incompatible format')
+
+    models = []
+    for m in header['models']:
+        try:
+            model = apps.get_model(m['label'])
+        except LookupError:
+            raise SnapshotError(f'{path} contains {m["label"]}, which no longer exists')
+
+        if get_model_fingerprint(model) != m['fingerprint']:
+            raise SnapshotError(f'The schema of {m["label"]} has changed since {path} was written')
+
+        fields = {f.attname: f for f in model._meta.concrete_fields}
+
+        columns: dict[str, Sequence] = {}
+        for attname, column in m['columns'].items():
+            if column['kind'] == 'array':
+                columns[attname] = memoryview(data)[column['offset']:column['offset'] + column['length']].cast('q')
+                continue
+
+            values = json.loads(data[column['offset']:column['offset'] + column['length']])
+
+            # (values JSON can't hold were written as strings)
+            if column['encoded']:
+                to_python = fields[attname].to_python
+                values = [None if value is None else to_python(value) for value in values]
+
+            columns[attname] = values
+
+        models.append(SnapshotModel(model, m['db'], m['field_names'], columns, m['rows']))
+
+    return header, models
+
+
+def get_row_values(columns: dict[str, Sequence], field_names: list[str], row: int) -> list:
+    values = []
+    for attname in field_names:
+        value = columns[attname][row]
+        values.append(None if isinstance(columns[attname], memoryview) and value == NULL_KEY else value)
+
+    return values
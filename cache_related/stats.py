@@ -0,0 +1,118 @@
+from array import array
+from django.db.models import Model
+from sys import getsizeof
+from typing import Any, Mapping
+from .columnar import ColumnarModelStore
+import logging
+
+
+logger = logging.getLogger('cache_related')
+
+# how many instances of each model are measured to estimate its size:
+SIZE_SAMPLE = 100
+
+
+class CacheStats:
+    '''
+    Counters and timings collected by a `RelatedObjectsCache` while it's
+    active, keyed by model key or by `RelationshipTracker`
+    '''
+
+    def __init__(self):
+        # copies of already cached objects merged into them:
+        self.duplicates: dict[str, int] = {}
+
+        # objects evicted to stay within the cache's limits:
+        self.evictions: dict[str, int] = {}
+
+        # batched queries issued for the deferred fields of each model:
+        self.deferred_loads: dict[str, int] = {}
+
+        # seconds spent adding instances (and the related objects
+        # selected/prefetched from them) to the cache:
+        self.ingest_time = 0.0
+
+        # seconds spent linking each relationship:
+        self.link_time: dict[Any, float] = {}
+
+        # relationships looked up in the cache that it did / didn't have
+        # related objects for (misses fall through to the database):
+        self.hits: dict[Any, int] = {}
+        self.misses: dict[Any, int] = {}
+
+        # batched queries issued for the misses of each relationship:
+        self.fallbacks: dict[Any, int] = {}
+
+    def record_duplicate(self, model_key: str):
+        self.duplicates[model_key] = self.duplicates.get(model_key, 0) + 1
+
+    def record_eviction(self, model_key: str):
+        self.evictions[model_key] = self.evictions.get(model_key, 0) + 1
+
+    def record_deferred_load(self, model_key: str):
+        self.deferred_loads[model_key] = self.deferred_loads.get(model_key, 0) + 1
+
+    def record_link_time(self, relationship: Any, seconds: float):
+        self.link_time[relationship] = self.link_time.get(relationship, 0.0) + seconds
+
+    def record_lookup(self, relationship: Any, found: bool):
+        counts = self.hits if found else self.misses
+        counts[relationship] = counts.get(relationship, 0) + 1
+
+    def record_fallback(self, relationship: Any):
+        self.fallbacks[relationship] = self.fallbacks.get(relationship, 0) + 1
+
+    def clear(self):
+        self.duplicates.clear()
+        self.evictions.clear()
+        self.deferred_loads.clear()
+        self.ingest_time = 0.0
+        self.link_time.clear()
+        self.hits.clear()
+        self.misses.clear()
+        self.fallbacks.clear()
+
+
+def get_model_size(model_cache: Mapping[Any, Model]) -> int:
+    '''
+    The approximate number of bytes held by one model's cached rows,
+    estimated from a sample of them. Related objects aren't counted,
+    since they are measured with their own model.
+    '''
+
+    if isinstance(model_cache, ColumnarModelStore):
+        size = getsizeof(model_cache.pk_index)
+
+        for column in model_cache.columns.values():
+            if isinstance(column, array):
+                size += getsizeof(column)
+            else:
+                size += getsizeof(column) + _estimate(column, getsizeof)
+
+        return size + _estimate(list(model_cache.instances.values()), get_instance_size)
+
+    return getsizeof(model_cache) + _estimate(list(model_cache.values()), get_instance_size)
+
+
+def get_instance_size(instance: Model) -> int:
+    return (
+        getsizeof(instance)
+        + getsizeof(instance.__dict__)
+        + sum(getsizeof(v) for k, v in instance.__dict__.items() if k != '_state')
+    )
+
+
+def _estimate(values: list, size) -> int:
+    if not values:
+        return 0
+
+    sample = values[::max(1, len(values) // SIZE_SAMPLE)]
+    return sum(size(v) for v in sample) * len(values) // len(sample)
+
+
+def log_stats(stats: dict):
+    '''
+    A stats hook that logs the stats to the `cache_related` logger
+    '''
+
+    logger.info('RelatedObjectsCache stats: %s', stats)
@@ -1,3 +1,972 @@
-from django.test import TestCase
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, models
+from django.db.models.fields.related_descriptors import ReverseManyToOneDescriptor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from decimal import Decimal
+from io import StringIO
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest.mock import Mock, patch
+from asgiref.sync import async_to_sync
+from zen_queries import queries_dangerously_enabled, queries_disabled
+from core.models import Alpha, Bravo, Charlie, Delta, Echo, Foxtrot, Note, Place, PlaceProxy, Restaurant
+from users.models import Place as UserPlace, User
+from .cache_related import (
+    BATCH_MISSES,
+    BREADTH_FIRST,
+    COLUMNAR_STORAGE,
+    INSTANCE_STORAGE,
+    RelatedObjectsCache,
+    get_relationship_plan,
+)
+from .eviction import EvictionPolicy
+from .plan import LoadPlan
+from .query import CacheRelatedQuerySet
+from .shared import SharedTier
+from .snapshot import encode_value
+import datetime
+import json
+import os
+import threading
+import uuid
 
-# Create your tests here.
+
+def create_graph(alphas: int = 3, fanout: int = 2):
+    '''
+    `alphas` alphas, each with `fanout` bravos of `fanout` charlies each.
+    The first charlie of each alpha has a delta, with `fanout` echoes
+    and a foxtrot.
+    '''
+
+    for a in range(alphas):
+        alpha = Alpha.objects.create(number=a)
+
+        for b in range(fanout):
+            bravo = Bravo.objects.create(alpha=alpha, number=b)
+
+            for c in range(fanout):
+                charlie = Charlie.objects.create(bravo=bravo, number=c)
+
+                if b == 0 and c == 0:
+                    delta = Delta.objects.create(alpha=alpha, charlie=charlie, number=1)
+                    Foxtrot.objects.create(delta=delta, number=2)
+
+                    for e in range(fanout):
+                        Echo.objects.create(delta=delta, number=e)
+
+
+class GraphTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_graph()
+
+    def expected_values(self) -> list[int]:
+        return [a.value() for a in Alpha.objects.order_by('pk')]
+
+    def assert_linked(self, alpha: Alpha):
+        '''
+        Assert that the related objects of the first alpha are linked to it
+        (without telling which relationships are empty)
+        '''
+
+        self.assertEqual(sorted(c.number for b in alpha.bravos.all() for c in b.charlies.all()), [0, 0, 1, 1])
+        self.assertEqual(alpha.delta.value(), 4)
+        self.assertIs(alpha.delta.alpha, alpha)
+        self.assertIs(alpha.delta.charlie.bravo.alpha, alpha)
+
+
+def get_all_rows() -> list[list]:
+    return [
+        list(model.objects.all())
+        for model in (Alpha, Bravo, Charlie, Delta, Echo, Foxtrot)
+    ]
+
+
+class LinkingTests(GraphTestCase):
+
+    def test_cached_rows_are_linked_to_each_other(self):
+        for options in ({}, {'traversal': BREADTH_FIRST}, {'lazy': True}):
+            with self.subTest(**options), queries_disabled(), RelatedObjectsCache(**options) as cache:
+                with queries_dangerously_enabled():
+                    rows = get_all_rows()
+
+                cache.cache_results(*rows)
+
+                self.assert_linked(min(rows[0], key=lambda a: a.pk))
+
+    def test_later_passes_are_linked_to_earlier_ones(self):
+        with RelatedObjectsCache() as cache:
+            alphas = list(Alpha.objects.order_by('pk'))
+            cache.cache_results(alphas)
+            cache.cache_results(Bravo.objects.all())
+
+            with self.assertNumQueries(0):
+                self.assertEqual([len(a.bravos.all()) for a in alphas], [2, 2, 2])
+                self.assertIs(alphas[0].bravos.all()[0].alpha, alphas[0])
+
+    def test_linking_a_page_doesnt_slow_down_as_the_cache_grows(self):
+        alpha = Alpha.objects.create(number=9)
+        Bravo.objects.bulk_create(Bravo(alpha=alpha, number=n) for n in range(4000))
+        bravos = list(Bravo.objects.filter(alpha=alpha).order_by('pk'))
+        pages = [bravos[i:i + 200] for i in range(0, len(bravos), 200)]
+
+        with RelatedObjectsCache() as cache:
+            cache.cache_results(alpha)
+
+            timings = []
+            for page in pages:
+                started = perf_counter()
+                cache.cache_results(page)
+                timings.append(perf_counter() - started)
+
+            self.assertEqual(len(alpha.bravos.all()), 4000)
+
+        # (the fastest of the first and last few pages, to smooth out noise)
+        self.assertLess(min(timings[-3:]), min(timings[:3]) * 5)
+
+    def test_selected_objects_are_cached_up_to_max_depth(self):
+        with RelatedObjectsCache(max_depth=1) as cache:
+            cache.cache_results(Echo.objects.select_related('delta__charlie'))
+
+            self.assertEqual(set(cache.cache), {'core.Echo', 'core.Delta'})
+
+    def test_relationship_plans_are_compiled_once_per_model(self):
+        self.assertIs(get_relationship_plan(Alpha), get_relationship_plan(Alpha))
+        self.assertEqual(
+            {r.accessor for r in get_relationship_plan(Alpha)},
+            {'bravos', 'delta'},
+        )
+
+
+class IdentityMapTests(GraphTestCase):
+
+    def test_copies_are_merged_into_the_cached_instance(self):
+        with RelatedObjectsCache() as cache:
+            first = list(Alpha.objects.order_by('pk'))
+            second = list(Alpha.objects.order_by('pk'))
+            cache.cache_results(first, second, Bravo.objects.all())
+
+            self.assertEqual(cache.get_stats()['models']['core.Alpha']['duplicates'], 3)
+            self.assertIs(first[0].bravos.all()[0].alpha, first[0])
+
+    def test_load_graph_keeps_roots_evicted_as_they_are_stored(self):
+        with RelatedObjectsCache(eviction=EvictionPolicy(max_instances_per_model=2)) as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+
+        self.assertEqual([a.number for a in alphas], [0, 1, 2])
+
+
+class LoadGraphTests(GraphTestCase):
+
+    def test_one_query_per_relationship_column(self):
+        with RelatedObjectsCache() as cache:
+            # (deltas are fetched again by charlie, a column they weren't fetched by)
+            with self.assertNumQueries(7):
+                alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+
+            self.assertEqual({k: len(v) for k, v in cache.cache.items()}, {
+                'core.Alpha': 3,
+                'core.Bravo': 6,
+                'core.Charlie': 12,
+                'core.Delta': 3,
+                'core.Echo': 6,
+                'core.Foxtrot': 3,
+            })
+
+            with self.assertNumQueries(0):
+                self.assertIs(alphas[0].delta.foxtrot.delta.alpha, alphas[0])
+
+    def test_depth_and_include_limit_what_is_loaded(self):
+        with RelatedObjectsCache() as cache:
+            cache.load_graph(Alpha.objects.all(), depth=1)
+            self.assertEqual(set(cache.cache), {'core.Alpha', 'core.Bravo', 'core.Delta'})
+
+        with RelatedObjectsCache() as cache:
+            cache.load_graph(Alpha.objects.all(), include=[Bravo, 'core.Charlie'])
+            self.assertEqual(set(cache.cache), {'core.Alpha', 'core.Bravo', 'core.Charlie'})
+
+    def test_chunks_fit_the_parameter_limit(self):
+        with patch.object(type(connection.features), 'max_query_params', 2), RelatedObjectsCache() as cache:
+            # (alphas, then bravos and deltas by alpha, charlies by bravo and
+            # by pk, echoes and foxtrots by delta, and deltas by charlie)
+            with self.assertNumQueries(1 + 2 + 2 + 3 + 2 + 2 + 2 + 6):
+                alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+
+            self.assertEqual(len(cache.cache['core.Charlie']), 12)
+            self.assertEqual(len(alphas), 3)
+
+    def test_fields_outside_the_plan_are_deferred(self):
+        with RelatedObjectsCache() as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'), fields={Charlie: ['number']})
+
+            with self.assertNumQueries(0):
+                self.assertEqual(sum(c.number for b in alphas[0].bravos.all() for c in b.charlies.all()), 2)
+
+            # each deferred field is loaded for every cached row at once:
+            with self.assertNumQueries(1):
+                self.assertEqual([a.number for a in alphas], [0, 1, 2])
+
+    def test_relationships_found_empty_are_read_without_queries(self):
+        expected = self.expected_values()
+
+        for options in ({}, {'lazy': True}, {'storage': COLUMNAR_STORAGE}, {'miss_policy': BATCH_MISSES}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertEqual([a.value() for a in alphas], expected)
+
+                    charlie = alphas[0].bravos.all()[1].charlies.all()[0]
+                    with self.assertRaises(Delta.DoesNotExist):
+                        charlie.delta
+
+    def test_relationships_to_shared_models_are_read_without_queries(self):
+        tier = SharedTier([Delta], key_prefix='tests')
+        tier.invalidate(Delta)
+
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(shared_tier=tier, **options) as cache:
+                charlies = list(Charlie.objects.order_by('pk'))
+                cache.cache_results(charlies)
+
+                with self.assertNumQueries(0):
+                    self.assertEqual(charlies[0].delta.number, 1)
+                    with self.assertRaises(Delta.DoesNotExist):
+                        charlies[1].delta
+
+
+class ParallelLoadTests(TransactionTestCase):
+    # (workers aren't used inside a transaction, which they couldn't see)
+
+    def setUp(self):
+        create_graph()
+
+    def test_levels_are_fetched_by_workers(self):
+        expected = [a.value() for a in Alpha.objects.order_by('pk')]
+        fetch_in_thread = RelatedObjectsCache._fetch_in_thread
+        threads = []
+
+        def record_thread(*args):
+            threads.append(threading.current_thread().name)
+            return fetch_in_thread(*args)
+
+        with patch.object(RelatedObjectsCache, '_fetch_in_thread', side_effect=record_thread), \
+                RelatedObjectsCache() as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'), workers=4)
+
+            with self.assertNumQueries(0):
+                self.assertEqual([a.value() for a in alphas], expected)
+
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('cache_related') for name in threads))
+
+    def test_worker_connections_are_closed_once(self):
+        with patch.object(type(connections['default']), 'close', autospec=True) as close, \
+                RelatedObjectsCache() as cache:
+            cache.load_graph(Alpha.objects.order_by('pk'), workers=2, chunk_size=1)
+
+        closed = [call.args[0] for call in close.call_args_list]
+        self.assertTrue(closed)
+        self.assertLessEqual(len(closed), 2)
+        self.assertEqual(len(set(closed)), len(closed))
+        self.assertNotIn(connections['default'], closed)
+
+
+class ManyToManyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = [Group.objects.create(name=f'g{i}') for i in range(3)]
+        for i in range(3):
+            User.objects.create(username=f'u{i}').groups.set(groups[:i + 1])
+
+    def test_edges_are_fetched_in_one_query(self):
+        users = list(User.objects.order_by('pk'))
+        groups = list(Group.objects.all())
+
+        with RelatedObjectsCache() as cache:
+            with self.assertNumQueries(1):
+                cache.cache_results(users, groups)
+
+            with self.assertNumQueries(0):
+                self.assertEqual([len(u.groups.all()) for u in users], [1, 2, 3])
+                self.assertEqual(sorted(len(g.user_set.all()) for g in groups), [1, 2, 3])
+
+    def test_edges_matching_both_ends_are_added_once(self):
+        # (with 6 keys and 4 parameters per query, edges are fetched once per end)
+        with patch.object(type(connection.features), 'max_query_params', 4), \
+                queries_disabled(), RelatedObjectsCache() as cache:
+
+            with queries_dangerously_enabled():
+                users = list(User.objects.order_by('pk'))
+                groups = list(Group.objects.all())
+
+            cache.cache_results(users, groups)
+
+            self.assertEqual(
+                [sorted(g.name for g in u.groups.all()) for u in users],
+                [['g0'], ['g0', 'g1'], ['g0', 'g1', 'g2']],
+            )
+            self.assertEqual(sorted(u.username for u in groups[0].user_set.all()), ['u0', 'u1', 'u2'])
+
+    def test_changes_through_a_copy_reach_the_cached_instance(self):
+        for options in ({}, {'lazy': True}, {'miss_policy': BATCH_MISSES}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                users = list(User.objects.order_by('pk'))
+                cache.cache_results(users, Group.objects.all())
+                self.assertTrue(users[0].groups.all())
+
+                copy = User.objects.get(pk=users[0].pk)
+                if Group.objects.filter(user=copy, name='g2').exists():
+                    copy.groups.remove(Group.objects.get(name='g2'))
+                else:
+                    copy.groups.add(Group.objects.get(name='g2'))
+
+                self.assertEqual(
+                    sorted(g.name for g in users[0].groups.all()),
+                    sorted(g.name for g in Group.objects.filter(user=copy)),
+                )
+
+
+class GenericRelationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        places = [Place.objects.create(name=f'p{i}') for i in range(3)]
+        Note.objects.create(target=places[0], text='a')
+        Note.objects.create(target=places[0], text='b')
+        Note.objects.create(target=places[1], text='c')
+
+        # (pointing to a place that doesn't exist)
+        Note.objects.create(content_type=ContentType.objects.get_for_model(Place), object_id=999, text='d')
+
+    def setUp(self):
+        # (content types are looked up from Django's cache)
+        ContentType.objects.get_for_models(Place, Note)
+
+    def test_load_graph_links_and_marks_generic_relationships(self):
+        for options in ({}, {'lazy': True}, {'storage': COLUMNAR_STORAGE}, {'miss_policy': BATCH_MISSES}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                # (places, their notes, and the restaurants they might be)
+                with self.assertNumQueries(3):
+                    places = cache.load_graph(Place.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertEqual([sorted(n.text for n in p.notes.all()) for p in places], [['a', 'b'], ['c'], []])
+                    self.assertIs(places[0].notes.all()[0].target, places[0])
+
+                # the content types are found in Django's cache instead:
+                self.assertEqual(set(cache.cache), {'core.Place', 'core.Note', 'core.Restaurant'})
+
+    def test_load_graph_marks_generic_foreign_keys_to_missing_objects(self):
+        for options in ({}, {'lazy': True}, {'storage': COLUMNAR_STORAGE}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                notes = cache.load_graph(Note.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertEqual([n.target and n.target.name for n in notes], ['p0', 'p0', 'p1', None])
+
+    def test_misses_are_fetched_for_every_cached_instance_at_once(self):
+        with RelatedObjectsCache(miss_policy=BATCH_MISSES) as cache:
+            places = list(Place.objects.order_by('pk'))
+            cache.cache_results(places)
+
+            with self.assertNumQueries(1):
+                self.assertEqual([len(p.notes.all()) for p in places], [2, 1, 0])
+
+            with self.assertNumQueries(0):
+                self.assertIs(places[1].notes.all()[0].target, places[1])
+
+    def test_saved_and_deleted_instances_are_relinked(self):
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                places = cache.load_graph(Place.objects.order_by('pk'))
+
+                note = Note.objects.create(target=places[2], text='e')
+                self.assertEqual([n.text for n in places[2].notes.all()], ['e'])
+
+                note.target = places[1]
+                note.save()
+                self.assertEqual(places[2].notes.all(), [])
+                self.assertEqual(sorted(n.text for n in places[1].notes.all()), ['c', 'e'])
+
+                note.delete()
+                self.assertEqual([n.text for n in places[1].notes.all()], ['c'])
+
+
+class InheritanceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        park = Place.objects.create(name='park')
+        diner = Restaurant.objects.create(name='diner', serves_pizza=True)
+        Place.objects.create(name='square')
+        Note.objects.create(target=park, text='a')
+        Note.objects.create(target=diner, text='b')
+
+        user = User.objects.create(username='user')
+        UserPlace.objects.create(user=user, name='home')
+
+    def setUp(self):
+        # (content types are looked up from Django's cache)
+        ContentType.objects.get_for_models(Place, PlaceProxy, Restaurant, Note)
+
+    def test_children_and_parents_share_one_row(self):
+        for options in ({}, {'lazy': True}, {'storage': COLUMNAR_STORAGE}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                restaurants = cache.load_graph(Restaurant.objects.all())
+
+                # (only the other places' restaurants are looked for)
+                with self.assertNumQueries(3):
+                    places = cache.load_graph(Place.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertIs(places[1], restaurants[0])
+                    self.assertTrue(places[1].serves_pizza)
+                    self.assertIs(places[1].notes.all()[0].target, restaurants[0])
+
+                self.assertEqual(len(cache.cache['core.Place']), 3)
+
+    def test_parents_cached_before_their_children_are_replaced_by_them(self):
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                places = cache.load_graph(Place.objects.order_by('pk'))
+                restaurant = cache.cache['core.Restaurant'][places[1].pk]
+
+                self.assertIs(cache.cache['core.Place'][places[1].pk], restaurant)
+
+                with self.assertNumQueries(0):
+                    self.assertIs(places[1].restaurant, restaurant)
+                    self.assertIs(restaurant.place_ptr, restaurant)
+                    self.assertEqual([n.text for n in restaurant.notes.all()], ['b'])
+
+    def test_generic_foreign_keys_to_a_parent_get_an_instance_of_the_parent(self):
+        # (a note on the diner as a place)
+        Note.objects.create(target=Place.objects.get(name='diner'), text='c')
+
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                notes = cache.load_graph(Note.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertIsInstance(notes[1].target, Restaurant)
+                    self.assertIs(type(notes[2].target), Place)
+                    self.assertEqual(notes[2].target.name, 'diner')
+                    self.assertIs(cache.cache['core.Place'][notes[2].target.pk], notes[1].target)
+
+    def test_proxies_are_found_in_their_concrete_models_index(self):
+        for options in ({}, {'lazy': True}, {'storage': COLUMNAR_STORAGE}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                places = cache.load_graph(PlaceProxy.objects.order_by('pk'))
+                self.assertNotIn('core.PlaceProxy', cache.cache)
+
+                # the notes' places are found without fetching them again:
+                with self.assertNumQueries(1):
+                    notes = cache.load_graph(Note.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertEqual([n.target.name for n in notes], ['park', 'diner'])
+                    self.assertIs(notes[0].target, places[0])
+                    self.assertIs(notes[1].target, cache.cache['core.Restaurant'][places[1].pk])
+
+    def test_proxy_roots_dont_query_for_empty_notes(self):
+        for options in ({}, {'lazy': True}, {'storage': COLUMNAR_STORAGE}, {'miss_policy': BATCH_MISSES}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                places = cache.load_graph(PlaceProxy.objects.order_by('pk'))
+
+                with self.assertNumQueries(0):
+                    self.assertEqual([[n.text for n in p.notes.all()] for p in places], [['a'], [], []])
+
+    def test_aload_graph_doesnt_fetch_the_rows_of_children_again(self):
+        # (a note on the diner as a place, whose row is fetched with the restaurant)
+        Note.objects.create(target=Place.objects.get(name='diner'), text='c')
+
+        with CaptureQueriesContext(connection) as queries, RelatedObjectsCache() as cache:
+            cache.load_graph(Note.objects.order_by('pk'))
+
+        with CaptureQueriesContext(connection) as async_queries, RelatedObjectsCache() as cache:
+            async_to_sync(cache.aload_graph)(Note.objects.order_by('pk'))
+
+        # (but for the content types, which can't be looked up from the event loop)
+        self.assertEqual(
+            [q['sql'] for q in async_queries if 'django_content_type' not in q['sql']],
+            [q['sql'] for q in queries],
+        )
+
+    def test_models_with_the_same_name_in_two_apps_are_kept_apart(self):
+        with RelatedObjectsCache() as cache:
+            users = cache.load_graph(User.objects.all())
+            places = cache.load_graph(Place.objects.order_by('pk'))
+
+            with self.assertNumQueries(0):
+                self.assertEqual([p.name for p in users[0].places.all()], ['home'])
+                self.assertEqual([p.name for p in places], ['park', 'diner', 'square'])
+
+            self.assertEqual(len(cache.cache['users.Place']), 1)
+            self.assertEqual(len(cache.cache['core.Place']), 3)
+
+
+class LazyTests(GraphTestCase):
+
+    def test_relationships_are_linked_when_read(self):
+        with RelatedObjectsCache(lazy=True) as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+            self.assertNotIn('bravos', getattr(alphas[0], '_prefetched_objects_cache', {}))
+
+            with self.assertNumQueries(0):
+                self.assertEqual(len(alphas[0].bravos.all()), 2)
+
+            self.assertIn('bravos', alphas[0]._prefetched_objects_cache)
+
+        # the descriptors are restored on exit:
+        self.assertIsInstance(Alpha.__dict__['bravos'], ReverseManyToOneDescriptor)
+
+
+class ScopingTests(GraphTestCase):
+
+    def test_caches_are_released_on_exit(self):
+        self.assertIsNone(RelatedObjectsCache.current())
+
+        with RelatedObjectsCache() as cache:
+            self.assertIs(RelatedObjectsCache.current(), cache)
+            cache.load_graph(Alpha.objects.all())
+
+        self.assertIsNone(RelatedObjectsCache.current())
+        self.assertEqual(cache.cache, {})
+        self.assertEqual(cache.indexes, {})
+
+    def test_nested_caches_fall_back_to_their_parent(self):
+        with RelatedObjectsCache() as outer:
+            outer.cache_results(Bravo.objects.all())
+
+            with RelatedObjectsCache(fallback_to_parent=True) as inner:
+                alphas = list(Alpha.objects.order_by('pk'))
+                inner.cache_results(alphas)
+
+                with self.assertNumQueries(0):
+                    self.assertEqual([len(a.bravos.all()) for a in alphas], [2, 2, 2])
+
+                self.assertNotIn('core.Bravo', inner.cache)
+
+            self.assertIs(RelatedObjectsCache.current(), outer)
+
+
+class ColumnarStorageTests(GraphTestCase):
+
+    def test_instances_are_built_for_the_rows_read(self):
+        with RelatedObjectsCache(storage=COLUMNAR_STORAGE) as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+
+            store = cache.cache['core.Charlie']
+            self.assertEqual(store.row_count, 12)
+            self.assertEqual(len(store.instances), 0)
+
+            with self.assertNumQueries(0):
+                charlies = alphas[0].bravos.all()[0].charlies.all()
+
+            self.assertEqual(sorted(c.number for c in charlies), [0, 1])
+            self.assertEqual(len(store.instances), 2)
+
+
+class SharedTierTests(GraphTestCase):
+
+    def test_shared_models_are_loaded_once_for_every_cache(self):
+        tier = SharedTier([Delta, 'core.Foxtrot'], key_prefix='tests')
+        tier.invalidate(Delta)
+        tier.invalidate(Foxtrot)
+
+        with self.assertNumQueries(2), RelatedObjectsCache(shared_tier=tier):
+            pass
+
+        with self.assertNumQueries(0), RelatedObjectsCache(shared_tier=tier) as cache:
+            self.assertEqual(len(cache.cache['core.Delta']), 3)
+            self.assertEqual(len(cache.cache['core.Foxtrot']), 3)
+
+        # the graph's shared models aren't fetched again:
+        with RelatedObjectsCache(shared_tier=tier) as cache, self.assertNumQueries(4):
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+
+        self.assertEqual(alphas[0].delta.foxtrot.number, 2)
+
+    def test_writes_outside_a_cache_invalidate_shared_models(self):
+        tier = SharedTier([Delta], key_prefix='tests')
+        tier.invalidate(Delta)
+
+        with RelatedObjectsCache(shared_tier=tier):
+            pass
+
+        delta = Delta.objects.order_by('pk').first()
+        delta.number = 5
+        delta.save()
+
+        with self.assertNumQueries(1), RelatedObjectsCache(shared_tier=tier) as cache:
+            self.assertEqual(cache.cache['core.Delta'][delta.pk].number, 5)
+
+        Foxtrot.objects.filter(delta=delta).delete()
+        delta.delete()
+
+        with self.assertNumQueries(1), RelatedObjectsCache(shared_tier=tier) as cache:
+            self.assertNotIn(delta.pk, cache.cache['core.Delta'])
+
+
+class SignalTests(GraphTestCase):
+
+    def test_created_instances_are_linked_without_unlinking_anything(self):
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                alpha = cache.load_graph(Alpha.objects.order_by('pk'))[0]
+                count = len(alpha.bravos.all())
+
+                with patch.object(RelatedObjectsCache, '_remove_related_data') as remove:
+                    bravo = Bravo.objects.create(alpha=alpha, number=9)
+
+                remove.assert_not_called()
+                self.assertIn(bravo, alpha.bravos.all())
+                self.assertEqual(len(alpha.bravos.all()), count + 1)
+
+    def test_moved_instances_are_relinked(self):
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                first, second = cache.load_graph(Alpha.objects.order_by('pk'))[:2]
+                bravo = first.bravos.all()[0]
+                self.assertIs(bravo.alpha, first)
+
+                Bravo.objects.filter(pk=bravo.pk).update(alpha=second)
+                copy = Bravo.objects.get(pk=bravo.pk)
+                copy.save()
+
+                self.assertIs(bravo.alpha, second)
+                self.assertNotIn(bravo, first.bravos.all())
+                self.assertIn(bravo, second.bravos.all())
+
+                copy.alpha = first
+                copy.save()
+
+    def test_saves_only_unlink_what_they_changed(self):
+        for options in ({}, {'lazy': True}):
+            with self.subTest(**options), RelatedObjectsCache(**options) as cache:
+                first, second = cache.load_graph(Alpha.objects.order_by('pk'))[:2]
+
+                with patch.object(RelatedObjectsCache, '_remove_related_data') as remove:
+                    first.save()
+
+                remove.assert_not_called()
+
+                bravo = first.bravos.all()[0]
+                self.assertIs(bravo.alpha, first)
+
+                # a moved instance is only taken out of its old related instances:
+                with patch.object(RelatedObjectsCache, '_get_materialized_instances') as scan:
+                    bravo.alpha = second
+                    bravo.save()
+
+                scan.assert_not_called()
+                self.assertNotIn(bravo, first.bravos.all())
+                self.assertIn(bravo, second.bravos.all())
+
+    def test_writes_in_nested_caches_reach_the_enclosing_ones(self):
+        for options in ({}, {'fallback_to_parent': True}):
+            with self.subTest(**options), RelatedObjectsCache() as outer:
+                alpha = outer.load_graph(Alpha.objects.order_by('pk'))[0]
+
+                with RelatedObjectsCache(**options):
+                    bravo = Bravo.objects.create(alpha=alpha, number=9)
+
+                self.assertIn(bravo, alpha.bravos.all())
+                self.assertEqual(len(alpha.bravos.all()), Bravo.objects.filter(alpha=alpha).count())
+
+                with RelatedObjectsCache(**options):
+                    Bravo.objects.get(pk=bravo.pk).delete()
+
+                self.assertNotIn(bravo.pk, outer.cache['core.Bravo'])
+                self.assertEqual(len(alpha.bravos.all()), 2)
+
+    def test_deleted_instances_are_unlinked(self):
+        with RelatedObjectsCache() as cache:
+            alpha = cache.load_graph(Alpha.objects.order_by('pk'))[0]
+            bravo = alpha.bravos.all()[0]
+
+            Bravo.objects.get(pk=bravo.pk).delete()
+
+            self.assertNotIn(bravo.pk, cache.cache['core.Bravo'])
+            self.assertEqual([b.number for b in alpha.bravos.all()], [1])
+
+
+class AsyncTests(GraphTestCase):
+
+    async def test_aload_graph(self):
+        async with RelatedObjectsCache() as cache:
+            self.assertIs(RelatedObjectsCache.current(), cache)
+            alphas = await cache.aload_graph(Alpha.objects.order_by('pk'))
+
+            with queries_disabled():
+                self.assertEqual([len(a.bravos.all()) for a in alphas], [2, 2, 2])
+                self.assertEqual(alphas[0].delta.foxtrot.number, 2)
+
+    async def test_acache_results(self):
+        async with RelatedObjectsCache() as cache:
+            await cache.acache_results(Alpha.objects.all(), Bravo.objects.all(), chunk_size=2)
+
+            with queries_disabled():
+                alphas = list(cache.cache['core.Alpha'].values())
+                self.assertEqual([len(a.bravos.all()) for a in alphas], [2, 2, 2])
+
+
+class StatsTests(GraphTestCase):
+
+    def test_hits_and_misses_are_counted_and_published_on_exit(self):
+        hook = Mock()
+
+        with RelatedObjectsCache(lazy=True, stats_hook=hook) as cache:
+            cache.cache_results(Alpha.objects.all(), Bravo.objects.all())
+            for bravo in cache.cache['core.Bravo'].values():
+                bravo.alpha.bravos.all()
+                bravo.charlies.all()
+
+            hook.assert_not_called()
+
+        stats = hook.call_args.args[0]
+        self.assertEqual(stats['models']['core.Bravo']['objects'], 6)
+        self.assertEqual(stats['relationships']['core.Alpha.bravos']['hits'], 3)
+        self.assertEqual(stats['relationships']['core.Bravo.charlies']['misses'], 6)
+        self.assertGreater(stats['models']['core.Alpha']['bytes'], 0)
+
+
+class BatchMissTests(GraphTestCase):
+
+    def test_misses_are_fetched_for_every_cached_instance_at_once(self):
+        with RelatedObjectsCache(miss_policy=BATCH_MISSES) as cache:
+            bravos = list(Bravo.objects.all())
+            cache.cache_results(bravos)
+
+            with self.assertNumQueries(1):
+                self.assertEqual(sum(len(b.charlies.all()) for b in bravos), 12)
+
+            # charlies without a delta are known to have none:
+            with self.assertNumQueries(1):
+                self.assertEqual(sum(hasattr(c, 'delta') for b in bravos for c in b.charlies.all()), 3)
+
+            self.assertEqual(cache.get_stats()['relationships']['core.Bravo.charlies']['fallbacks'], 1)
+
+
+class EvictionTests(GraphTestCase):
+
+    def test_least_recently_used_instances_are_evicted(self):
+        with RelatedObjectsCache(lazy=True, eviction=EvictionPolicy(max_instances_per_model=2)) as cache:
+            alphas = list(Alpha.objects.order_by('pk'))
+            cache.cache_results(alphas[:2])
+            alphas[0].bravos.all()
+            cache.cache_results(alphas[2])
+
+            self.assertEqual(sorted(cache.cache['core.Alpha']), [alphas[0].pk, alphas[2].pk])
+            self.assertEqual(cache.get_stats()['models']['core.Alpha']['evictions'], 1)
+
+    def test_evicted_instances_are_unlinked(self):
+        with RelatedObjectsCache(eviction=EvictionPolicy(max_instances_per_model={Bravo: 5})) as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'), include=[Bravo])
+
+            # the alpha that lost a bravo reads them from the database again:
+            with self.assertNumQueries(1):
+                self.assertEqual([len(a.bravos.all()) for a in alphas], [2, 2, 2])
+
+    def test_columnar_stores_reclaim_evicted_rows(self):
+        eviction = EvictionPolicy(max_instances_per_model={'core.Charlie': 2})
+
+        with RelatedObjectsCache(storage=COLUMNAR_STORAGE, eviction=eviction) as cache:
+            cache.load_graph(Alpha.objects.order_by('pk'))
+
+            store = cache.cache['core.Charlie']
+            self.assertEqual(len(store), 2)
+            self.assertEqual(store.row_count, 2)
+            self.assertEqual(
+                sorted(c.pk for c in store.values()),
+                sorted(Charlie.objects.values_list('pk', flat=True))[-2:],
+            )
+
+            # the rows left are still found through their indexes:
+            for charlie in store.values():
+                rows = store.index('bravo_id')[charlie.bravo_id]
+                self.assertIn(charlie, [store.instance(row) for row in rows])
+
+
+class StreamingTests(GraphTestCase):
+
+    def test_querysets_are_cached_chunk_by_chunk(self):
+        with RelatedObjectsCache() as cache:
+            with patch.object(RelatedObjectsCache, '_link_new_instances', autospec=True) as link:
+                cache.cache_results(Charlie.objects.all(), chunk_size=5)
+
+            self.assertEqual(link.call_count, 3)
+            self.assertEqual(len(cache.cache['core.Charlie']), 12)
+
+    def test_graphs_are_loaded_chunk_by_chunk(self):
+        with RelatedObjectsCache() as cache:
+            chunks = list(cache.iter_graph(Alpha.objects.order_by('pk'), chunk_size=2))
+
+            self.assertEqual([[a.number for a in chunk] for chunk in chunks], [[0, 1], [2]])
+            with self.assertNumQueries(0):
+                self.assertEqual(chunks[1][0].delta.foxtrot.number, 2)
+
+
+class SnapshotTests(GraphTestCase):
+
+    def test_snapshots_are_loaded_without_queries(self):
+        pk = Alpha.objects.order_by('pk')[0].pk
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.snapshot')
+
+            with RelatedObjectsCache() as cache:
+                cache.load_graph(Alpha.objects.all())
+                cache.dump(path)
+
+            for options in ({'storage': INSTANCE_STORAGE}, {'storage': COLUMNAR_STORAGE}):
+                with self.subTest(**options), queries_disabled(), RelatedObjectsCache(**options) as cache:
+                    header = cache.load(path)
+
+                    self.assertEqual({m['label']: m['rows'] for m in header['models']}['core.Charlie'], 12)
+                    self.assert_linked(cache.cache['core.Alpha'][pk])
+
+
+    def test_graphs_with_empty_relationships_are_dumped(self):
+        alpha = Alpha.objects.create(number=5)
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.snapshot')
+
+            for options in ({'storage': INSTANCE_STORAGE}, {'storage': COLUMNAR_STORAGE}):
+                with self.subTest(**options):
+                    with RelatedObjectsCache(**options) as cache:
+                        cache.load_graph(Alpha.objects.filter(pk=alpha.pk))
+                        cache.dump(path)
+
+                    with queries_disabled(), RelatedObjectsCache(**options) as cache:
+                        header = cache.load(path)
+
+                        self.assertEqual([m['label'] for m in header['models']], ['core.Alpha'])
+                        self.assertEqual(cache.cache['core.Alpha'][alpha.pk].number, 5)
+
+    def test_columns_are_written_without_pickle(self):
+        User.objects.create(username='u', last_login=timezone.now())
+        users = list(User.objects.all())
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.snapshot')
+
+            with RelatedObjectsCache() as cache:
+                cache.cache_results(users)
+                cache.dump(path)
+
+            with open(path, 'rb') as f:
+                self.assertNotIn(b'pickle', f.read())
+
+            with queries_disabled(), RelatedObjectsCache() as cache:
+                cache.load(path)
+
+                for user in users:
+                    cached_user = cache.cache['users.User'][user.pk]
+                    self.assertEqual(cached_user.username, user.username)
+                    self.assertEqual(cached_user.last_login, user.last_login)
+                    self.assertEqual(cached_user.date_joined, user.date_joined)
+
+    def test_values_json_cant_hold_are_read_back_by_their_field(self):
+        for field, value in (
+            (models.DateField(), datetime.date(2024, 2, 29)),
+            (models.TimeField(), datetime.time(12, 30, 1, 5)),
+            (models.DurationField(), datetime.timedelta(days=1, seconds=5)),
+            (models.DecimalField(max_digits=5, decimal_places=2), Decimal('-1.25')),
+            (models.UUIDField(), uuid.uuid4()),
+            (models.BinaryField(), b'\x00\xff'),
+        ):
+            with self.subTest(field=type(field).__name__):
+                self.assertEqual(field.to_python(encode_value(value)), value)
+
+        with self.assertRaises(TypeError):
+            encode_value(object())
+
+
+class DeferredFieldTests(GraphTestCase):
+
+    def test_deferred_fields_load_under_queries_disabled(self):
+        for options in ({'storage': INSTANCE_STORAGE}, {'storage': COLUMNAR_STORAGE}):
+            with self.subTest(**options), queries_disabled(), RelatedObjectsCache(**options) as cache:
+                alphas = cache.load_graph(Alpha.objects.order_by('pk'), fields={})
+
+                self.assertEqual([a.number for a in alphas], [0, 1, 2])
+                self.assertEqual(cache.get_stats()['models']['core.Alpha']['deferred_loads'], 1)
+
+
+class RecordingTests(GraphTestCase):
+
+    def test_recording_under_queries_disabled(self):
+        expected = self.expected_values()
+
+        with queries_disabled(), RelatedObjectsCache(record=True) as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+            self.assertEqual([a.value() for a in alphas], expected)
+
+        plan = cache.get_load_plan()
+        self.assertEqual(plan.relationships[Alpha], {'bravos'})
+        self.assertEqual(plan.fields[Charlie], {'number'})
+
+        # the recorded plan loads everything that was read:
+        with queries_disabled(), RelatedObjectsCache(load_plan=LoadPlan.from_json(plan.to_json())) as cache:
+            alphas = cache.load_graph(Alpha.objects.order_by('pk'))
+            self.assertEqual([a.value() for a in alphas], expected)
+
+
+class QuerySetTests(GraphTestCase):
+
+    def get_queryset(self) -> CacheRelatedQuerySet:
+        return CacheRelatedQuerySet(Alpha).order_by('pk')
+
+    def test_cache_related_loads_the_graph_on_evaluation(self):
+        expected = self.expected_values()
+        queryset = self.get_queryset().filter(number__gte=1).cache_related()
+
+        with self.assertNumQueries(7):
+            alphas = list(queryset)
+
+        with self.assertNumQueries(0):
+            self.assertEqual([a.value() for a in alphas], expected[1:])
+
+        with RelatedObjectsCache() as cache:
+            list(self.get_queryset().cache_related(include=[Bravo]))
+            self.assertEqual(set(cache.cache), {'core.Alpha', 'core.Bravo'})
+
+    def test_cache_related_iterator(self):
+        expected = self.expected_values()
+
+        # (the alphas are read with one query, in chunks of 2)
+        with self.assertNumQueries(1 + 6 * 2):
+            alphas = list(self.get_queryset().cache_related().iterator(chunk_size=2))
+
+        with self.assertNumQueries(0):
+            self.assertEqual([a.value() for a in alphas], expected)
+
+    def test_cache_related_after_values(self):
+        with self.assertRaises(TypeError):
+            self.get_queryset().values('pk').cache_related()
+
+
+class BenchmarkTests(TestCase):
+
+    def test_every_strategy_reads_the_same_graph(self):
+        out = StringIO()
+        call_command('benchmark_cache_related', scale=[2], repeat=1, stdout=out)
+
+        strategies = json.loads(out.getvalue())[0]['results']
+        self.assertTrue(all(s['matches'] for s in strategies))
+        self.assertEqual(
+            {s['strategy']: s['queries'] for s in strategies if s['strategy'] != 'naive'},
+            {'prefetch': 7, 'cache_results': 7, 'load_graph': 7, 'batched_misses': 7},
+        )
+
+    def test_repeat_must_be_at_least_one(self):
+        with self.assertRaisesMessage(CommandError, '--repeat must be at least 1.'):
+            call_command('benchmark_cache_related', scale=[2], repeat=0, stdout=StringIO())
@@ -7,3 +7,6 @@ admin.site.register(models.Charlie)
 admin.site.register(models.Delta)
 admin.site.register(models.Echo)
 admin.site.register(models.Foxtrot)
+admin.site.register(models.Place)
+admin.site.register(models.Restaurant)
+admin.site.register(models.Note)
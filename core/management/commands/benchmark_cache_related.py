@@ -0,0 +1,262 @@
+import gc
+import json
+import tracemalloc
+from time import perf_counter
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from cache_related.cache_related import BATCH_MISSES, RelatedObjectsCache
+from core.models import Alpha, Bravo, Charlie, Delta, Echo, Foxtrot
+
+
+STRATEGIES = ("naive", "prefetch", "cache_results", "load_graph", "batched_misses")
+
+
+def generate(scale, fanout, database=DEFAULT_DB_ALIAS, batch_size=1000):
+    """
+    Create `scale` alphas, each with `fanout` bravos, `fanout` charlies per
+    bravo, and a delta (on the alpha's first charlie) with a foxtrot and
+    `fanout` echoes. Returns the number of rows created per model.
+    """
+
+    alphas, bravos, charlies, deltas, echoes, foxtrots = [], [], [], [], [], []
+
+    for a in range(1, scale + 1):
+        alphas.append(Alpha(id=a, number=a))
+
+        for b in range(fanout):
+            bravo_id = len(bravos) + 1
+            bravos.append(Bravo(id=bravo_id, alpha_id=a, number=b))
+
+            for c in range(fanout):
+                charlies.append(Charlie(id=len(charlies) + 1, bravo_id=bravo_id, number=c))
+
+        delta_id = len(deltas) + 1
+        first_charlie_id = (a - 1) * fanout * fanout + 1
+        deltas.append(Delta(id=delta_id, alpha_id=a, charlie_id=first_charlie_id, number=a))
+        foxtrots.append(Foxtrot(id=delta_id, delta_id=delta_id, number=a))
+
+        for e in range(fanout):
+            echoes.append(Echo(id=len(echoes) + 1, delta_id=delta_id, number=e))
+
+    rows = {}
+    for model, instances in (
+        (Alpha, alphas),
+        (Bravo, bravos),
+        (Charlie, charlies),
+        (Delta, deltas),
+        (Echo, echoes),
+        (Foxtrot, foxtrots),
+    ):
+        model.objects.using(database).bulk_create(instances, batch_size=batch_size)
+        rows[model.__name__] = len(instances)
+
+    return rows
+
+
+def walk(alphas):
+    """
+    Read every relationship of the graph, the way a page rendering it
+    would, and return the sum of every number reached
+    """
+
+    total = 0
+
+    for alpha in alphas:
+        total += alpha.number
+
+        try:
+            total += alpha.delta.number
+        except ObjectDoesNotExist:
+            pass
+
+        for bravo in alpha.bravos.all():
+            total += bravo.number
+
+            for charlie in bravo.charlies.all():
+                total += charlie.number
+
+                try:
+                    delta = charlie.delta
+                except ObjectDoesNotExist:
+                    continue
+
+                total += delta.number + delta.foxtrot.number
+                total += sum(echo.number for echo in delta.echoes.all())
+
+    return total
+
+
+def prefetched_alphas(database):
+    return Alpha.objects.using(database).select_related("delta__foxtrot").prefetch_related(
+        "delta__echoes",
+        "bravos__charlies__delta__foxtrot",
+        "bravos__charlies__delta__echoes",
+    )
+
+
+def run_naive(cache, database):
+    return walk(list(Alpha.objects.using(database)))
+
+
+def run_prefetch(cache, database):
+    return walk(list(prefetched_alphas(database)))
+
+
+def run_cache_results(cache, database):
+    alphas = list(prefetched_alphas(database))
+    cache.cache_results(*alphas)
+    return walk(alphas)
+
+
+def run_load_graph(cache, database):
+    return walk(cache.load_graph(Alpha.objects.using(database)))
+
+
+RUNNERS = {
+    "naive": run_naive,
+    "prefetch": run_prefetch,
+    "cache_results": run_cache_results,
+    "load_graph": run_load_graph,
+    "batched_misses": run_load_graph,
+}
+
+CACHE_OPTIONS = {
+    "batched_misses": {"miss_policy": BATCH_MISSES},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark RelatedObjectsCache against plain Django on generated "
+        "core.models data, and print the results as JSON. The data is "
+        "created in a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=int,
+            nargs="+",
+            default=[100],
+            help="Number of alphas to generate (several values run one benchmark each).",
+        )
+        parser.add_argument(
+            "--fanout",
+            type=int,
+            default=3,
+            help="Bravos per alpha, charlies per bravo and echoes per delta.",
+        )
+        parser.add_argument(
+            "--strategy",
+            choices=STRATEGIES,
+            nargs="+",
+            default=list(STRATEGIES),
+            help="Strategies to time.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Timed runs per strategy; the fastest is reported.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--output", help="Write the JSON to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        # (the fastest of no runs can't be reported)
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        results = [
+            self.benchmark(scale, options["fanout"], options["strategy"], options["repeat"], options["database"])
+            for scale in options["scale"]
+        ]
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def benchmark(self, scale, fanout, strategies, repeat, database):
+        with transaction.atomic(using=database):
+            Alpha.objects.using(database).delete()
+            rows = generate(scale, fanout, database)
+
+            expected = None
+            results = []
+            for strategy in strategies:
+                result = self.measure(strategy, repeat, database)
+
+                if expected is None:
+                    expected = result["total"]
+                result["matches"] = result.pop("total") == expected
+
+                results.append(result)
+
+            transaction.set_rollback(True, using=database)
+
+        return {
+            "scale": scale,
+            "fanout": fanout,
+            "rows": rows,
+            "results": results,
+        }
+
+    def measure(self, strategy, repeat, database):
+        """
+        Time `strategy` `repeat` times, then run it once more with
+        tracemalloc to find its peak memory (kept apart from the timed
+        runs, since tracing slows everything down)
+        """
+
+        run = RUNNERS[strategy]
+        cache_options = CACHE_OPTIONS.get(strategy, {})
+        connection = connections[database]
+
+        wall_times = []
+        for _ in range(repeat):
+            queries = QueryCounter()
+            gc.collect()
+
+            with connection.execute_wrapper(queries), RelatedObjectsCache(**cache_options) as cache:
+                started = perf_counter()
+                total = run(cache, database)
+                wall_times.append(perf_counter() - started)
+
+                link_timings = {
+                    relationship: stats["link_time"]
+                    for relationship, stats in cache.get_stats()["relationships"].items()
+                    if stats["link_time"]
+                }
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with RelatedObjectsCache(**cache_options) as cache:
+                run(cache, database)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "strategy": strategy,
+            "queries": queries.count,
+            "wall_time": min(wall_times),
+            "peak_memory": peak_memory,
+            "link_time": link_timings,
+            "total": total,
+        }
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_place_note'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Restaurant',
+            fields=[
+                ('place_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='core.place')),
+                ('serves_pizza', models.BooleanField(default=False)),
+            ],
+            bases=('core.place',),
+        ),
+        migrations.CreateModel(
+            name='PlaceProxy',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.place',),
+        ),
+    ]
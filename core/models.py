@@ -1,3 +1,5 @@
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from zen_queries import QueriesDisabledError
 
@@ -40,6 +42,8 @@ class Charlie(models.Model):
     def value(self):
         try:
             return self.number + self.delta.value()
+        except Charlie.delta.RelatedObjectDoesNotExist:
+            return self.number
         except QueriesDisabledError as e:
             return 0
 
@@ -95,3 +99,37 @@ class Foxtrot(models.Model):
 
     def __str__(self):
         return f"{self.number}"
+
+
+class Place(models.Model):
+    name = models.CharField(max_length=50)
+
+    notes = GenericRelation("Note")
+
+    def __str__(self):
+        return self.name
+
+
+class Restaurant(Place):
+    serves_pizza = models.BooleanField(default=False)
+
+
+class PlaceProxy(Place):
+    class Meta:
+        proxy = True
+
+
+class Note(models.Model):
+    content_type: ContentType = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+    )
+
+    object_id = models.PositiveIntegerField()
+
+    target = GenericForeignKey("content_type", "object_id")
+
+    text = models.CharField(max_length=50)
+
+    def __str__(self):
+        return self.text
@@ -1,35 +1,16 @@
-from zen_queries import (
-    queries_disabled,
-    queries_dangerously_enabled,
-)
+from zen_queries import queries_disabled
 
 from cache_related.cache_related import RelatedObjectsCache
 
 
 @queries_disabled()
 def main():
-    from django.db.models import Prefetch
-    from core.models import Alpha, Bravo, Charlie, Delta, Echo, Foxtrot
+    from core.models import Alpha
 
     with RelatedObjectsCache() as related_objects_cache:
         related_objects_cache: RelatedObjectsCache
 
-        with queries_dangerously_enabled():
-            a = list(Alpha.objects.all())
-            b = list(Bravo.objects.all())
-            c = list(Charlie.objects.all())
-            d = list(Delta.objects.all())
-            e = list(Echo.objects.all())
-            f = list(Foxtrot.objects.all())
-
-        related_objects_cache.cache_results(
-            *f,
-            *e,
-            *d,
-            *c,
-            *b,
-            *a,
-        )
+        a = related_objects_cache.load_graph(Alpha.objects.all())
 
         y = [x.value() for x in a]
 
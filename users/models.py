@@ -1,4 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.db import models
 
 class User(AbstractUser):
-    pass
\ No newline at end of file
+    pass
+
+class Place(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="places")
+    name = models.CharField(max_length=50)